@@ -0,0 +1,103 @@
+# asgi_server.py
+"""Servidor ASGI alternativo para os mesmos webhooks do webhook_server (Flask).
+
+Um único processo assíncrono atende as rajadas de eventos do Chatwoot: eventos irrelevantes
+são descartados no próprio event loop, sem parse do JSON; os demais vão para uma thread só
+para a gravação na fila do SQLite. Para usar:
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 5000
+"""
+import json
+import time
+import asyncio
+import config
+import metrics
+import webhook_handlers
+
+metrics.set_process_name("webhook-asgi", per_pid=True)
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+METRICS_HEADERS = [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")]
+
+async def read_body(receive, max_bytes):
+    """Lê o corpo da requisição; retorna None se ultrapassar max_bytes."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def chatwoot_webhook(body, headers):
+    # Filtro rápido no event loop: a maior parte das rajadas do Chatwoot termina aqui.
+    if not webhook_handlers.is_relevant_chatwoot_event(body):
+        return {'status': 'ignored'}, 200
+    return await asyncio.to_thread(
+        webhook_handlers.chatwoot_webhook, body,
+        headers.get(webhook_handlers.SIGNATURE_HEADER.lower()),
+        headers.get(webhook_handlers.TIMESTAMP_HEADER.lower())
+    )
+
+async def meli_notifications(body, headers):
+    return await asyncio.to_thread(webhook_handlers.meli_notification, body)
+
+async def metrics_endpoint(body, headers):
+    return await asyncio.to_thread(metrics.render), 200
+
+ROUTES = {
+    ("POST", "/webhook"): chatwoot_webhook,
+    ("POST", "/meli/notifications"): meli_notifications,
+    ("GET", "/metrics"): metrics_endpoint,
+}
+
+async def send_response(send, status, body, headers):
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await asyncio.to_thread(webhook_handlers.startup)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(metrics.push, True)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    """Aplicação ASGI com as rotas /webhook, /meli/notifications e /metrics."""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    started = time.perf_counter()
+    route = scope["path"]
+    handler = ROUTES.get((scope["method"], route))
+    if handler is None:
+        route = 'unmatched'
+        response, status = {'status': 'not_found'}, 404
+    else:
+        body = await read_body(receive, config.WEBHOOK_MAX_BODY_BYTES)
+        if body is None:
+            response, status = {'status': 'payload_too_large'}, 413
+        else:
+            headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope["headers"]}
+            response, status = await handler(body, headers)
+
+    if isinstance(response, str):
+        await send_response(send, status, response.encode('utf-8'), METRICS_HEADERS)
+    else:
+        await send_response(send, status, json.dumps(response).encode('utf-8'), JSON_HEADERS)
+
+    metrics.observe("webhook_request_seconds", time.perf_counter() - started, route=route, status=status)
+    if time.time() - metrics.last_push() >= config.METRICS_PUSH_SECONDS:
+        # A gravação do snapshot toca o SQLite; fica fora do event loop.
+        asyncio.get_running_loop().run_in_executor(None, metrics.push)
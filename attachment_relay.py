@@ -0,0 +1,163 @@
+# attachment_relay.py
+import io
+import os
+import uuid
+import tempfile
+import contextlib
+import config
+
+CHUNK_SIZE = 64 * 1024
+
+class AttachmentTooLarge(Exception):
+    """O anexo ultrapassa ATTACHMENT_MAX_BYTES e não será repassado."""
+
+def _spool(response, max_bytes):
+    """Copia o corpo de uma resposta (stream=True) para um arquivo temporário, em blocos.
+
+    Até ATTACHMENT_SPOOL_MEMORY_BYTES o conteúdo fica em memória; acima disso vai para o disco.
+    Retorna (arquivo posicionado no início, tamanho em bytes).
+    """
+    declared = response.headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise AttachmentTooLarge(f"anexo de {declared} bytes excede o limite de {max_bytes}")
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=config.ATTACHMENT_SPOOL_MEMORY_BYTES)
+    size = 0
+    try:
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise AttachmentTooLarge(f"anexo excede o limite de {max_bytes} bytes")
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, size
+
+def fetch(client, url, headers=None, params=None, max_bytes=None):
+    """Baixa um anexo em streaming para um arquivo temporário. Retorna (arquivo, tamanho, content_type).
+
+    Erros HTTP (ex.: 401) são levantados aqui, antes de existir qualquer arquivo a descartar.
+    """
+    response = client.get(url, headers=headers, params=params, stream=True, timeout=45)
+    return spool_response(response, max_bytes)
+
+def spool_response(response, max_bytes=None):
+    """Como fetch(), para uma resposta já aberta com stream=True (que é sempre fechada aqui)."""
+    max_bytes = max_bytes or config.ATTACHMENT_MAX_BYTES
+    try:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', 'application/octet-stream')
+        spooled, size = _spool(response, max_bytes)
+    finally:
+        response.close()
+    return spooled, size, content_type
+
+@contextlib.contextmanager
+def opened(fetched):
+    """Entrega o resultado de fetch() em um bloco 'with', descartando o arquivo temporário ao sair."""
+    try:
+        yield fetched
+    finally:
+        fetched[0].close()
+
+@contextlib.contextmanager
+def download(client, url, headers=None, params=None, max_bytes=None):
+    """Baixa um anexo em streaming e entrega (arquivo, tamanho, content_type).
+
+    O arquivo temporário é descartado ao sair do bloco 'with'.
+    """
+    with opened(fetch(client, url, headers=headers, params=params, max_bytes=max_bytes)) as fetched:
+        yield fetched
+
+def _file_size(fileobj):
+    position = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell() - position
+    fileobj.seek(position)
+    return size
+
+class MultipartStream:
+    """Corpo multipart/form-data lido sob demanda, sem carregar o arquivo na memória.
+
+    Aceita campos de texto e um único arquivo (bytes ou objeto com read/seek). Expõe
+    __len__ para que o requests envie Content-Length em vez de chunked, e seek(0) para
+    que o http_client possa reenviar o corpo em uma nova tentativa.
+    """
+
+    def __init__(self, fields, file_field, filename, fileobj, content_type='application/octet-stream'):
+        if isinstance(fileobj, (bytes, bytearray)):
+            fileobj = io.BytesIO(fileobj)
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._file = fileobj
+        self._file_start = fileobj.tell()
+        self._file_size = _file_size(fileobj)
+        safe_filename = str(filename).replace('"', '%22').replace('\r', '').replace('\n', '')
+
+        head = b""
+        for name, value in fields.items():
+            if value is None:
+                continue
+            head += (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode('utf-8')
+        head += (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{safe_filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode('utf-8')
+        self._head = head
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode('utf-8')
+        self._length = len(self._head) + self._file_size + len(self._tail)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset != 0 or whence != os.SEEK_SET:
+            raise ValueError("MultipartStream só pode ser rebobinado para o início.")
+        self._position = 0
+        self._segment = 0
+        self._segment_offset = 0
+        self._file.seek(self._file_start)
+        return 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        out = bytearray()
+        while len(out) < size and self._segment < 3:
+            wanted = size - len(out)
+            if self._segment == 1:
+                data = self._file.read(min(wanted, self._file_size - self._segment_offset))
+            else:
+                source = self._head if self._segment == 0 else self._tail
+                data = source[self._segment_offset:self._segment_offset + wanted]
+            if not data:
+                self._segment += 1
+                self._segment_offset = 0
+                continue
+            self._segment_offset += len(data)
+            out += data
+        self._position += len(out)
+        return bytes(out)
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+def multipart_body(headers, fields, file_field, filename, fileobj, content_type=None):
+    """Retorna os kwargs (headers + data) de um POST multipart transmitido em streaming."""
+    stream = MultipartStream(fields, file_field, filename, fileobj, content_type or 'application/octet-stream')
+    return {"headers": dict(headers, **{"Content-Type": stream.content_type}), "data": stream}
@@ -0,0 +1,161 @@
+# benchmarks/bench_webhook_servers.py
+"""Compara o webhook Flask sob gunicorn com o servidor ASGI (asgi_server.py) sob uvicorn.
+
+Sobe cada servidor como subprocesso, com um banco SQLite temporário, e dispara uma rajada
+de eventos do Chatwoot assinados com HMAC (a maior parte irrelevante, como nas horas de pico).
+Exemplo:
+
+    python benchmarks/bench_webhook_servers.py --events 20000 --concurrency 64 --relevant-ratio 0.2
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run_benchmark import percentile
+
+SECRET = "bench-webhook-secret"
+SERVERS = {
+    "gunicorn": lambda port, workers: [sys.executable, "-m", "gunicorn", "--workers", str(workers),
+                                       "--bind", f"127.0.0.1:{port}", "webhook_server:app"],
+    "uvicorn": lambda port, workers: [sys.executable, "-m", "uvicorn", "asgi_server:app", "--no-access-log",
+                                      "--host", "127.0.0.1", "--port", str(port)],
+}
+IRRELEVANT_EVENTS = (
+    {"event": "message_updated", "message_type": "outgoing"},
+    {"event": "message_created", "message_type": "incoming"},
+    {"event": "conversation_status_changed"},
+    {"event": "conversation_updated"},
+)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_listening(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"servidor não respondeu na porta {port}")
+
+def build_events(count, relevant_ratio, seed=42):
+    """Gera (corpo, cabeçalhos) já assinados, para que a assinatura não pese no cliente."""
+    rng = random.Random(seed)
+    padding = "x" * 2000  # o Chatwoot envia conversa, contato e inbox inteiros em cada evento
+    events = []
+    for i in range(count):
+        if rng.random() < relevant_ratio:
+            event = {"event": "message_created", "message_type": "outgoing", "id": 70_000_000 + i,
+                     "content": f"Resposta {i}",
+                     # Algumas centenas de packs distintos, repetidos ao longo da rajada.
+                     "conversation": {"custom_attributes": {"meli_pack_id": str(20_000_000 + i % 500)}}}
+        else:
+            event = dict(rng.choice(IRRELEVANT_EVENTS), id=70_000_000 + i, content=f"Evento {i}")
+        event["sender"] = {"name": "Agente", "bio": padding}
+        body = json.dumps(event).encode("utf-8")
+        timestamp = str(int(time.time()))
+        signature = hmac.new(SECRET.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+        headers = {"Content-Type": "application/json", "X-Chatwoot-Signature": f"sha256={signature}",
+                   "X-Chatwoot-Timestamp": timestamp}
+        events.append((body, headers))
+    return events
+
+def fire(port, events, concurrency):
+    """Envia os eventos com 'concurrency' conexões keep-alive. Retorna (tempo, latências, status)."""
+    samples, statuses, lock = [], Counter(), threading.Lock()
+    cursor = iter(range(len(events)))
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local_samples, local_statuses = [], Counter()
+        for index in cursor:
+            body, headers = events[index]
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/webhook", body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                local_statuses[response.status] += 1
+            except (OSError, http.client.HTTPException):
+                local_statuses["error"] += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            local_samples.append(time.perf_counter() - t0)
+        conn.close()
+        with lock:
+            samples.extend(local_samples)
+            statuses.update(local_statuses)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, samples, statuses
+
+def run_server(name, args, events):
+    port = free_port()
+    db_dir = tempfile.mkdtemp(prefix=f"meli-webhook-{name}-")
+    env = dict(os.environ, MELI_DB_FILE=os.path.join(db_dir, "bench.db"), CHATWOOT_WEBHOOK_SECRET=SECRET,
+               MELI_ACCESS_TOKEN="APP_USR-bench", MELI_REFRESH_TOKEN="TG-bench")
+    process = subprocess.Popen(SERVERS[name](port, args.workers), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_listening(port)
+        fire(port, events[:min(200, len(events))], args.concurrency)  # aquecimento
+        elapsed, samples, statuses = fire(port, events, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    result = {
+        "server": name,
+        "events": len(events),
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(len(events) / elapsed, 1),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "status_codes": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+    print(f"\n=== {name} ===")
+    print(f"eventos={result['events']} tempo={result['seconds']}s vazão={result['throughput_per_s']}/s "
+          f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms status={result['status_codes']}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do webhook: gunicorn (Flask) x uvicorn (ASGI).")
+    parser.add_argument("--servers", default=",".join(SERVERS))
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32, help="conexões simultâneas do cliente")
+    parser.add_argument("--relevant-ratio", type=float, default=0.2, help="fração de respostas de agentes na rajada")
+    parser.add_argument("--workers", type=int, default=3, help="workers do gunicorn (como no supervisord.conf)")
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    events = build_events(args.events, args.relevant_ratio)
+    results = [run_server(name, args, events) for name in args.servers.split(",") if name]
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nResultado gravado em {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+# benchmarks/fake_redis.py
+"""Servidor local que fala o protocolo do Redis (RESP2), com os comandos usados pelo redis_store.
+
+Serve para rodar a integração com STATE_BACKEND=redis sem um Redis de verdade: strings com
+validade, hashes, sorted sets, SCAN e transações WATCH/MULTI/EXEC. Todo comando roda sob
+um único lock, então as operações são atômicas como no Redis. Conta os comandos recebidos
+para que os benchmarks comparem os backends. Para subir avulso:
+
+    python benchmarks/fake_redis.py --port 6379
+"""
+import re
+import time
+import argparse
+import threading
+import socketserver
+from collections import Counter
+
+class Simple(str):
+    """Resposta em 'simple string' (+OK, +QUEUED)."""
+
+class CommandError(Exception):
+    """Erro devolvido ao cliente como '-<mensagem>' (a mensagem começa pelo tipo, ex.: 'ERR')."""
+
+OK, QUEUED = Simple("OK"), Simple("QUEUED")
+# Comandos de controle que não contam como operações de estado
+CONTROL_COMMANDS = {"PING", "CLIENT", "SELECT", "WATCH", "UNWATCH", "MULTI", "EXEC", "DISCARD", "ECHO"}
+
+def _glob_to_regex(pattern):
+    """Converte um padrão de MATCH do Redis (com escapes '\\') em expressão regular."""
+    out, i = [], 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 1
+        elif c == "*":
+            out.append(".*")
+        elif c == "?":
+            out.append(".")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                out.append("[" + pattern[i + 1:end].replace("\\", "\\\\") + "]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile("".join(out) + r"\Z", re.S)
+
+def _score_bound(value):
+    """Interpreta um limite de ZRANGEBYSCORE ('-inf', '+inf', '(10', '10')."""
+    exclusive = value.startswith("(")
+    value = value[1:] if exclusive else value
+    return float(value.replace("+inf", "inf")), exclusive
+
+def _in_range(score, low, high):
+    (lo, lo_ex), (hi, hi_ex) = low, high
+    return (score > lo if lo_ex else score >= lo) and (score < hi if hi_ex else score <= hi)
+
+def _format_score(score):
+    return repr(float(score)) if score != int(score) else str(int(score))
+
+class FakeRedisStore:
+    """Os dados do servidor: chave -> str | dict (hash) | ZSet."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}
+        self.versions = Counter()
+        self.commands = Counter()
+
+    # --- Auxiliares ---
+    def alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+            self.versions[key] += 1
+        return key in self.data
+
+    def get(self, key, kind):
+        if not self.alive(key):
+            return None
+        value = self.data[key]
+        if not isinstance(value, kind):
+            raise CommandError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def touch(self, key):
+        self.versions[key] += 1
+
+    def ensure(self, key, kind):
+        value = self.get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    def drop_if_empty(self, key):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+            self.expires.pop(key, None)
+
+    def execute(self, args):
+        name = args[0].upper()
+        handler = COMMANDS.get(name)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{args[0]}'")
+        if name not in CONTROL_COMMANDS:
+            self.commands[name] += 1
+        with self.lock:
+            return handler(self, args[1:])
+
+    @property
+    def total_commands(self):
+        return sum(self.commands.values())
+
+class ZSet(dict):
+    """Sorted set: membro -> score."""
+
+    def ordered(self):
+        return sorted(self.items(), key=lambda item: (item[1], item[0]))
+
+# --- Strings ---
+def cmd_ping(store, args):
+    return Simple("PONG") if not args else args[0]
+
+def cmd_ok(store, args):
+    return OK
+
+def cmd_get(store, args):
+    return store.get(args[0], str)
+
+def cmd_set(store, args):
+    key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+    ttl = None
+    for flag, scale in (("EX", 1.0), ("PX", 0.001)):
+        if flag in options:
+            ttl = float(args[2 + options.index(flag) + 1]) * scale
+    exists = store.alive(key)
+    if ("NX" in options and exists) or ("XX" in options and not exists):
+        return None
+    store.data[key] = value
+    if ttl is not None:
+        store.expires[key] = time.time() + ttl
+    elif "KEEPTTL" not in options:
+        store.expires.pop(key, None)
+    store.touch(key)
+    return OK
+
+def cmd_mget(store, args):
+    return [store.get(key, str) for key in args]
+
+def cmd_incrby(store, args):
+    value = int(store.get(args[0], str) or 0) + (int(args[1]) if len(args) > 1 else 1)
+    store.data[args[0]] = str(value)
+    store.touch(args[0])
+    return value
+
+def cmd_del(store, args):
+    deleted = 0
+    for key in args:
+        if store.alive(key):
+            del store.data[key]
+            store.expires.pop(key, None)
+            store.touch(key)
+            deleted += 1
+    return deleted
+
+def cmd_exists(store, args):
+    return sum(1 for key in args if store.alive(key))
+
+def cmd_scan(store, args):
+    options = {args[i].upper(): args[i + 1] for i in range(1, len(args) - 1, 2)}
+    pattern = _glob_to_regex(options.get("MATCH", "*"))
+    # Uma única página: o cursor devolvido é sempre 0.
+    return ["0", [key for key in list(store.data) if store.alive(key) and pattern.match(key)]]
+
+def cmd_flushdb(store, args):
+    for key in list(store.data):
+        store.touch(key)
+    store.data.clear()
+    store.expires.clear()
+    return OK
+
+def cmd_dbsize(store, args):
+    return sum(1 for key in list(store.data) if store.alive(key))
+
+# --- Hashes ---
+def cmd_hget(store, args):
+    return (store.get(args[0], dict) or {}).get(args[1])
+
+def cmd_hmget(store, args):
+    value = store.get(args[0], dict) or {}
+    return [value.get(field) for field in args[1:]]
+
+def cmd_hset(store, args):
+    value = store.ensure(args[0], dict)
+    added = 0
+    for i in range(1, len(args) - 1, 2):
+        added += args[i] not in value
+        value[args[i]] = args[i + 1]
+    store.touch(args[0])
+    return added
+
+def cmd_hsetnx(store, args):
+    value = store.ensure(args[0], dict)
+    if args[1] in value:
+        return 0
+    value[args[1]] = args[2]
+    store.touch(args[0])
+    return 1
+
+def cmd_hdel(store, args):
+    value = store.get(args[0], dict) or {}
+    deleted = sum(1 for field in args[1:] if value.pop(field, None) is not None)
+    if deleted:
+        store.drop_if_empty(args[0])
+        store.touch(args[0])
+    return deleted
+
+def cmd_hgetall(store, args):
+    return [part for item in (store.get(args[0], dict) or {}).items() for part in item]
+
+def cmd_hscan(store, args):
+    return ["0", cmd_hgetall(store, args[:1])]
+
+def cmd_hlen(store, args):
+    return len(store.get(args[0], dict) or {})
+
+def cmd_hexists(store, args):
+    return int(args[1] in (store.get(args[0], dict) or {}))
+
+# --- Sorted sets ---
+def cmd_zadd(store, args):
+    key, i, flags = args[0], 1, set()
+    while args[i].upper() in ("NX", "XX", "CH", "GT", "LT"):
+        flags.add(args[i].upper())
+        i += 1
+    zset = store.ensure(key, ZSet)
+    added = changed = 0
+    for j in range(i, len(args) - 1, 2):
+        score, member = float(args[j]), args[j + 1]
+        exists = member in zset
+        if ("NX" in flags and exists) or ("XX" in flags and not exists):
+            continue
+        if not exists:
+            added += 1
+        elif zset[member] != score:
+            changed += 1
+        zset[member] = score
+    store.drop_if_empty(key)
+    if added or changed:
+        store.touch(key)
+    return added + changed if "CH" in flags else added
+
+def cmd_zscore(store, args):
+    score = (store.get(args[0], ZSet) or {}).get(args[1])
+    return None if score is None else _format_score(score)
+
+def cmd_zmscore(store, args):
+    zset = store.get(args[0], ZSet) or {}
+    return [None if zset.get(m) is None else _format_score(zset[m]) for m in args[1:]]
+
+def cmd_zcard(store, args):
+    return len(store.get(args[0], ZSet) or {})
+
+def _with_scores(items, with_scores):
+    if not with_scores:
+        return [member for member, _ in items]
+    return [part for member, score in items for part in (member, _format_score(score))]
+
+def cmd_zrange(store, args):
+    items = (store.get(args[0], ZSet) or ZSet()).ordered()
+    start, stop = int(args[1]), int(args[2])
+    stop = len(items) + stop if stop < 0 else stop
+    start = max(0, len(items) + start if start < 0 else start)
+    return _with_scores(items[start:stop + 1], "WITHSCORES" in (a.upper() for a in args[3:]))
+
+def cmd_zrangebyscore(store, args):
+    low, high = _score_bound(args[1]), _score_bound(args[2])
+    items = [item for item in (store.get(args[0], ZSet) or ZSet()).ordered() if _in_range(item[1], low, high)]
+    options = [a.upper() for a in args[3:]]
+    if "LIMIT" in options:
+        at = 3 + options.index("LIMIT")
+        offset, count = int(args[at + 1]), int(args[at + 2])
+        items = items[offset:] if count < 0 else items[offset:offset + count]
+    return _with_scores(items, "WITHSCORES" in options)
+
+def cmd_zrem(store, args):
+    zset = store.get(args[0], ZSet) or {}
+    removed = sum(1 for member in args[1:] if zset.pop(member, None) is not None)
+    if removed:
+        store.drop_if_empty(args[0])
+        store.touch(args[0])
+    return removed
+
+def cmd_zremrangebyscore(store, args):
+    zset = store.get(args[0], ZSet) or {}
+    low, high = _score_bound(args[1]), _score_bound(args[2])
+    members = [member for member, score in zset.items() if _in_range(score, low, high)]
+    for member in members:
+        del zset[member]
+    if members:
+        store.drop_if_empty(args[0])
+        store.touch(args[0])
+    return len(members)
+
+def cmd_zpopmin(store, args):
+    zset = store.get(args[0], ZSet)
+    if not zset:
+        return []
+    popped = zset.ordered()[:int(args[1]) if len(args) > 1 else 1]
+    for member, _ in popped:
+        del zset[member]
+    store.drop_if_empty(args[0])
+    store.touch(args[0])
+    return _with_scores(popped, True)
+
+COMMANDS = {
+    "PING": cmd_ping, "ECHO": lambda store, args: args[0], "CLIENT": cmd_ok, "SELECT": cmd_ok,
+    "GET": cmd_get, "SET": cmd_set, "MGET": cmd_mget, "INCR": cmd_incrby, "INCRBY": cmd_incrby, "DEL": cmd_del, "EXISTS": cmd_exists,
+    "SCAN": cmd_scan, "FLUSHDB": cmd_flushdb, "FLUSHALL": cmd_flushdb, "DBSIZE": cmd_dbsize,
+    "HGET": cmd_hget, "HMGET": cmd_hmget, "HSET": cmd_hset, "HSETNX": cmd_hsetnx, "HDEL": cmd_hdel,
+    "HGETALL": cmd_hgetall, "HSCAN": cmd_hscan, "HLEN": cmd_hlen, "HEXISTS": cmd_hexists,
+    "ZADD": cmd_zadd, "ZSCORE": cmd_zscore, "ZMSCORE": cmd_zmscore, "ZCARD": cmd_zcard, "ZRANGE": cmd_zrange,
+    "ZRANGEBYSCORE": cmd_zrangebyscore, "ZREM": cmd_zrem, "ZREMRANGEBYSCORE": cmd_zremrangebyscore,
+    "ZPOPMIN": cmd_zpopmin,
+}
+# Tratados pela conexão (estado da transação), não pelo FakeRedisStore
+for _name in ("WATCH", "UNWATCH", "MULTI", "EXEC", "DISCARD"):
+    COMMANDS[_name] = None
+
+def encode(value):
+    """Serializa uma resposta em RESP2."""
+    if isinstance(value, CommandError):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, Simple):
+        return f"+{value}\r\n".encode()
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool) or isinstance(value, int):
+        return f":{int(value)}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(encode(v) for v in value)
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+class _Connection(socketserver.StreamRequestHandler):
+    """Uma conexão de cliente, com o seu próprio estado de WATCH/MULTI."""
+
+    # Respostas pequenas e seguidas (MULTI/EXEC) não podem esperar o ACK do cliente.
+    disable_nagle_algorithm = True
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode("utf-8").split()  # comando inline (ex.: redis-cli, telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2].decode("utf-8"))
+        return args
+
+    def handle(self):
+        store = self.server.store
+        watched, queued = {}, None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].upper()
+            try:
+                if name == "MULTI":
+                    queued, reply = [], OK
+                elif name == "EXEC":
+                    if queued is None:
+                        raise CommandError("ERR EXEC without MULTI")
+                    with store.lock:
+                        for key in watched:
+                            store.alive(key)  # uma chave que expirou também conta como alterada
+                        if any(store.versions[key] != version for key, version in watched.items()):
+                            reply = None
+                        else:
+                            reply = []
+                            for command in queued:
+                                try:
+                                    reply.append(store.execute(command))
+                                except CommandError as e:
+                                    reply.append(e)
+                    watched, queued = {}, None
+                    self.wfile.write(b"*-1\r\n" if reply is None else encode(reply))
+                    continue
+                elif name == "DISCARD":
+                    watched, queued, reply = {}, None, OK
+                elif name == "WATCH":
+                    with store.lock:
+                        for key in args[1:]:
+                            store.alive(key)
+                            watched[key] = store.versions[key]
+                    reply = OK
+                elif name == "UNWATCH":
+                    watched, reply = {}, OK
+                elif queued is not None:
+                    if name not in COMMANDS:
+                        raise CommandError(f"ERR unknown command '{args[0]}'")
+                    queued.append(args)
+                    reply = QUEUED
+                else:
+                    reply = store.execute(args)
+            except CommandError as e:
+                reply = e
+            except (ValueError, IndexError) as e:
+                reply = CommandError(f"ERR syntax error ({e})")
+            self.wfile.write(encode(reply))
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """Servidor em thread própria (porta escolhida pelo sistema quando port=0)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Connection)
+        self.store = FakeRedisStore()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local compatível com o subconjunto do Redis usado pela integração.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = FakeRedisServer(args.host, args.port)
+    print(f"Servidor Redis de teste em {server.url}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# benchmarks/fake_upstreams.py
+"""Servidores locais que imitam os endpoints do MELI e do Chatwoot usados pela integração.
+
+Cada servidor roda em uma thread, com latência e taxa de erro configuráveis, e conta
+as chamadas recebidas por rota para que os benchmarks possam comparar versões.
+"""
+import re
+import json
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+SELLER_ID = "100"
+CHATWOOT_ACCOUNT_ID = "1"
+
+class FakeData:
+    """Massa de dados sintética compartilhada pelos dois servidores."""
+
+    def __init__(self, questions=0, packs=0, messages_per_pack=3, items=200, attachment_bytes=0, seed=42):
+        self.lock = threading.Lock()
+        rnd = random.Random(seed)
+        base_date = datetime(2026, 9, 1, tzinfo=timezone.utc)
+
+        self.items = {
+            f"MLB{i}": {"id": f"MLB{i}", "title": f"Produto {i}", "permalink": f"https://produto.example/MLB{i}"}
+            for i in range(items)
+        }
+        item_ids = list(self.items)
+
+        self.questions = {}
+        for i in range(questions):
+            qid = 10_000_000 + i
+            self.questions[qid] = {
+                "id": qid, "status": "UNANSWERED", "text": f"Pergunta {i}?",
+                "item_id": rnd.choice(item_ids), "from": {"id": 500_000 + rnd.randrange(max(questions // 3, 1))},
+                "date_created": (base_date + timedelta(seconds=i)).isoformat(timespec='milliseconds'),
+            }
+
+        self.orders = []
+        self.messages = {}
+        for p in range(packs):
+            pack_id = 20_000_000 + p
+            buyer_id = 700_000 + p
+            updated = base_date + timedelta(minutes=p)
+            self.orders.append({
+                "id": 30_000_000 + p, "pack_id": pack_id,
+                "buyer": {"id": buyer_id, "nickname": f"COMPRADOR{p}"},
+                "date_created": updated.isoformat(timespec='milliseconds'),
+                "date_last_updated": updated.isoformat(timespec='milliseconds'),
+            })
+            msgs = []
+            for m in range(messages_per_pack):
+                msg = {
+                    "id": f"msg-{pack_id}-{m}", "text": f"Mensagem {m} do pack {pack_id}",
+                    "from": {"user_id": buyer_id}, "attachments": [],
+                    "message_resources": [{"id": str(pack_id), "name": "packs"}],
+                    "message_date": {"created": (updated + timedelta(seconds=m)).isoformat(timespec='milliseconds')},
+                }
+                if attachment_bytes and m == 0:
+                    msg["attachments"] = [{"filename": f"att-{pack_id}.pdf", "original_filename": "nota.pdf"}]
+                msgs.append(msg)
+            # O MELI devolve as mensagens da mais nova para a mais antiga.
+            self.messages[str(pack_id)] = list(reversed(msgs))
+        self.attachment_bytes = attachment_bytes
+
+        # Estado do Chatwoot
+        self.contacts = {}
+        self.conversations = {}
+        self.chatwoot_messages = 0
+        self.next_id = 1
+
+    def new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantém a conexão aberta, como os servidores reais (keep-alive).
+    protocol_version = "HTTP/1.1"
+    # Sem isso, cabeçalho e corpo enviados separadamente esbarram no delayed ACK (~40ms).
+    disable_nagle_algorithm = True
+    routes = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, content_type="application/json", raw=None, headers=None):
+        payload = raw if raw is not None else json.dumps(body if body is not None else {}).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        body = self._read_body() if method == "POST" else b""
+        for route_method, pattern, name, handler in self.routes:
+            match = re.fullmatch(pattern, parsed.path)
+            if route_method == method and match:
+                server = self.server
+                server.calls[f"{method} {name}"] += 1
+                retry_after = server.over_quota()
+                if retry_after:
+                    server.calls["429 (quota)"] += 1
+                    return self._send(429, {"error": "too_many_requests"}, headers={"Retry-After": retry_after})
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.error_rate and server.random.random() < server.error_rate:
+                    return self._send(503, {"error": "fake_unavailable"})
+                return handler(self, server.data, match, query, body)
+        self.server.calls[f"{method} <unknown>"] += 1
+        return self._send(404, {"error": "not_found", "path": parsed.path})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+def _page(values, query, default_limit):
+    offset = int(query.get("offset", 0))
+    limit = int(query.get("limit", default_limit))
+    return values[offset:offset + limit], offset, limit
+
+# --- Rotas do MELI ---
+def _meli_questions_search(h, data, match, query, body):
+    with data.lock:
+        pending = [q for q in data.questions.values() if q["status"] == "UNANSWERED"]
+    if query.get("sort_order") == "desc":
+        pending.reverse()
+    page, offset, limit = _page(pending, query, h.server.page_size)
+    h._send(200, {"questions": page, "total": len(pending), "limit": limit, "offset": offset})
+
+def _meli_question(h, data, match, query, body):
+    question = data.questions.get(int(match.group(1)))
+    h._send(200, question) if question else h._send(404, {"error": "not_found"})
+
+def _meli_orders_search(h, data, match, query, body):
+    orders = list(data.orders)
+    if query.get("sort") == "date_desc":
+        orders.reverse()
+    page, offset, limit = _page(orders, query, 50)
+    h._send(200, {"results": page, "paging": {"total": len(orders), "offset": offset, "limit": limit}})
+
+def _meli_order(h, data, match, query, body):
+    for order in data.orders:
+        if str(order["id"]) == match.group(1):
+            return h._send(200, order)
+    h._send(404, {"error": "not_found"})
+
+def _meli_pack_messages(h, data, match, query, body):
+    messages = data.messages.get(match.group(1), [])
+    page, offset, limit = _page(messages, query, 10)
+    h._send(200, {"messages": page, "paging": {"total": len(messages), "offset": offset, "limit": limit}})
+
+def _meli_message(h, data, match, query, body):
+    for messages in data.messages.values():
+        for msg in messages:
+            if msg["id"] == match.group(1):
+                return h._send(200, msg)
+    h._send(404, {"error": "not_found"})
+
+def _meli_items_multiget(h, data, match, query, body):
+    ids = [i for i in query.get("ids", "").split(",") if i]
+    h._send(200, [
+        {"code": 200, "body": data.items[i]} if i in data.items else {"code": 404, "body": {"id": i}}
+        for i in ids
+    ])
+
+def _meli_item(h, data, match, query, body):
+    item = data.items.get(match.group(1))
+    h._send(200, item) if item else h._send(404, {"error": "not_found"})
+
+def _meli_answer(h, data, match, query, body):
+    question = data.questions.get(int(json.loads(body or b"{}").get("question_id", 0)))
+    if question:
+        question["status"] = "ANSWERED"
+    h._send(200, {"id": data.new_id(), "status": "ANSWERED"})
+
+def _meli_send_message(h, data, match, query, body):
+    h._send(200, {"id": f"sent-{data.new_id()}"})
+
+def _meli_upload_attachment(h, data, match, query, body):
+    h._send(200, {"id": f"upload-{data.new_id()}"})
+
+def _meli_download_attachment(h, data, match, query, body):
+    h._send(200, raw=b"%PDF" + b"0" * max(data.attachment_bytes - 4, 0), content_type="application/pdf")
+
+def _meli_oauth(h, data, match, query, body):
+    h._send(200, {"access_token": f"APP_USR-{data.new_id()}", "refresh_token": f"TG-{data.new_id()}", "expires_in": 21600})
+
+MELI_ROUTES = [
+    ("GET", r"/my/received_questions/search", "questions_search", _meli_questions_search),
+    ("GET", r"/questions/(\d+)", "question", _meli_question),
+    ("GET", r"/orders/search", "orders_search", _meli_orders_search),
+    ("GET", r"/orders/(\d+)", "order", _meli_order),
+    ("GET", r"/messaging/packs/([^/]+)/messages", "pack_messages", _meli_pack_messages),
+    ("GET", r"/messages/attachments/([^/]+)", "attachment_download", _meli_download_attachment),
+    ("GET", r"/messages/([^/]+)", "message", _meli_message),
+    ("GET", r"/items", "items_multiget", _meli_items_multiget),
+    ("GET", r"/items/([^/]+)", "item", _meli_item),
+    ("POST", r"/answers", "answer", _meli_answer),
+    ("POST", r"/messages/packs/([^/]+)/sellers/([^/]+)", "send_message", _meli_send_message),
+    ("POST", r"/messages/attachments", "attachment_upload", _meli_upload_attachment),
+    ("POST", r"/oauth/token", "oauth_token", _meli_oauth),
+]
+
+# --- Rotas do Chatwoot ---
+CW = rf"/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}"
+
+def _custom_attributes(h, body):
+    """Extrai custom_attributes de um POST JSON ou multipart."""
+    if h.headers.get("Content-Type", "").startswith("multipart/form-data"):
+        found = re.search(rb'name="custom_attributes"\r\n\r\n(.*?)\r\n', body, re.S)
+        return json.loads(found.group(1)) if found else {}
+    return json.loads(body or b"{}").get("custom_attributes") or {}
+
+def _cw_contact_search(h, data, match, query, body):
+    contact = data.contacts.get(query.get("q"))
+    h._send(200, {"meta": {"count": 1 if contact else 0}, "payload": [contact] if contact else []})
+
+def _cw_contact_create(h, data, match, query, body):
+    payload = json.loads(body or b"{}")
+    contact = {"id": data.new_id(), "identifier": payload.get("identifier"), "name": payload.get("name")}
+    with data.lock:
+        data.contacts[str(payload.get("identifier"))] = contact
+    h._send(200, {"payload": {"contact": contact}})
+
+def _cw_conversation_create(h, data, match, query, body):
+    conversation = {"id": data.new_id(), "custom_attributes": _custom_attributes(h, body)}
+    with data.lock:
+        data.conversations[conversation["id"]] = conversation
+        data.chatwoot_messages += 1
+    h._send(200, conversation)
+
+def _cw_conversation_filter(h, data, match, query, body):
+    condition = json.loads(body or b"{}")["payload"][0]
+    key, wanted = condition["attribute_key"], condition["values"][0]
+    with data.lock:
+        found = [c for c in data.conversations.values() if str(c["custom_attributes"].get(key)) == wanted]
+    h._send(200, {"meta": {"count": len(found)}, "payload": found[:1]})
+
+def _cw_message_create(h, data, match, query, body):
+    if int(match.group(1)) not in data.conversations:
+        return h._send(404, {"error": "conversation_not_found"})
+    with data.lock:
+        data.chatwoot_messages += 1
+    h._send(200, {"id": data.new_id()})
+
+def _cw_attachment_download(h, data, match, query, body):
+    h._send(200, raw=b"0" * max(data.attachment_bytes, 1), content_type="application/octet-stream")
+
+CHATWOOT_ROUTES = [
+    ("GET", rf"{CW}/contacts/search", "contacts_search", _cw_contact_search),
+    ("POST", rf"{CW}/contacts", "contacts_create", _cw_contact_create),
+    ("POST", rf"{CW}/conversations/filter", "conversations_filter", _cw_conversation_filter),
+    ("POST", rf"{CW}/conversations", "conversations_create", _cw_conversation_create),
+    ("POST", rf"{CW}/conversations/(\d+)/messages", "messages_create", _cw_message_create),
+    ("GET", r"/rails/active_storage/(.+)", "attachment_download", _cw_attachment_download),
+]
+
+class _QuotaHTTPServer(ThreadingHTTPServer):
+    """Servidor com cota de requisições por segundo (janela fixa), como as APIs reais."""
+
+    def __init__(self, address, handler, rate_limit=0):
+        super().__init__(address, handler)
+        self.rate_limit = rate_limit
+        self._window = (0, 0)
+        self._quota_lock = threading.Lock()
+
+    def over_quota(self):
+        """Retorna o Retry-After (segundos) se a cota do segundo atual acabou, senão None."""
+        if not self.rate_limit:
+            return None
+        with self._quota_lock:
+            second = int(time.time())
+            start, count = self._window
+            count = count + 1 if start == second else 1
+            self._window = (second, count)
+        return "1" if count > self.rate_limit else None
+
+class FakeServer:
+    """Servidor HTTP local em thread própria (porta escolhida pelo sistema)."""
+
+    def __init__(self, routes, data, latency_ms=0, error_rate=0.0, page_size=50, seed=42, rate_limit=0):
+        handler = type("Handler", (_Handler,), {"routes": routes})
+        self.httpd = _QuotaHTTPServer(("127.0.0.1", 0), handler, rate_limit)
+        self.httpd.daemon_threads = True
+        self.httpd.data = data
+        self.httpd.calls = Counter()
+        self.httpd.latency = latency_ms / 1000.0
+        self.httpd.error_rate = error_rate
+        self.httpd.page_size = page_size
+        self.httpd.random = random.Random(seed)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def calls(self):
+        return self.httpd.calls
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def start_fake_upstreams(data, latency_ms=0, error_rate=0.0, page_size=50, rate_limit=0):
+    """Sobe os dois servidores falsos e retorna (meli, chatwoot).
+
+    'rate_limit' é a cota de requisições por segundo de cada servidor (0 = sem cota).
+    """
+    meli = FakeServer(MELI_ROUTES, data, latency_ms, error_rate, page_size, rate_limit=rate_limit).start()
+    chatwoot = FakeServer(CHATWOOT_ROUTES, data, latency_ms, error_rate, page_size, rate_limit=rate_limit).start()
+    return meli, chatwoot
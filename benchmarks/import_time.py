@@ -0,0 +1,97 @@
+# benchmarks/import_time.py
+"""Mede o custo de importar cada ponto de entrada da integração e o de config.startup().
+
+Cada medição roda em um interpretador novo (como um worker do gunicorn recém-criado), com um
+banco SQLite temporário, e registra o tempo da importação e quantas conexões SQLite ela abriu.
+Para comparar com outra versão do código, aponte --root para outra cópia do repositório:
+
+    python benchmarks/import_time.py --runs 20
+    git worktree add /tmp/meli-base <commit> && python benchmarks/import_time.py --root /tmp/meli-base
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("webhook_server", "asgi_server", "job_worker", "main", "sellers")
+
+# Roda dentro do interpretador medido. Conta as conexões SQLite abertas durante a importação.
+PROBE = r"""
+import sys, json, time, sqlite3, importlib
+connections = []
+_connect = sqlite3.connect
+def connect(*args, **kwargs):
+    connections.append(args[0] if args else kwargs.get("database"))
+    return _connect(*args, **kwargs)
+sqlite3.connect = connect
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+import config
+startup_ms = None
+if sys.argv[2] == "startup" and hasattr(config, "startup"):
+    config.startup()
+    startup_ms = (time.perf_counter() - imported) * 1000
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": startup_ms,
+                  "connections": len(connections)}))
+"""
+
+def probe(root, module, env, startup=False):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, module, "startup" if startup else "import"],
+        cwd=root, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples, key):
+    values = sorted(s[key] for s in samples if s[key] is not None)
+    if not values:
+        return None
+    return {"median_ms": round(statistics.median(values), 2), "max_ms": round(values[-1], 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação dos processos da integração.")
+    parser.add_argument("--root", default=ROOT, help="cópia do repositório a medir (padrão: esta)")
+    parser.add_argument("--modules", default=",".join(MODULES))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+    root = os.path.abspath(args.root)
+
+    db_dir = tempfile.mkdtemp(prefix="meli-import-")
+    env = dict(os.environ, STATE_BACKEND="sqlite", MELI_DB_FILE=os.path.join(db_dir, "state.db"),
+               MELI_USER_ID="123456", MELI_ACCESS_TOKEN="APP_USR-bench", MELI_REFRESH_TOKEN="TG-bench",
+               CHATWOOT_URL="http://127.0.0.1:9", CHATWOOT_ACCOUNT_ID="1")
+
+    results = {"root": root, "modules": {}}
+    # A primeira inicialização cria o esquema; as seguintes (restart, novo worker) o encontram pronto.
+    first = probe(root, "config", env, startup=True)
+    again = [probe(root, "config", env, startup=True) for _ in range(args.runs)]
+    results["startup"] = {"first_ms": round(first["startup_ms"] or 0.0, 2), "again": summarize(again, "startup_ms")}
+
+    print(f"Código medido: {root}")
+    print(f"{'módulo':<16}{'importação (mediana)':>22}{'máx.':>10}{'conexões SQLite':>18}")
+    for module in [m for m in args.modules.split(",") if m]:
+        samples = [probe(root, module, env) for _ in range(args.runs)]
+        summary = summarize(samples, "import_ms")
+        summary["sqlite_connections"] = max(s["connections"] for s in samples)
+        results["modules"][module] = summary
+        print(f"{module:<16}{summary['median_ms']:>19.2f} ms{summary['max_ms']:>7.2f} ms{summary['sqlite_connections']:>18}")
+
+    if first["startup_ms"] is not None:
+        print(f"\nconfig.startup(): 1ª vez (cria o esquema) {results['startup']['first_ms']:.2f} ms; "
+              f"seguintes {results['startup']['again']['median_ms']:.2f} ms (mediana)")
+    else:
+        print("\nEsta versão não tem config.startup(): o banco é preparado em cada importação de 'config'.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultado gravado em {args.json}")
+
+if __name__ == "__main__":
+    main()
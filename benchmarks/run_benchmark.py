@@ -0,0 +1,233 @@
+# benchmarks/run_benchmark.py
+"""Mede o poller e o webhook contra os servidores falsos de benchmarks/fake_upstreams.py.
+
+Nenhuma chamada sai para o MELI ou para o Chatwoot reais. Exemplo:
+
+    python benchmarks/run_benchmark.py --questions 10000 --packs 2000 --latency-ms 20
+    python benchmarks/run_benchmark.py --scenarios webhook --webhook-events 5000 --json bench.json
+    python benchmarks/run_benchmark.py --state-backend redis   # estado no servidor de benchmarks/fake_redis.py
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import functools
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_upstreams
+import fake_redis
+
+SCENARIOS = ("questions", "messages", "webhook")
+
+class SqliteOpCounter:
+    """Substitui o módulo sqlite3 dentro do sqlite_store para contar os comandos executados."""
+
+    Row = sqlite3.Row
+
+    def __init__(self):
+        self.ops = 0
+
+    def _trace(self, statement):
+        if not statement.lstrip().upper().startswith("PRAGMA"):
+            self.ops += 1
+
+    def connect(self, *args, **kwargs):
+        conn = sqlite3.connect(*args, **kwargs)
+        conn.set_trace_callback(self._trace)
+        return conn
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def timed(func, samples):
+    """Envolve func registrando a duração de cada chamada em 'samples'."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+class RedisOpCounter:
+    """Conta os comandos de estado recebidos pelo servidor de benchmarks/fake_redis.py."""
+
+    def __init__(self, server):
+        self.server = server
+
+    @property
+    def ops(self):
+        return self.server.store.total_commands
+
+    @ops.setter
+    def ops(self, value):
+        self.server.store.commands.clear()
+
+def configure_environment(meli_url, chatwoot_url, db_file, client_rps=0, redis_url=None):
+    """Aponta a integração para os servidores falsos. Precisa rodar antes do primeiro acesso à configuração."""
+    os.environ.update({
+        "STATE_BACKEND": "redis" if redis_url else "sqlite",
+        "STATE_REDIS_URL": redis_url or "",
+        "MELI_API_URL": meli_url,
+        "CHATWOOT_URL": chatwoot_url,
+        "CHATWOOT_ACCOUNT_ID": fake_upstreams.CHATWOOT_ACCOUNT_ID,
+        "CHATWOOT_API_TOKEN": "bench-token",
+        # Os eventos do cenário 'webhook' são enviados sem assinatura.
+        "WEBHOOK_ALLOW_UNSIGNED": "true",
+        "CHATWOOT_QUESTIONS_INBOX_ID": "1",
+        "CHATWOOT_MESSAGES_INBOX_ID": "2",
+        "MELI_USER_ID": fake_upstreams.SELLER_ID,
+        "MELI_APP_ID": "bench-app",
+        "MELI_SECRET_KEY": "bench-secret",
+        "MELI_ACCESS_TOKEN": "APP_USR-bench",
+        "MELI_REFRESH_TOKEN": "TG-bench",
+        "MELI_DB_FILE": db_file,
+        "MELI_SYNC_INITIAL_LOOKBACK_DAYS": "3650",
+        "HTTP_BACKOFF_SECONDS": "0.01",
+        "MELI_RATE_LIMIT_PER_SECOND": str(client_rps),
+        "CHATWOOT_RATE_LIMIT_PER_SECOND": str(client_rps),
+    })
+
+def report(name, items, elapsed, samples, calls, state_ops, extra=None):
+    result = {
+        "scenario": name,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(items / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "upstream_calls": dict(sorted(calls.items())),
+        "upstream_calls_total": sum(calls.values()),
+        "state_ops": state_ops,
+        "state_ops_per_item": round(state_ops / items, 2) if items else 0.0,
+    }
+    result.update(extra or {})
+    print(f"\n=== {name} ===")
+    print(f"itens={result['items']} tempo={result['seconds']}s vazão={result['throughput_per_s']}/s "
+          f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+    print(f"chamadas externas={result['upstream_calls_total']} state_ops/item={result['state_ops_per_item']}")
+    for route, count in result["upstream_calls"].items():
+        print(f"  {route}: {count}")
+    for key, value in (extra or {}).items():
+        print(f"  {key}: {value}")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline da integração MELI-Chatwoot.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--packs", type=int, default=2000)
+    parser.add_argument("--messages-per-pack", type=int, default=3)
+    parser.add_argument("--items", type=int, default=300, help="anúncios distintos nas perguntas")
+    parser.add_argument("--attachment-bytes", type=int, default=0, help="tamanho do anexo na 1ª mensagem de cada pack (0 = sem anexos)")
+    parser.add_argument("--webhook-events", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=50, help="tamanho padrão das páginas de perguntas")
+    parser.add_argument("--upstream-rps", type=int, default=0, help="cota de requisições/s dos servidores falsos (0 = sem cota)")
+    parser.add_argument("--client-rps", type=float, default=0, help="limite de ritmo da integração por API (0 = sem limite)")
+    parser.add_argument("--state-backend", choices=("sqlite", "redis"), default="sqlite",
+                        help="backend de estado (redis usa o servidor de benchmarks/fake_redis.py)")
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+
+    data = fake_upstreams.FakeData(
+        questions=args.questions, packs=args.packs, messages_per_pack=args.messages_per_pack,
+        items=args.items, attachment_bytes=args.attachment_bytes
+    )
+    meli, chatwoot = fake_upstreams.start_fake_upstreams(
+        data, args.latency_ms, args.error_rate, args.page_size, rate_limit=args.upstream_rps
+    )
+    db_dir = tempfile.mkdtemp(prefix="meli-bench-")
+    redis_server = fake_redis.FakeRedisServer().start() if args.state_backend == "redis" else None
+    configure_environment(meli.url, chatwoot.url, os.path.join(db_dir, "bench.db"), client_rps=args.client_rps,
+                          redis_url=redis_server.url if redis_server else None)
+
+    if redis_server:
+        counter = RedisOpCounter(redis_server)
+    else:
+        import sqlite_store
+        counter = SqliteOpCounter()
+        sqlite_store.sqlite3 = counter
+    import config
+    config.startup()
+    import main as poller
+
+    def reset():
+        meli.calls.clear()
+        chatwoot.calls.clear()
+        counter.ops = 0
+
+    results = []
+    if "questions" in scenarios:
+        samples = []
+        poller.handle_question = timed(poller.handle_question, samples)
+        reset()
+        before = len(data.conversations)
+        start = time.perf_counter()
+        poller.process_questions()
+        elapsed = time.perf_counter() - start
+        created = len(data.conversations) - before
+        results.append(report("process_questions", created, elapsed, samples, meli.calls + chatwoot.calls, counter.ops,
+                              {"backlog": args.questions}))
+
+    if "messages" in scenarios:
+        samples = []
+        poller.handle_pack = timed(poller.handle_pack, samples)
+        reset()
+        before = data.chatwoot_messages
+        start = time.perf_counter()
+        poller.process_messages()
+        elapsed = time.perf_counter() - start
+        forwarded = data.chatwoot_messages - before
+        results.append(report("process_messages", forwarded, elapsed, samples, meli.calls + chatwoot.calls, counter.ops,
+                              {"packs": args.packs, "messages_per_pack": args.messages_per_pack}))
+
+    if "webhook" in scenarios:
+        import webhook_server
+        client = webhook_server.app.test_client()
+        samples, statuses = [], Counter()
+        reset()
+        start = time.perf_counter()
+        for i in range(args.webhook_events):
+            if i % 2 == 0:
+                attributes = {"meli_question_id": str(90_000_000 + i)}
+            else:
+                attributes = {"meli_pack_id": str(20_000_000 + (i % max(args.packs, 1)))}
+            event = {
+                "event": "message_created", "message_type": "outgoing", "id": 80_000_000 + i,
+                "content": f"Resposta {i}", "conversation": {"custom_attributes": attributes},
+            }
+            body = json.dumps(event)
+            t0 = time.perf_counter()
+            response = client.post("/webhook", data=body, content_type="application/json")
+            samples.append(time.perf_counter() - t0)
+            statuses[response.status_code] += 1
+        elapsed = time.perf_counter() - start
+        results.append(report("webhook", args.webhook_events, elapsed, samples, meli.calls + chatwoot.calls, counter.ops,
+                              {"status_codes": dict(statuses)}))
+
+    meli.stop()
+    chatwoot.stop()
+    if redis_server:
+        redis_server.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+        print(f"\nResultado gravado em {args.json}")
+
+if __name__ == "__main__":
+    main()
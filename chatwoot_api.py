@@ -1,105 +1,200 @@
 # chatwoot_api.py
-import requests
 import json
+from urllib.parse import urljoin, urlsplit
 import config
+import http_client
+import db_manager
+import attachment_relay
 
-BASE_URL = f"{config.CHATWOOT_URL}/api/v1/accounts/{config.CHATWOOT_ACCOUNT_ID}"
-HEADERS = {"api_access_token": config.CHATWOOT_API_TOKEN, "Content-Type": "application/json; charset=utf-8"}
-MULTIPART_HEADERS = {"api_access_token": config.CHATWOOT_API_TOKEN}
+# URL e cabeçalhos montados a cada chamada, com a configuração do momento.
+def _base_url():
+    return f"{config.CHATWOOT_URL}/api/v1/accounts/{config.CHATWOOT_ACCOUNT_ID}"
+
+def _headers():
+    return {"api_access_token": config.CHATWOOT_API_TOKEN, "Content-Type": "application/json; charset=utf-8"}
+
+def _multipart_headers():
+    return {"api_access_token": config.CHATWOOT_API_TOKEN}
+
+class UntrustedAttachmentURL(Exception):
+    """A URL de um anexo recebido no webhook não pertence ao Chatwoot configurado."""
+
+def _is_chatwoot_url(url):
+    """Indica se a URL tem o mesmo esquema e host (com porta) que CHATWOOT_URL."""
+    target, base = urlsplit(url), urlsplit(config.CHATWOOT_URL or '')
+    return bool(base.netloc) and (target.scheme.lower(), target.netloc.lower()) == (base.scheme.lower(), base.netloc.lower())
+
+def _invalidate_on_404(response, contact_id=None, conversation_id=None):
+    """Descarta mapeamentos locais de objetos que o Chatwoot informa não existirem mais."""
+    if response.status_code != 404:
+        return
+    if contact_id is not None:
+        print(f"Contato {contact_id} não existe mais no Chatwoot. Removendo do cache local.")
+        db_manager.forget_contact(contact_id)
+    if conversation_id is not None:
+        print(f"Conversa {conversation_id} não existe mais no Chatwoot. Removendo do cache local.")
+        db_manager.forget_conversation(conversation_id)
+
+def _remember_pack_conversation(custom_attributes, conversation):
+    """Salva o mapeamento pack -> conversa quando a conversa criada pertence a um pack."""
+    pack_id = (custom_attributes or {}).get('meli_pack_id')
+    if pack_id and conversation.get('id'):
+        db_manager.save_conversation_id(pack_id, conversation['id'])
 
 def find_or_create_contact(identifier, name, email=None):
-    """Busca um contato pelo identifier (ID do usuário MELI), se não encontrar, cria um novo."""
-    search_url = f"{BASE_URL}/contacts/search"
-    response = requests.get(search_url, headers=HEADERS, params={'q': str(identifier)})
+    """Busca um contato pelo identifier (ID do usuário MELI), se não encontrar, cria um novo.
+
+    O mapeamento local é consultado antes; nesse caso apenas {'id', 'identifier'} é retornado.
+    """
+    cached_id = db_manager.get_contact_id(identifier)
+    if cached_id is not None:
+        return {"id": cached_id, "identifier": str(identifier)}
+
+    search_url = f"{_base_url()}/contacts/search"
+    response = http_client.chatwoot.get(search_url, headers=_headers(), params={'q': str(identifier)})
     response.raise_for_status()
     data = response.json()
     if data['meta']['count'] > 0:
-        return data['payload'][0]
+        contact = data['payload'][0]
     else:
-        create_url = f"{BASE_URL}/contacts"
-        payload = {"name": name, "email": email, "avatar_url": https://logodownload.org/wp-content/uploads/2016/08/mercado-livre-logo-0-1.png, "identifier": str(identifier)}
-        response = requests.post(create_url, headers=HEADERS, data=json.dumps(payload))
+        create_url = f"{_base_url()}/contacts"
+        payload = {"name": name, "email": email, "avatar_url": "https://logodownload.org/wp-content/uploads/2016/08/mercado-livre-logo-0-1.png", "identifier": str(identifier)}
+        response = http_client.chatwoot.post(create_url, headers=_headers(), data=json.dumps(payload))
         response.raise_for_status()
-        return response.json()['payload']['contact']
+        contact = response.json()['payload']['contact']
+    db_manager.save_contact_id(identifier, contact['id'])
+    return contact
 
-def create_conversation_with_attachment(inbox_id, contact_id, message_body, custom_attributes, file_content, filename):
-    """Cria uma conversa no Chatwoot já com um anexo usando multipart/form-data."""
-    conv_url = f"{BASE_URL}/conversations"
-    data = {
+def create_conversation_with_attachment(inbox_id, contact_id, message_body, custom_attributes, file_content, filename, content_type=None):
+    """Cria uma conversa no Chatwoot já com um anexo usando multipart/form-data.
+
+    'file_content' pode ser bytes ou um arquivo aberto; o corpo é enviado em streaming.
+    """
+    conv_url = f"{_base_url()}/conversations"
+    fields = {
         "inbox_id": inbox_id, "contact_id": contact_id, "content": message_body,
         "message_type": "incoming", "status": "open", "custom_attributes": json.dumps(custom_attributes)
     }
-    files = {'attachments[]': (filename, file_content)}
-    response = requests.post(conv_url, headers=MULTIPART_HEADERS, data=data, files=files, timeout=45)
+    body = attachment_relay.multipart_body(_multipart_headers(), fields, 'attachments[]', filename, file_content, content_type)
+    response = http_client.chatwoot.post(conv_url, timeout=45, **body)
     if response.status_code == 200:
         print(f"Sucesso: Conversa com anexo criada no inbox {inbox_id}.")
     else:
         print(f"Erro ao criar conversa com anexo: {response.status_code} - {response.text}")
+    _invalidate_on_404(response, contact_id=contact_id)
     response.raise_for_status()
-    return response.json()
+    conversation = response.json()
+    _remember_pack_conversation(custom_attributes, conversation)
+    return conversation
 
 def create_conversation(inbox_id, contact_id, message_body, custom_attributes=None):
     """Cria uma nova conversa (APENAS TEXTO) em uma caixa de entrada específica."""
-    conv_url = f"{BASE_URL}/conversations"
+    conv_url = f"{_base_url()}/conversations"
     payload = {
         "inbox_id": inbox_id, "contact_id": contact_id,
         "message": {"content": message_body, "message_type": "incoming"}, "status": "open"
     }
     if custom_attributes:
         payload["custom_attributes"] = custom_attributes
-    response = requests.post(conv_url, headers=HEADERS, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    response = http_client.chatwoot.post(conv_url, headers=_headers(), data=json.dumps(payload, ensure_ascii=False).encode('utf-8'))
     if response.status_code == 200:
         print(f"Sucesso: Conversa de texto criada no inbox {inbox_id}.")
     else:
         print(f"Erro ao criar conversa de texto: {response.status_code} - {response.text}")
+    _invalidate_on_404(response, contact_id=contact_id)
     response.raise_for_status()
-    return response.json()
+    conversation = response.json()
+    _remember_pack_conversation(custom_attributes, conversation)
+    return conversation
 
 # --- NOVA FUNÇÃO DA V2.1 ---
 def search_conversation(pack_id):
-    """Busca por uma conversa existente usando o 'meli_pack_id' como atributo personalizado."""
-    filter_url = f"{BASE_URL}/conversations/filter"
+    """Busca por uma conversa existente usando o 'meli_pack_id' como atributo personalizado.
+
+    O mapeamento local é consultado antes; nesse caso apenas {'id'} é retornado.
+    """
+    cached_id = db_manager.get_conversation_id(pack_id)
+    if cached_id is not None:
+        return {"id": cached_id}
+
+    try:
+        conversation = _filter_conversation('meli_pack_id', pack_id)
+        if conversation:
+            db_manager.save_conversation_id(pack_id, conversation['id'])
+            return conversation
+    except Exception as e:
+        print(f"Erro ao buscar conversa para o pack {pack_id}: {e}")
+    return None
+
+def find_question_conversation(question_id):
+    """Busca a conversa criada para uma pergunta (atributo 'meli_question_id'). Retorna None se não houver.
+
+    Ao contrário de search_conversation, erros na busca são propagados: quem chama não deve
+    criar a conversa sem saber se ela já existe.
+    """
+    return _filter_conversation('meli_question_id', question_id)
+
+def _filter_conversation(attribute_key, value):
+    """Retorna a primeira conversa com o atributo personalizado igual a 'value', ou None."""
+    filter_url = f"{_base_url()}/conversations/filter"
     payload = {
         "payload": [
             {
-                "attribute_key": "meli_pack_id",
+                "attribute_key": attribute_key,
                 "attribute_model": "conversation_attribute",
                 "filter_operator": "equal_to",
-                "values": [str(pack_id)],
+                "values": [str(value)],
                 "query_operator": "and"
             }
         ]
     }
-    try:
-        response = requests.post(filter_url, headers=HEADERS, json=payload)
-        response.raise_for_status()
-        data = response.json()
-        if data['meta']['count'] > 0:
-            # Retorna o objeto da primeira conversa encontrada
-            return data['payload'][0]
-    except Exception as e:
-        print(f"Erro ao buscar conversa para o pack {pack_id}: {e}")
-    return None
+    # O filtro é apenas uma consulta, então pode ser repetido com segurança.
+    response = http_client.chatwoot.post(filter_url, headers=_headers(), json=payload, idempotent=True)
+    response.raise_for_status()
+    data = response.json()
+    # Retorna o objeto da primeira conversa encontrada
+    return data['payload'][0] if data['meta']['count'] > 0 else None
 
 # --- NOVA FUNÇÃO DA V2.1 ---
-def add_message_to_conversation(conversation_id, message_body, file_content=None, filename=None):
-    """Adiciona uma nova mensagem (texto ou anexo) a uma conversa existente."""
-    message_url = f"{BASE_URL}/conversations/{conversation_id}/messages"
+def add_message_to_conversation(conversation_id, message_body, file_content=None, filename=None, content_type=None):
+    """Adiciona uma nova mensagem (texto ou anexo) a uma conversa existente.
+
+    'file_content' pode ser bytes ou um arquivo aberto; o corpo é enviado em streaming.
+    """
+    message_url = f"{_base_url()}/conversations/{conversation_id}/messages"
     
-    if file_content:
+    if file_content is not None:
         # Requisição Multipart para anexos
-        data = {"content": message_body, "message_type": "incoming"}
-        files = {'attachments[]': (filename, file_content)}
-        response = requests.post(message_url, headers=MULTIPART_HEADERS, data=data, files=files, timeout=45)
+        fields = {"content": message_body, "message_type": "incoming"}
+        body = attachment_relay.multipart_body(_multipart_headers(), fields, 'attachments[]', filename, file_content, content_type)
+        response = http_client.chatwoot.post(message_url, timeout=45, **body)
     else:
         # Requisição JSON apenas para texto
         payload = {"content": message_body, "message_type": "incoming"}
-        response = requests.post(message_url, headers=HEADERS, json=payload)
+        response = http_client.chatwoot.post(message_url, headers=_headers(), json=payload)
         
     if response.status_code == 200:
         print(f"Sucesso: Mensagem adicionada à conversa {conversation_id}.")
     else:
         print(f"Erro ao adicionar mensagem à conversa {conversation_id}: {response.status_code} - {response.text}")
-        
+
+    _invalidate_on_404(response, conversation_id=conversation_id)
     response.raise_for_status()
     return response.json()
+
+def download_attachment(data_url):
+    """Baixa em streaming um anexo enviado por um agente (context manager, ver attachment_relay.download).
+
+    A data_url vem no corpo do webhook: só URLs do Chatwoot configurado são aceitas, e o token
+    nunca sai dele. O redirecionamento para o armazenamento dos arquivos (URL assinada do
+    Active Storage) é seguido sem o token.
+    """
+    if not _is_chatwoot_url(data_url):
+        raise UntrustedAttachmentURL(f"anexo fora do Chatwoot configurado ({config.CHATWOOT_URL}): {data_url}")
+    response = http_client.chatwoot.get(data_url, headers=_multipart_headers(), stream=True,
+                                        allow_redirects=False, timeout=45)
+    if response.is_redirect:
+        location = urljoin(data_url, response.headers['Location'])
+        response.close()
+        return attachment_relay.download(http_client.chatwoot, location)
+    return attachment_relay.opened(attachment_relay.spool_response(response))
@@ -0,0 +1,109 @@
+# concurrency.py
+import queue
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import config
+
+# --- Limites de concorrência por API externa ---
+# Cada chamada ao MELI ou ao Chatwoot deve ocupar uma vaga do semáforo correspondente,
+# assim o número de workers do poller não se traduz diretamente em rajadas de requisições.
+_api_limits = {}
+_api_limits_lock = threading.Lock()
+
+def api_limit(api):
+    """Retorna o semáforo da API ('meli' ou 'chatwoot'), criado no primeiro uso com <API>_MAX_CONCURRENCY."""
+    limit = _api_limits.get(api)
+    if limit is None:
+        with _api_limits_lock:
+            limit = _api_limits.get(api)
+            if limit is None:
+                limit = threading.BoundedSemaphore(max(1, getattr(config, f"{api.upper()}_MAX_CONCURRENCY")))
+                _api_limits[api] = limit
+    return limit
+
+def run_concurrently(func, items, max_workers=None):
+    """Executa func(item) para cada item em um pool de threads limitado.
+
+    Retorna uma lista de tuplas (item, resultado, erro) na ordem de conclusão.
+    Exceções não interrompem as demais tarefas; ficam registradas em 'erro'.
+    Cada tarefa herda o contexto de quem chamou (ex.: o vendedor atual, em sellers).
+    """
+    items = list(items)
+    if not items:
+        return []
+    max_workers = max(1, min(max_workers or config.POLLER_MAX_WORKERS, len(items)))
+
+    # Com um único worker não há ganho em criar threads: mantém o fluxo sequencial.
+    if max_workers == 1:
+        results = []
+        for item in items:
+            try:
+                results.append((item, func(item), None))
+            except Exception as e:
+                results.append((item, None, e))
+        return results
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="poller") as executor:
+        futures = {executor.submit(contextvars.copy_context().run, func, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results.append((item, future.result(), None))
+            except Exception as e:
+                results.append((item, None, e))
+    return results
+
+def round_robin(*iterables):
+    """Intercala os iteráveis (um item de cada por vez), para que nenhum monopolize o início da fila."""
+    iterators = [iter(it) for it in iterables]
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+_DONE = object()
+
+def prefetch(iterable, depth=2):
+    """Consome 'iterable' em uma thread própria, mantendo no máximo 'depth' itens prontos à frente.
+
+    Permite que a próxima etapa (ex.: buscar a página seguinte) avance enquanto a atual é
+    processada, sem acumular o iterável inteiro na memória. Exceções do produtor são
+    relançadas para quem consome; se o consumidor parar antes do fim, o produtor também para.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as e:
+            put((_DONE, e))
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(produce,), name="prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
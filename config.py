@@ -1,42 +1,225 @@
 # config.py
+"""Configuração da integração, lida das variáveis de ambiente (e do arquivo .env).
+
+Importar este módulo não tem efeitos colaterais: o .env é carregado e as variáveis são lidas
+apenas no primeiro acesso a um valor (config.MELI_APP_ID, get_settings()), e o backend de
+estado só é preparado quando o processo chama startup() ao iniciar.
+"""
 import os
-from dotenv import load_dotenv
-import db_manager
-
-# Carrega o arquivo .env (importante para desenvolvimento local e para popular o DB na 1ª vez)
-load_dotenv()
-
-# --- Configurações estáticas do ambiente ---
-MELI_APP_ID = os.getenv("MELI_APP_ID")
-MELI_SECRET_KEY = os.getenv("MELI_SECRET_KEY")
-MELI_USER_ID = os.getenv("MELI_USER_ID")
-
-CHATWOOT_URL = os.getenv("CHATWOOT_URL")
-CHATWOOT_API_TOKEN = os.getenv("CHATWOOT_API_TOKEN")
-CHATWOOT_ACCOUNT_ID = os.getenv("CHATWOOT_ACCOUNT_ID")
-CHATWOOT_QUESTIONS_INBOX_ID = os.getenv("CHATWOOT_QUESTIONS_INBOX_ID")
-CHATWOOT_MESSAGES_INBOX_ID = os.getenv("CHATWOOT_MESSAGES_INBOX_ID")
-CHATWOOT_WEBHOOK_SECRET = os.getenv("CHATWOOT_WEBHOOK_SECRET")
-
-# --- Tokens dinâmicos (lidos do DB) ---
-# Inicializa o DB com os tokens do .env, se o DB estiver vazio.
-db_manager.initialize_db(
-    initial_access_token=os.getenv("MELI_ACCESS_TOKEN"),
-    initial_refresh_token=os.getenv("MELI_REFRESH_TOKEN")
-)
-
-# Lê os tokens do banco de dados para usar na aplicação
-MELI_ACCESS_TOKEN = db_manager.get_setting('MELI_ACCESS_TOKEN')
-MELI_REFRESH_TOKEN = db_manager.get_setting('MELI_REFRESH_TOKEN')
-
-def update_meli_tokens(new_access_token, new_refresh_token):
-    """Atualiza os tokens no banco de dados e recarrega as variáveis globais."""
-    global MELI_ACCESS_TOKEN, MELI_REFRESH_TOKEN
-    
-    print("Atualizando tokens de acesso no banco de dados...")
-    db_manager.update_setting('MELI_ACCESS_TOKEN', new_access_token)
-    db_manager.update_setting('MELI_REFRESH_TOKEN', new_refresh_token)
-    
-    MELI_ACCESS_TOKEN = new_access_token
-    MELI_REFRESH_TOKEN = new_refresh_token
-    print("Tokens atualizados com sucesso.")
+import threading
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass(frozen=True)
+class Settings:
+    """Valores da configuração. Cada campo é lido da variável de ambiente de mesmo nome."""
+
+    # --- Mercado Livre ---
+    MELI_APP_ID: Optional[str] = None
+    MELI_SECRET_KEY: Optional[str] = None
+    MELI_USER_ID: Optional[str] = None
+    # Permite apontar para um servidor local (ex.: benchmarks/fake_upstreams.py)
+    MELI_API_URL: str = "https://api.mercadolibre.com"
+    MELI_SITE_ID: str = "MLB"
+    # Tokens iniciais: gravados no backend de estado por startup() se ainda não existirem.
+    # Depois disso, os tokens são lidos (e renovados) apenas pelo token_manager.
+    MELI_ACCESS_TOKEN: Optional[str] = None
+    MELI_REFRESH_TOKEN: Optional[str] = None
+
+    # --- Chatwoot ---
+    CHATWOOT_URL: Optional[str] = None
+    CHATWOOT_API_TOKEN: Optional[str] = None
+    CHATWOOT_ACCOUNT_ID: Optional[str] = None
+    CHATWOOT_QUESTIONS_INBOX_ID: Optional[str] = None
+    CHATWOOT_MESSAGES_INBOX_ID: Optional[str] = None
+    # Webhooks sem assinatura HMAC válida são recusados (401). Sem o segredo, o webhook não
+    # inicia, a menos que WEBHOOK_ALLOW_UNSIGNED=true (apenas para desenvolvimento local).
+    CHATWOOT_WEBHOOK_SECRET: Optional[str] = None
+    WEBHOOK_ALLOW_UNSIGNED: bool = False
+    # Tamanho máximo do corpo aceito pelo servidor ASGI (asgi_server.py).
+    WEBHOOK_MAX_BODY_BYTES: int = 1024 * 1024
+
+    # --- Backend de estado (ver db_manager.py) ---
+    STATE_BACKEND: str = "sqlite"
+    MELI_DB_FILE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "meli_tokens.db")
+    STATE_REDIS_URL: str = "redis://localhost:6379/0"
+    # Prefixo de todas as chaves, para que várias instalações possam dividir o mesmo Redis.
+    STATE_KEY_PREFIX: str = "meli:"
+
+    # --- Concorrência do poller ---
+    # Número de tarefas (perguntas ou packs) processadas em paralelo por ciclo.
+    # Use 1 para voltar ao comportamento sequencial.
+    POLLER_MAX_WORKERS: int = 8
+    # Limite de requisições simultâneas para cada API externa.
+    MELI_MAX_CONCURRENCY: int = 4
+    CHATWOOT_MAX_CONCURRENCY: int = 4
+    # Ritmo máximo (requisições/segundo) e rajada de cada API, por processo. 0 desativa o limite.
+    # O ritmo é reduzido automaticamente quando a API responde 429 ou zera X-RateLimit-Remaining.
+    MELI_RATE_LIMIT_PER_SECOND: float = 10
+    MELI_RATE_LIMIT_BURST: int = 20
+    CHATWOOT_RATE_LIMIT_PER_SECOND: float = 20
+    CHATWOOT_RATE_LIMIT_BURST: int = 40
+
+    # --- Agendamento adaptativo do poller ---
+    # Intervalos iniciais (segundos) da verificação de perguntas e de mensagens.
+    POLL_QUESTIONS_SECONDS: int = 120
+    POLL_MESSAGES_SECONDS: int = 180
+    # O intervalo diminui enquanto chegam itens novos e aumenta quando não há nada (ou a API pede calma).
+    POLL_MIN_SECONDS: int = 15
+    POLL_MAX_SECONDS: int = 600
+
+    # --- Cliente HTTP compartilhado ---
+    # Timeout padrão (segundos) para chamadas que não definem o seu próprio.
+    HTTP_TIMEOUT: float = 15
+    # Conexões mantidas abertas (keep-alive) por host.
+    HTTP_POOL_SIZE: int = 10
+    # Tentativas extras em 429/5xx e base do backoff exponencial (segundos).
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_BACKOFF_SECONDS: float = 0.5
+
+    # --- Retenção dos itens processados ---
+    # IDs mais antigos que isso são removidos pela compactação diária do poller.
+    PROCESSED_ITEMS_TTL_DAYS: int = 180
+
+    # --- Sincronização de pedidos/mensagens ---
+    # 'incremental' busca todos os pedidos alterados desde o último ciclo;
+    # 'recent' mantém o comportamento antigo (apenas os 10 pedidos mais recentes).
+    MELI_ORDERS_SYNC_MODE: str = "incremental"
+    # Janela usada na primeira sincronização incremental, quando ainda não há cursor salvo.
+    MELI_SYNC_INITIAL_LOOKBACK_DAYS: int = 7
+    MELI_ORDERS_PAGE_SIZE: int = 50
+    # Mensagens de texto do comprador enviadas com até esse intervalo (segundos) entre si são
+    # juntadas em uma só mensagem no Chatwoot. 0 encaminha cada mensagem separadamente.
+    CHATWOOT_COALESCE_WINDOW_SECONDS: float = 0
+
+    # --- Ingestão de perguntas ---
+    # Perguntas por página; a leitura para na primeira página sem perguntas novas.
+    MELI_QUESTIONS_PAGE_SIZE: int = 50
+    # Páginas buscadas e enriquecidas à frente enquanto as conversas da atual são criadas.
+    QUESTIONS_PIPELINE_DEPTH: int = 2
+    # A cada quantas horas a verificação percorre todas as páginas (recupera perguntas antigas que falharam).
+    MELI_QUESTIONS_FULL_SCAN_HOURS: float = 24
+
+    # --- Notificações do MELI (/meli/notifications) ---
+    # Com as notificações ativas, a varredura periódica vira apenas uma reconciliação lenta.
+    MELI_NOTIFICATIONS_ENABLED: bool = False
+    MELI_NOTIFICATIONS_POLL_SECONDS: int = 5
+    RECONCILIATION_SWEEP_MINUTES: int = 30
+
+    # --- Fila de tarefas de saída (respostas enviadas ao MELI) ---
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_MAX_ATTEMPTS: int = 8
+    # Base do backoff exponencial entre tentativas (segundos)
+    JOB_BACKOFF_SECONDS: float = 5
+    JOB_POLL_SECONDS: float = 1
+    # Tempo máximo que uma tarefa fica reservada por um worker antes de voltar para a fila
+    JOB_LEASE_SECONDS: int = 120
+
+    # --- Token do MELI ---
+    # Antecedência (segundos) com que o token é renovado antes de expirar
+    MELI_TOKEN_REFRESH_MARGIN_SECONDS: int = 600
+    # Intervalo (segundos) para conferir se outro processo já renovou o token
+    MELI_TOKEN_CHECK_SECONDS: int = 10
+
+    # --- Anexos ---
+    # Tamanho máximo de um anexo repassado entre MELI e Chatwoot (bytes)
+    ATTACHMENT_MAX_BYTES: int = 25 * 1024 * 1024
+    # Acima deste tamanho o anexo em trânsito é gravado em arquivo temporário em vez de memória
+    ATTACHMENT_SPOOL_MEMORY_BYTES: int = 1024 * 1024
+
+    # --- Vários vendedores ---
+    # Validade (segundos) da reserva de um vendedor por um poller. Com vários pollers (em um ou
+    # mais servidores) apontando para o mesmo banco, os vendedores são divididos entre eles.
+    SELLER_LEASE_SECONDS: int = 60
+
+    # --- Métricas (/metrics) ---
+    # Intervalo mínimo (segundos) entre gravações do snapshot de cada processo no backend de estado
+    METRICS_PUSH_SECONDS: int = 15
+    # Snapshots sem atualização há mais tempo que isso são descartados
+    METRICS_SNAPSHOT_MAX_AGE_SECONDS: int = 600
+
+    # --- Cache de anúncios (título/link usados nas perguntas) ---
+    ITEM_CACHE_TTL_SECONDS: int = 3600
+    ITEM_CACHE_MAX_SIZE: int = 2000
+    # Salva o cache no backend de estado para que o poller reinicie com ele já populado.
+    ITEM_CACHE_PERSIST: bool = True
+
+    def __post_init__(self):
+        # Normalizações que antes eram feitas junto com a leitura de cada variável.
+        object.__setattr__(self, "MELI_API_URL", self.MELI_API_URL.rstrip("/"))
+        object.__setattr__(self, "MELI_ORDERS_SYNC_MODE", self.MELI_ORDERS_SYNC_MODE.lower())
+        object.__setattr__(self, "STATE_BACKEND", (self.STATE_BACKEND or "sqlite").lower())
+        if not self.MELI_DB_FILE:
+            object.__setattr__(self, "MELI_DB_FILE", Settings.MELI_DB_FILE)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Monta a configuração a partir das variáveis de ambiente, convertendo cada valor para o tipo do campo."""
+        values = {}
+        for field in dataclasses.fields(cls):
+            raw = environ.get(field.name)
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = raw.strip().lower() == "true"
+            elif field.type in (int, float):
+                try:
+                    values[field.name] = field.type(raw)
+                except ValueError:
+                    raise ValueError(f"{field.name}={raw!r} inválido: esperado um valor {field.type.__name__}") from None
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+_FIELDS = frozenset(field.name for field in dataclasses.fields(Settings))
+_settings = None
+_settings_lock = threading.Lock()
+
+def get_settings():
+    """Retorna a configuração do processo, carregando o .env e as variáveis no primeiro uso."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                # O .env é importante para desenvolvimento local e para popular o estado na 1ª vez;
+                # variáveis já definidas no ambiente têm precedência sobre ele.
+                from dotenv import load_dotenv
+                load_dotenv()
+                _settings = Settings.from_env()
+    return _settings
+
+def __getattr__(name):
+    # Mantém o acesso como atributo do módulo (config.MELI_APP_ID) sem ler nada na importação.
+    if name in _FIELDS:
+        return getattr(get_settings(), name)
+    raise AttributeError(f"module 'config' has no attribute {name!r}")
+
+# --- Hooks de inicialização ---
+_started = False
+_startup_lock = threading.Lock()
+
+def startup():
+    """Prepara o backend de estado; cada processo chama ao iniciar (poller, worker, webhook, CLIs).
+
+    O esquema só é criado ou migrado quando a versão gravada no banco está desatualizada, o que
+    acontece uma vez por implantação. Os tokens e o vendedor do .env (MELI_USER_ID + caixas de
+    entrada) são cadastrados se ainda não existirem; outros vendedores são cadastrados com
+    'python sellers.py add'. Chamadas seguintes no mesmo processo não fazem nada.
+    """
+    global _started
+    with _startup_lock:
+        if _started:
+            return
+        import db_manager
+        settings = get_settings()
+        db_manager.initialize_db(
+            initial_access_token=settings.MELI_ACCESS_TOKEN,
+            initial_refresh_token=settings.MELI_REFRESH_TOKEN,
+            default_seller={
+                "seller_id": settings.MELI_USER_ID,
+                "questions_inbox_id": settings.CHATWOOT_QUESTIONS_INBOX_ID,
+                "messages_inbox_id": settings.CHATWOOT_MESSAGES_INBOX_ID,
+            }
+        )
+        _started = True
@@ -1,86 +1,197 @@
 # db_manager.py
-import sqlite3
+"""Estado compartilhado da integração: tokens e configurações, itens processados, caches e filas.
+
+O armazenamento fica no backend escolhido por STATE_BACKEND:
+
+- 'sqlite' (padrão, sqlite_store.py): arquivo local; webhook, poller e worker precisam
+  compartilhar o mesmo disco.
+- 'redis' (redis_store.py): servidor Redis compartilhado, o que permite rodar várias
+  réplicas de cada processo em máquinas diferentes.
+
+O resto do código usa apenas as funções deste módulo, nunca o backend diretamente.
+"""
 import os
+import time
+import uuid
+import socket
+import threading
+import config
+
+def _load_backend(name):
+    if name == 'sqlite':
+        import sqlite_store
+        return sqlite_store
+    if name == 'redis':
+        import redis_store
+        return redis_store
+    raise ValueError(f"STATE_BACKEND inválido: {name!r} (use 'sqlite' ou 'redis')")
+
+_backend_module = None
+_backend_lock = threading.Lock()
+
+def _backend():
+    """Retorna o módulo do backend de estado, escolhido por config.STATE_BACKEND no primeiro uso."""
+    global _backend_module
+    if _backend_module is None:
+        with _backend_lock:
+            if _backend_module is None:
+                _backend_module = _load_backend(config.STATE_BACKEND)
+    return _backend_module
+
+def _delegate(name):
+    def call(*args, **kwargs):
+        return getattr(_backend(), name)(*args, **kwargs)
+    call.__name__ = call.__qualname__ = name
+    return call
+
+# Chaves de 'settings' que, com vários vendedores, passam a existir uma por vendedor ("CHAVE:seller_id").
+# Cada backend migra as chaves antigas, sem vendedor, na inicialização.
+SELLER_SCOPED_SETTINGS = ('MELI_ACCESS_TOKEN', 'MELI_REFRESH_TOKEN', 'MELI_TOKEN_EXPIRES_AT', 'MELI_TOKEN_VERSION', 'SYNC_ORDERS_LAST_UPDATED')
+
+# --- Interface do backend ---
+initialize_db = _delegate('initialize_db')
+
+# Tokens e configurações
+get_setting = _delegate('get_setting')
+update_setting = _delegate('update_setting')
+get_settings = _delegate('get_settings')
+update_settings = _delegate('update_settings')
+
+# Locks entre processos (com validade)
+acquire_lock = _delegate('acquire_lock')
+release_lock = _delegate('release_lock')
+get_live_locks = _delegate('get_live_locks')
+
+# Vendedores
+get_sellers = _delegate('get_sellers')
+save_seller = _delegate('save_seller')
+
+# Cache de anúncios e mapeamentos MELI -> Chatwoot
+get_cached_items = _delegate('get_cached_items')
+save_cached_items = _delegate('save_cached_items')
+get_contact_id = _delegate('get_contact_id')
+save_contact_id = _delegate('save_contact_id')
+forget_contact = _delegate('forget_contact')
+get_conversation_id = _delegate('get_conversation_id')
+save_conversation_id = _delegate('save_conversation_id')
+forget_conversation = _delegate('forget_conversation')
+
+# Filas (notificações do MELI e tarefas de saída)
+enqueue_notification = _delegate('enqueue_notification')
+pop_notifications = _delegate('pop_notifications')
+enqueue_job = _delegate('enqueue_job')
+claim_jobs = _delegate('claim_jobs')
+complete_job = _delegate('complete_job')
+release_job = _delegate('release_job')
+fail_job = _delegate('fail_job')
+count_jobs = _delegate('count_jobs')
+
+# Métricas
+save_metrics_snapshot = _delegate('save_metrics_snapshot')
+get_metrics_snapshots = _delegate('get_metrics_snapshots')
+
+# --- CURSORES DA SINCRONIZAÇÃO INCREMENTAL (guardados em 'settings') ---
+ORDERS_SYNC_CURSOR_KEY = 'SYNC_ORDERS_LAST_UPDATED'
+PACK_CURSOR_PREFIX = 'SYNC_PACK_LAST_MESSAGE:'
+
+def get_orders_sync_cursor(seller_id):
+    """Retorna o date_last_updated do último pedido sincronizado do vendedor, ou None."""
+    return get_setting(f"{ORDERS_SYNC_CURSOR_KEY}:{seller_id}")
+
+def set_orders_sync_cursor(seller_id, date_last_updated):
+    update_setting(f"{ORDERS_SYNC_CURSOR_KEY}:{seller_id}", date_last_updated)
+
+def get_pack_cursor(pack_id):
+    """Retorna o ID da última mensagem já vista em um pack, ou None."""
+    return get_setting(f"{PACK_CURSOR_PREFIX}{pack_id}")
+
+def set_pack_cursor(pack_id, message_id):
+    update_setting(f"{PACK_CURSOR_PREFIX}{pack_id}", str(message_id))
+
+# --- Índice em memória dos itens já processados ---
+# Um ID marcado como processado nunca volta atrás (exceto na compactação), então o
+# índice pode responder sozinho pelos IDs que contém, em qualquer _backend().
+_processed_ids = set()
+_dedupe_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+_index_lock = threading.RLock()
+
+def warm_processed_cache():
+    """Carrega todos os IDs processados para o índice em memória. Retorna a quantidade carregada."""
+    with _index_lock:
+        ids = _backend().all_processed_ids()
+        _processed_ids.clear()
+        _processed_ids.update(ids)
+        return len(_processed_ids)
+
+def filter_unprocessed(item_ids):
+    """Retorna, na ordem original, os IDs da lista que ainda não foram processados.
+
+    A resposta vem do índice em memória; apenas os IDs ausentes dele são conferidos no backend,
+    em lote, já que outro processo (ex.: o webhook ou outra réplica) pode tê-los marcado.
+    """
+    item_ids = list(item_ids)
+    with _index_lock:
+        candidates = [str(i) for i in item_ids if str(i) not in _processed_ids]
+        _dedupe_stats["memory_hits"] += len(item_ids) - len(candidates)
+        if candidates:
+            found = _backend().find_processed(list(dict.fromkeys(candidates)))
+            _processed_ids.update(found)
+            _dedupe_stats["db_hits"] += len(found)
+        unprocessed = [i for i in item_ids if str(i) not in _processed_ids]
+        _dedupe_stats["misses"] += len(unprocessed)
+        return unprocessed
+
+def mark_processed_many(item_ids):
+    """Marca vários IDs como processados de uma só vez."""
+    values = list(dict.fromkeys(str(i) for i in item_ids))
+    if not values:
+        return
+    _backend().add_processed(values, int(time.time()))
+    with _index_lock:
+        _processed_ids.update(values)
 
-DB_FILE = os.path.join(os.path.dirname(__file__), 'meli_tokens.db')
-
-def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def initialize_db(initial_access_token=None, initial_refresh_token=None):
-    """Cria as tabelas do banco de dados se elas não existirem."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Tabela para tokens e configurações
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL
-        )
-    ''')
-    
-    # --- NOVA TABELA PARA GERENCIAR ESTADO ---
-    # Guarda IDs de perguntas, mensagens e respostas já processadas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS processed_items (
-            item_id TEXT PRIMARY KEY
-        )
-    ''')
-
-    # Popula os tokens iniciais se a tabela estiver vazia
-    cursor.execute("SELECT key FROM settings WHERE key IN ('MELI_ACCESS_TOKEN', 'MELI_REFRESH_TOKEN')")
-    existing_keys = [row['key'] for row in cursor.fetchall()]
-    
-    if 'MELI_ACCESS_TOKEN' not in existing_keys and initial_access_token:
-        print("Populando o banco de dados com o Access Token inicial.")
-        cursor.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ('MELI_ACCESS_TOKEN', initial_access_token))
-
-    if 'MELI_REFRESH_TOKEN' not in existing_keys and initial_refresh_token:
-        print("Populando o banco de dados com o Refresh Token inicial.")
-        cursor.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ('MELI_REFRESH_TOKEN', initial_refresh_token))
-
-    conn.commit()
-    conn.close()
-
-def get_setting(key):
-    """Busca um valor de configuração na tabela 'settings'."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = cursor.fetchone()
-    conn.close()
-    return row['value'] if row else None
-
-def update_setting(key, value):
-    """Atualiza ou insere um valor de configuração na tabela 'settings'."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO settings (key, value) VALUES (?, ?)
-        ON CONFLICT(key) DO UPDATE SET value = excluded.value
-    ''', (key, value))
-    conn.commit()
-    conn.close()
-
-# --- NOVAS FUNÇÕES DE GERENCIAMENTO DE ESTADO ---
 def is_item_processed(item_id):
     """Verifica se um ID de item já foi processado."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT item_id FROM processed_items WHERE item_id = ?", (str(item_id),))
-    row = cursor.fetchone()
-    conn.close()
-    return row is not None
+    return not filter_unprocessed([item_id])
 
 def mark_item_as_processed(item_id):
     """Marca um ID de item como processado."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # ON CONFLICT IGNORE faz com que, se o ID já existir, nada aconteça.
-    cursor.execute("INSERT OR IGNORE INTO processed_items (item_id) VALUES (?)", (str(item_id),))
-    conn.commit()
-    conn.close()
+    mark_processed_many([item_id])
+
+def compact_processed_items(ttl_days):
+    """Remove itens processados há mais de ttl_days dias. Retorna o número de itens removidos."""
+    deleted = _backend().delete_processed_before(int(time.time() - ttl_days * 86400))
+    if deleted:
+        warm_processed_cache()
+    return deleted
+
+def get_dedupe_stats():
+    """Retorna os contadores do índice de itens processados."""
+    with _index_lock:
+        return dict(_dedupe_stats, cached_ids=len(_processed_ids))
+
+# --- RESERVA DE ITENS ENTRE RÉPLICAS ---
+# Antes de criar uma conversa, o item é reservado no backend (INSERT ... ON CONFLICT no SQLite,
+# SET NX no Redis): se duas réplicas encontrarem o mesmo item, só uma o encaminha.
+CLAIM_PREFIX = 'claim:'
+CLAIM_TTL_SECONDS = 300
+_claim_local = threading.local()
+
+def _claim_owner():
+    # Cada thread é um dono distinto (mesmo que o sistema reaproveite o ident de uma thread
+    # encerrada), então duas tarefas do mesmo processo também se excluem.
+    if getattr(_claim_local, 'pid', None) != os.getpid():
+        _claim_local.pid = os.getpid()
+        _claim_local.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return _claim_local.owner
+
+def claim_item(item_id, ttl_seconds=CLAIM_TTL_SECONDS):
+    """Reserva um item para esta thread. Retorna False se outra réplica já o reservou.
+
+    A reserva expira sozinha após ttl_seconds, caso o processo pare antes de liberá-la.
+    """
+    return acquire_lock(f"{CLAIM_PREFIX}{item_id}", _claim_owner(), ttl_seconds)
+
+def release_item(item_id):
+    """Libera a reserva de um item feita por esta thread."""
+    release_lock(f"{CLAIM_PREFIX}{item_id}", _claim_owner())
@@ -0,0 +1,52 @@
+# fake_meli_notifier.py
+"""Simula o envio de notificações do MELI para o endpoint /meli/notifications.
+
+Uso:
+    python fake_meli_notifier.py --topic questions --resource /questions/123
+    python fake_meli_notifier.py --topic orders_v2 --resource /orders/456 --count 5
+"""
+import argparse
+import json
+import time
+import urllib.request
+
+def build_notification(topic, resource, user_id, application_id, attempts=1):
+    """Monta o corpo de uma notificação no mesmo formato enviado pelo MELI."""
+    now = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+    return {
+        "_id": f"fake-{time.time_ns()}",
+        "resource": resource,
+        "user_id": int(user_id) if str(user_id).isdigit() else user_id,
+        "topic": topic,
+        "application_id": int(application_id) if str(application_id).isdigit() else application_id,
+        "attempts": attempts,
+        "sent": now,
+        "received": now,
+    }
+
+def send_notification(url, notification, timeout=5):
+    """Envia a notificação e retorna (status HTTP, segundos até a resposta)."""
+    body = json.dumps(notification).encode('utf-8')
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    start = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        response.read()
+        return response.status, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Envia notificações falsas do MELI para a integração.")
+    parser.add_argument("--url", default="http://localhost:5000/meli/notifications")
+    parser.add_argument("--topic", default="questions", choices=["questions", "messages", "orders_v2"])
+    parser.add_argument("--resource", required=True, help="ex.: /questions/123, /orders/456 ou o ID da mensagem")
+    parser.add_argument("--user-id", default="0", help="deve coincidir com MELI_USER_ID")
+    parser.add_argument("--application-id", default="0", help="deve coincidir com MELI_APP_ID")
+    parser.add_argument("--count", type=int, default=1, help="quantas vezes reenviar (simula reentregas)")
+    args = parser.parse_args()
+
+    for attempt in range(1, args.count + 1):
+        notification = build_notification(args.topic, args.resource, args.user_id, args.application_id, attempts=attempt)
+        status, elapsed = send_notification(args.url, notification)
+        print(f"Notificação {attempt}/{args.count}: HTTP {status} em {elapsed * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+# gunicorn.conf.py
+# Configuração do gunicorn para o webhook_server (lida automaticamente quando ele roda nesta pasta).
+# Os nomes definidos aqui viram opções do gunicorn, por isso os módulos da integração são
+# importados dentro do hook.
+
+def on_starting(server):
+    # O backend de estado é preparado (e a configuração conferida) uma única vez, no processo
+    # mestre, antes de criar os workers; eles só importam a aplicação, sem abrir o banco.
+    import webhook_handlers
+    webhook_handlers.startup()
@@ -0,0 +1,232 @@
+# http_client.py
+import re
+import time
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+import config
+import concurrency
+import metrics
+import rate_limiter
+
+# --- Política padrão das requisições ---
+# O timeout padrão vem de config.HTTP_TIMEOUT, lido a cada requisição.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+MAX_BACKOFF_SECONDS = 30
+
+# Segmentos de caminho com 2+ dígitos seguidos (IDs de pergunta, pack, conversa, MLB123...) viram ":id"
+# no label das métricas; "v1" e afins são mantidos.
+_ID_SEGMENT = re.compile(r"\d{2,}")
+
+def endpoint_label(url):
+    """Normaliza a URL para um label de baixa cardinalidade (ex.: /packs/:id/sellers/:id)."""
+    path = urlsplit(url).path
+    return "/".join(":id" if _ID_SEGMENT.search(segment) else segment for segment in path.split("/")) or "/"
+
+class UpstreamStats:
+    """Acumula contadores de requisições e de conexões abertas para uma API externa."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.request_seconds = 0.0
+        self.connections_opened = 0
+        self.handshake_seconds = 0.0
+
+    def record_request(self, elapsed, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.request_seconds += elapsed
+            if failed:
+                self.errors += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+        metrics.inc("upstream_retries_total", upstream=self.name)
+
+    def record_handshake(self, elapsed):
+        with self._lock:
+            self.connections_opened += 1
+            self.handshake_seconds += elapsed
+        metrics.observe("upstream_connect_seconds", elapsed, upstream=self.name)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "avg_request_ms": round(1000 * self.request_seconds / self.requests, 1) if self.requests else 0.0,
+                "connections_opened": self.connections_opened,
+                "avg_handshake_ms": round(1000 * self.handshake_seconds / self.connections_opened, 1) if self.connections_opened else 0.0,
+            }
+
+def _timed_pool_classes(stats):
+    """Cria classes de pool do urllib3 cujas conexões medem o tempo de conexão (TCP + TLS)."""
+
+    class TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            stats.record_handshake(time.perf_counter() - start)
+
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            stats.record_handshake(time.perf_counter() - start)
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    return {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+class _InstrumentedAdapter(HTTPAdapter):
+    """HTTPAdapter com pool dimensionado e conexões instrumentadas."""
+
+    def __init__(self, stats, **kwargs):
+        # Precisa existir antes do super().__init__, que já chama init_poolmanager.
+        self._stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self._stats)
+
+class UpstreamClient:
+    """Sessão HTTP com keep-alive, timeout padrão, limite de ritmo e retry/backoff para uma API externa.
+
+    O semáforo, o balde e a sessão são criados no primeiro uso, com a configuração daquele momento.
+    """
+
+    def __init__(self, name, pool_size=None):
+        self.name = name
+        self.stats = UpstreamStats(name)
+        self._pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return concurrency.api_limit(self.name)
+
+    @property
+    def bucket(self):
+        return rate_limiter.get_bucket(self.name)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    pool_size = self._pool_size or config.HTTP_POOL_SIZE
+                    session = requests.Session()
+                    adapter = _InstrumentedAdapter(self.stats, pool_connections=pool_size, pool_maxsize=pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def _should_retry(self, method, idempotent, response=None, error=None):
+        if error is not None:
+            # Se a conexão nem chegou a ser aberta, a requisição não foi enviada e é seguro repetir.
+            if isinstance(error, requests.exceptions.ConnectTimeout):
+                return True
+            return idempotent and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+        if response.status_code not in RETRY_STATUSES:
+            return False
+        # 429 indica que a requisição foi rejeitada antes de ser processada.
+        return idempotent or response.status_code == 429
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), MAX_BACKOFF_SECONDS)
+            except ValueError:
+                pass
+        return min(config.HTTP_BACKOFF_SECONDS * (2 ** attempt), MAX_BACKOFF_SECONDS)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """Executa a requisição, repetindo em 429/5xx e falhas de conexão quando for seguro.
+
+        'idempotent' permite marcar como repetível um POST que apenas consulta dados.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", config.HTTP_TIMEOUT)
+        endpoint = endpoint_label(url)
+
+        attempt = 0
+        while True:
+            response, error = None, None
+            self.bucket.acquire()
+            start = time.perf_counter()
+            with self.limit:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.exceptions.RequestException as e:
+                    error = e
+            elapsed = time.perf_counter() - start
+            if response is not None:
+                self.bucket.observe(response)
+            failed = error is not None or response.status_code >= 400
+            self.stats.record_request(elapsed, failed=failed)
+            status = type(error).__name__ if error is not None else response.status_code
+            metrics.observe("upstream_request_seconds", elapsed, upstream=self.name, method=method,
+                            endpoint=endpoint, status=status)
+
+            if attempt < config.HTTP_MAX_RETRIES and self._should_retry(method, idempotent, response, error):
+                delay = self._backoff(attempt, response)
+                reason = error if error is not None else f"HTTP {response.status_code}"
+                print(f"[{self.name}] {method} {url} falhou ({reason}). Nova tentativa em {delay:.1f}s...")
+                self.stats.record_retry()
+                time.sleep(delay)
+                # Corpos em streaming (ex.: anexos) precisam voltar ao início antes do reenvio.
+                if hasattr(kwargs.get("data"), "seek"):
+                    kwargs["data"].seek(0)
+                attempt += 1
+                continue
+
+            if error is not None:
+                raise error
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+# --- Clientes compartilhados por todo o processo ---
+meli = UpstreamClient("meli")
+chatwoot = UpstreamClient("chatwoot")
+
+def throttled_recently(window):
+    """Indica se alguma API externa pediu para desacelerar nos últimos 'window' segundos."""
+    return any(client.bucket.throttled_recently(window) for client in (meli, chatwoot))
+
+def get_stats():
+    """Retorna os contadores acumulados de cada API externa."""
+    return {client.name: client.stats.snapshot() for client in (meli, chatwoot)}
+
+def log_stats():
+    """Imprime um resumo das requisições e conexões de cada API externa."""
+    for name, stats in get_stats().items():
+        print(
+            f"[http:{name}] requisições={stats['requests']} erros={stats['errors']} "
+            f"retries={stats['retries']} latência_média={stats['avg_request_ms']}ms "
+            f"conexões_abertas={stats['connections_opened']} handshake_médio={stats['avg_handshake_ms']}ms"
+        )
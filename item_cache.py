@@ -0,0 +1,63 @@
+# item_cache.py
+import time
+import threading
+from collections import OrderedDict
+import config
+import db_manager
+import mercado_livre_api
+
+# --- Cache LRU em memória: item_id -> (expira_em, {'title', 'permalink'}) ---
+_items = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "db_hits": 0, "api_fetched": 0}
+
+def _remember(item_id, info, expires_at):
+    _items[item_id] = (expires_at, info)
+    _items.move_to_end(item_id)
+    while len(_items) > config.ITEM_CACHE_MAX_SIZE:
+        _items.popitem(last=False)
+
+def get_items(item_ids):
+    """Retorna {item_id: {'title', 'permalink'}} usando o cache e resolvendo as faltas em lote.
+
+    Os IDs ausentes da memória são procurados no SQLite (se ITEM_CACHE_PERSIST) e o restante
+    é buscado no MELI pelo multi-get. Anúncios que o MELI não retornar ficam de fora do resultado.
+    """
+    now = time.time()
+    found, missing = {}, []
+    with _lock:
+        for item_id in dict.fromkeys(str(i) for i in item_ids):
+            entry = _items.get(item_id)
+            if entry and entry[0] > now:
+                _items.move_to_end(item_id)
+                found[item_id] = entry[1]
+            else:
+                missing.append(item_id)
+        _stats["hits"] += len(found)
+        _stats["misses"] += len(missing)
+
+    if missing and config.ITEM_CACHE_PERSIST:
+        persisted = db_manager.get_cached_items(missing, min_fetched_at=int(now - config.ITEM_CACHE_TTL_SECONDS))
+        with _lock:
+            for item_id, info in persisted.items():
+                _remember(item_id, {"title": info['title'], "permalink": info['permalink']}, info['fetched_at'] + config.ITEM_CACHE_TTL_SECONDS)
+                found[item_id] = _items[item_id][1]
+            _stats["db_hits"] += len(persisted)
+        missing = [item_id for item_id in missing if item_id not in persisted]
+
+    if missing:
+        fetched = mercado_livre_api.get_items(missing)
+        with _lock:
+            for item_id, info in fetched.items():
+                _remember(item_id, info, now + config.ITEM_CACHE_TTL_SECONDS)
+            _stats["api_fetched"] += len(fetched)
+        if config.ITEM_CACHE_PERSIST:
+            db_manager.save_cached_items(fetched, fetched_at=int(now))
+        found.update(fetched)
+
+    return found
+
+def get_stats():
+    """Retorna os contadores de acertos e faltas do cache."""
+    with _lock:
+        return dict(_stats, size=len(_items))
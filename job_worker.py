@@ -0,0 +1,119 @@
+# job_worker.py
+import time
+import config
+import mercado_livre_api
+import chatwoot_api
+import attachment_relay
+import db_manager
+import concurrency
+import metrics
+import sellers
+
+def answer_question(payload):
+    """Envia ao MELI a resposta de um agente para uma pergunta de anúncio."""
+    mercado_livre_api.answer_question(payload['question_id'], payload['text'])
+
+def send_post_sale_message(payload):
+    """Envia ao MELI uma mensagem de texto de um agente no chat pós-venda."""
+    mercado_livre_api.send_post_sale_message(payload['pack_id'], payload['text'])
+
+def send_post_sale_attachment(payload):
+    """Repassa ao MELI, em streaming, um anexo enviado por um agente no chat pós-venda."""
+    pack_id, filename = payload['pack_id'], payload['filename']
+    with chatwoot_api.download_attachment(payload['data_url']) as (fileobj, size, content_type):
+        uploaded = mercado_livre_api.send_post_sale_attachment(pack_id, fileobj, filename, content_type)
+    mercado_livre_api.send_post_sale_message(pack_id, payload.get('text') or filename, attachments=[uploaded['id']])
+
+class UnknownJobKind(Exception):
+    """Tarefa de um tipo sem função registrada em HANDLERS."""
+
+# Tipo da tarefa -> função que a executa
+HANDLERS = {
+    'answer_question': answer_question,
+    'post_sale_message': send_post_sale_message,
+    'post_sale_attachment': send_post_sale_attachment,
+}
+
+# Erros que não se resolvem com novas tentativas: a tarefa vai direto para a dead letter.
+PERMANENT_ERRORS = (attachment_relay.AttachmentTooLarge, chatwoot_api.UntrustedAttachmentURL, UnknownJobKind)
+
+def run_job(job):
+    """Executa uma tarefa, respeitando a idempotency_key, e registra o resultado na fila.
+
+    Retorna True se a tarefa foi concluída (ou já tinha sido enviada antes).
+    """
+    key = job['idempotency_key']
+    # A chave é marcada em processed_items após o envio, então uma tarefa repetida
+    # (ex.: reserva expirada depois de um envio bem-sucedido) não é enviada de novo.
+    if key and db_manager.is_item_processed(key):
+        db_manager.complete_job(job['id'])
+        metrics.inc("jobs_processed_total", kind=job['kind'], result="duplicate")
+        return True
+    try:
+        handler = HANDLERS.get(job['kind'])
+        if handler is None:
+            raise UnknownJobKind(f"tipo de tarefa desconhecido: {job['kind']}")
+        # As chamadas ao MELI saem com o token do vendedor da conversa (ou do padrão, em tarefas antigas).
+        with sellers.use(sellers.resolve(job['payload'].get('seller_id'))):
+            handler(job['payload'])
+    except Exception as e:
+        max_attempts = 0 if isinstance(e, PERMANENT_ERRORS) else config.JOB_MAX_ATTEMPTS
+        dead = db_manager.fail_job(job['id'], e, max_attempts, config.JOB_BACKOFF_SECONDS)
+        if dead:
+            print(f"ERRO definitivo na tarefa {job['id']} ({job['kind']}), movida para a dead letter: {e}")
+        else:
+            print(f"Falha na tarefa {job['id']} ({job['kind']}, tentativa {job['attempts'] + 1}): {e}")
+        metrics.inc("jobs_processed_total", kind=job['kind'], result="dead_letter" if dead else "retry")
+        return False
+    if key:
+        db_manager.mark_item_as_processed(key)
+    db_manager.complete_job(job['id'])
+    metrics.inc("jobs_processed_total", kind=job['kind'], result="ok")
+    return True
+
+def run_job_group(jobs):
+    """Executa em sequência tarefas que precisam manter a ordem (ex.: mensagens do mesmo pack).
+
+    Na primeira falha o grupo para: as tarefas seguintes voltam para a fila sem contar uma
+    tentativa, e claim_jobs só as entrega de novo depois que a que falhou for enviada.
+    """
+    for position, job in enumerate(jobs):
+        if not run_job(job):
+            for pending in jobs[position + 1:]:
+                db_manager.release_job(pending['id'])
+            return
+
+def _ordering_key(job):
+    pack_id = job['payload'].get('pack_id')
+    return f"pack-{pack_id}" if pack_id else f"job-{job['id']}"
+
+@metrics.register_collector
+def collect_queue_size():
+    """Exporta o tamanho da fila e da dead letter."""
+    for queue, size in db_manager.count_jobs().items():
+        metrics.set_gauge("job_queue_items", size, queue=queue)
+
+def drain_once():
+    """Reserva e executa um lote de tarefas. Retorna quantas foram executadas."""
+    jobs = db_manager.claim_jobs(config.JOB_WORKER_CONCURRENCY * 4, config.JOB_LEASE_SECONDS)
+    if not jobs:
+        return 0
+    groups = {}
+    for job in jobs:
+        groups.setdefault(_ordering_key(job), []).append(job)
+    concurrency.run_concurrently(run_job_group, groups.values(), max_workers=config.JOB_WORKER_CONCURRENCY)
+    return len(jobs)
+
+if __name__ == "__main__":
+    config.startup()
+    metrics.set_process_name("worker")
+    print(f"[{time.ctime()}] >>> Iniciando worker da fila de tarefas <<<")
+    while True:
+        try:
+            drained = drain_once()
+            metrics.push()
+            if drained:
+                continue
+        except Exception as e:
+            print(f"ERRO ao processar a fila de tarefas: {e}")
+        time.sleep(config.JOB_POLL_SECONDS)
@@ -1,112 +1,596 @@
 # main.py
+import sys
 import time
+import signal
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
 import schedule
-import requests
 import config
 import chatwoot_api
 import mercado_livre_api
 import db_manager # Importa o gerenciador de banco de dados
+import concurrency
+import http_client
+import item_cache
+import attachment_relay
+import metrics
+import scheduler
+import sellers
 
-def process_questions():
-    """Busca perguntas não respondidas e as cria como conversas no Chatwoot."""
-    print(f"[{time.ctime()}] Iniciando verificação de perguntas...")
+def _may_have_been_compacted(q):
+    """Indica se o ID da pergunta pode ter saído dos itens processados na compactação diária.
+
+    A compactação remove IDs processados há mais de PROCESSED_ITEMS_TTL_DAYS dias, e uma pergunta
+    é sempre processada depois de criada; perguntas mais novas que isso nunca foram removidas.
+    """
+    created = _message_time(q)
+    if created is None:
+        return True
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created < datetime.now(timezone.utc) - timedelta(days=config.PROCESSED_ITEMS_TTL_DAYS)
+
+def handle_question(q, items):
+    """Cria no Chatwoot a conversa de uma pergunta ainda não processada.
+
+    'items' é o resultado de item_cache.get_items para os anúncios do ciclo.
+    """
+    question_id = q['id']
+    print(f"Nova pergunta encontrada: ID {question_id}")
+    user_id = q['from']['id']
+    item_info = items.get(str(q['item_id']))
+    if item_info is None:
+        # Mantém a pergunta pendente para a próxima verificação, como em qualquer falha de busca.
+        raise LookupError(f"anúncio {q['item_id']} não encontrado no MELI")
+    item_title = item_info.get('title') or 'Produto não encontrado'
+    message_body = f"**Produto:** {item_title}\n**Link:** {item_info.get('permalink') or 'N/A'}\n\n**Pergunta:**\n_{q['text']}_"
+    seller = sellers.current()
+    meli_attributes = {"meli_question_id": str(question_id), "meli_seller_id": seller.seller_id}
+
+    # Outra réplica pode ter encontrado a mesma pergunta: só quem a reservar fala com o Chatwoot.
+    if not db_manager.claim_item(question_id):
+        print(f"Pergunta {question_id} já está sendo encaminhada por outra réplica.")
+        return False
     try:
-        questions = mercado_livre_api.get_unanswered_questions()
+        if db_manager.is_item_processed(question_id):
+            return False
+        # Uma pergunta antiga ainda sem resposta (ex.: vista de novo na varredura completa) pode já
+        # ter a sua conversa: só o registro local foi compactado.
+        if _may_have_been_compacted(q) and chatwoot_api.find_question_conversation(question_id):
+            print(f"Pergunta {question_id} já tem conversa no Chatwoot (registro compactado).")
+            db_manager.mark_item_as_processed(question_id)
+            return False
+        contact_info = chatwoot_api.find_or_create_contact(identifier=user_id, name=f"Cliente MELI (ID: {user_id})")
+        chatwoot_api.create_conversation(
+            inbox_id=seller.questions_inbox_id,
+            contact_id=contact_info['id'],
+            message_body=message_body,
+            custom_attributes=meli_attributes
+        )
+        # --- LÓGICA ATUALIZADA: Marca a pergunta como processada no DB ---
+        db_manager.mark_item_as_processed(question_id)
+    finally:
+        db_manager.release_item(question_id)
+    return True
+
+def unprocessed_questions(questions):
+    """Retorna, na ordem original, as perguntas da lista que ainda não foram processadas."""
+    # --- LÓGICA ATUALIZADA: Verifica no DB, em lote, quais perguntas já foram processadas ---
+    new_ids = set(db_manager.filter_unprocessed(q['id'] for q in questions))
+    return [q for q in questions if q['id'] in new_ids]
+
+def create_question_conversations(questions, items):
+    """Cria no Chatwoot as conversas das perguntas, em paralelo. Retorna quantas foram criadas."""
+    # Cada pergunta é independente, então todas podem ser encaminhadas em paralelo.
+    forwarded = 0
+    for q, created, error in concurrency.run_concurrently(lambda q: handle_question(q, items), questions):
+        if error:
+            print(f"Falha ao processar pergunta {q['id']}: {error}")
+            metrics.inc("poller_item_failures_total", kind="questions")
+        elif created:
+            # Perguntas reservadas por outra réplica ou já processadas não contam como encaminhadas.
+            metrics.inc("poller_items_forwarded_total", kind="questions")
+            forwarded += 1
+    return forwarded
+
+def forward_questions(questions):
+    """Encaminha ao Chatwoot as perguntas da lista que ainda não foram processadas.
+
+    Retorna quantas perguntas foram encaminhadas.
+    """
+    new_questions = unprocessed_questions(questions)
+    if not new_questions:
+        return 0
+
+    # Resolve de uma vez os anúncios de todas as perguntas novas (cache + multi-get).
+    try:
+        items = item_cache.get_items(q['item_id'] for q in new_questions)
     except Exception as e:
-        print(f"ERRO ao buscar perguntas no MELI: {e}")
-        return
+        print(f"ERRO ao buscar anúncios no MELI: {e}")
+        return 0
 
-    for q in questions:
-        question_id = q['id']
-        # --- LÓGICA ATUALIZADA: Verifica no DB se a pergunta já foi processada ---
-        if db_manager.is_item_processed(question_id):
-            continue
+    return create_question_conversations(new_questions, items)
+
+def iter_question_batches(full_scan=False):
+    """Gera (perguntas novas, anúncios) para cada página de perguntas não respondidas.
 
-        print(f"Nova pergunta encontrada: ID {question_id}")
-        user_id = q['from']['id']
+    As páginas vêm das mais recentes para as mais antigas, então a leitura para na primeira
+    página sem nenhuma pergunta nova; com full_scan, todas as páginas são percorridas.
+    """
+    # Perguntas que chegam durante a leitura deslocam as páginas seguintes; as já entregues
+    # nesta leitura (e talvez ainda não marcadas como processadas) não são repetidas.
+    in_flight = deque(maxlen=config.MELI_QUESTIONS_PAGE_SIZE * (config.QUESTIONS_PIPELINE_DEPTH + 2))
+    for page in mercado_livre_api.iter_unanswered_question_pages(page_size=config.MELI_QUESTIONS_PAGE_SIZE):
+        new_questions = [q for q in unprocessed_questions(page) if q['id'] not in in_flight]
+        if not new_questions:
+            if full_scan:
+                continue
+            break
+        in_flight.extend(q['id'] for q in new_questions)
+
+        # Resolve de uma vez os anúncios da página (cache + multi-get).
         try:
-            contact_info = chatwoot_api.find_or_create_contact(identifier=user_id, name=f"Cliente MELI (ID: {user_id})")
-            item_response = requests.get(
-                f"https://api.mercadolibre.com/items/{q['item_id']}",
-                headers=mercado_livre_api.get_auth_header()
-            )
-            item_response.raise_for_status()
-            item_info = item_response.json()
-            item_title = item_info.get('title', 'Produto não encontrado')
-            message_body = f"**Produto:** {item_title}\n**Link:** {item_info.get('permalink', 'N/A')}\n\n**Pergunta:**\n_{q['text']}_"
-            meli_attributes = {"meli_question_id": str(question_id)}
-            
-            chatwoot_api.create_conversation(
-                inbox_id=config.CHATWOOT_QUESTIONS_INBOX_ID,
-                contact_id=contact_info['id'],
-                message_body=message_body,
-                custom_attributes=meli_attributes
-            )
-            # --- LÓGICA ATUALIZADA: Marca a pergunta como processada no DB ---
-            db_manager.mark_item_as_processed(question_id)
+            items = item_cache.get_items(q['item_id'] for q in new_questions)
         except Exception as e:
-            print(f"Falha ao processar pergunta {question_id}: {e}")
+            # As perguntas continuam pendentes e voltam na próxima verificação.
+            print(f"ERRO ao buscar anúncios no MELI: {e}")
+            continue
+        yield new_questions, items
+
+def iter_sellers_question_batches(seller_list, full_scan=False):
+    """Intercala, página a página, as perguntas novas de cada vendedor.
+
+    Gera (vendedor, perguntas, anúncios); se a leitura de um vendedor falhar, gera
+    (vendedor, None, erro) e segue com os demais.
+    """
+    streams = [(seller, iter_question_batches(full_scan)) for seller in seller_list]
+    while streams:
+        # Uma página de cada vendedor por vez: um backlog grande não atrasa os outros vendedores.
+        for stream in list(streams):
+            seller, batches = stream
+            try:
+                questions, items = sellers.run_as(seller, next, batches)
+            except StopIteration:
+                streams.remove(stream)
+                continue
+            except Exception as e:
+                streams.remove(stream)
+                yield seller, None, e
+                continue
+            yield seller, questions, items
+
+_questions_scan = {"last_full_scan": 0.0}
+
+@metrics.timer("poller_cycle_seconds", job="questions")
+def process_questions():
+    """Busca perguntas não respondidas e as cria como conversas no Chatwoot.
+
+    Retorna quantas perguntas foram encaminhadas (None se a busca falhou em todos os vendedores).
+    Perguntas que falham continuam pendentes, mas não contam: uma que falha sempre (ex.: anúncio
+    removido) não deve manter o agendamento adaptativo no intervalo mínimo.
+    """
+    print(f"[{time.ctime()}] Iniciando verificação de perguntas...")
+    full_scan = time.time() - _questions_scan["last_full_scan"] > config.MELI_QUESTIONS_FULL_SCAN_HOURS * 3600
+    seller_list = sellers.owned()
+
+    # Leitura das páginas, deduplicação e enriquecimento rodam à frente (no máximo
+    # QUESTIONS_PIPELINE_DEPTH páginas) enquanto as conversas da página atual são criadas.
+    found, forwarded, failed = 0, 0, 0
+    batches = concurrency.prefetch(
+        iter_sellers_question_batches(seller_list, full_scan), depth=config.QUESTIONS_PIPELINE_DEPTH
+    )
+    for seller, questions, items in batches:
+        if questions is None:
+            print(f"ERRO ao buscar perguntas do vendedor {seller.seller_id} no MELI: {items}")
+            failed += 1
+            continue
+        forwarded += sellers.run_as(seller, create_question_conversations, questions, items)
+        found += len(questions)
+    if seller_list and failed == len(seller_list):
+        return None
+
+    if full_scan:
+        _questions_scan["last_full_scan"] = time.time()
+    metrics.set_gauge("poller_backlog_items", found, kind="questions")
+    http_client.log_stats()
+    print(f"[cache:anúncios] {item_cache.get_stats()}")
     print(f"[{time.ctime()}] Verificação de perguntas concluída.")
+    return forwarded
 
-def process_messages():
-    """Busca mensagens não lidas e as adiciona a conversas existentes ou cria novas."""
-    print(f"[{time.ctime()}] Iniciando verificação de mensagens pós-venda...")
+def relay_meli_attachment(attachment, send, send_note):
+    """Baixa um anexo do MELI em streaming e o entrega a send(fileobj, filename, content_type).
+
+    Anexos acima de ATTACHMENT_MAX_BYTES não são baixados: send_note recebe um aviso em texto.
+    """
+    filename = attachment.get('original_filename') or attachment.get('filename')
     try:
-        orders = mercado_livre_api.get_recent_orders()
+        with mercado_livre_api.download_attachment(attachment['filename']) as (fileobj, size, content_type):
+            print(f"Encaminhando anexo {filename} ({size} bytes) ao Chatwoot.")
+            return send(fileobj, filename, content_type)
+    except attachment_relay.AttachmentTooLarge as e:
+        print(f"AVISO: Anexo {filename} não encaminhado: {e}")
+        return send_note(f"_[Anexo '{filename}' não encaminhado: arquivo acima do limite permitido.]_")
+
+def forward_attachments(conversation_id, message_text, attachments):
+    """Adiciona os anexos de uma mensagem a uma conversa; o texto acompanha o primeiro deles."""
+    for index, attachment in enumerate(attachments):
+        text = message_text if index == 0 else ''
+        relay_meli_attachment(
+            attachment,
+            send=lambda fileobj, filename, content_type: chatwoot_api.add_message_to_conversation(
+                conversation_id, text, file_content=fileobj, filename=filename, content_type=content_type
+            ),
+            send_note=lambda note: chatwoot_api.add_message_to_conversation(conversation_id, f"{text}\n\n{note}".strip())
+        )
+
+def handle_pack(order):
+    """Encaminha ao Chatwoot as mensagens novas de um pack, na ordem em que foram enviadas.
+
+    Retorna (ok, enviadas): ok é True se todas as mensagens novas foram encaminhadas
+    (o cursor do pack avança) e 'enviadas' é quantas mensagens do comprador chegaram ao Chatwoot.
+    """
+    pack_id = order.get('pack_id')
+    # Um pack é tratado por uma réplica de cada vez, senão duas poderiam criar a mesma conversa.
+    claim = f"pack-{pack_id}"
+    if not db_manager.claim_item(claim):
+        print(f"Pack {pack_id} já está sendo sincronizado por outra réplica.")
+        return True, 0
+    try:
+        return forward_pack_messages(order)
+    finally:
+        db_manager.release_item(claim)
+
+def _message_time(msg):
+    """Momento em que o comprador enviou a mensagem (datetime), ou None se o MELI não o informou."""
+    value = (msg.get('message_date') or {}).get('created') or msg.get('date_created')
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+    except ValueError:
+        return None
+
+def coalesce_messages(messages, window_seconds):
+    """Agrupa mensagens de texto consecutivas enviadas com até window_seconds de intervalo.
+
+    Recebe as mensagens em ordem cronológica e retorna lotes (listas de mensagens); cada lote
+    vira um único envio ao Chatwoot. Mensagens com anexo ficam sempre em um lote próprio.
+    Com window_seconds <= 0, cada mensagem é um lote.
+    """
+    batches = []
+    for msg in messages:
+        previous = batches[-1][-1] if batches else None
+        if window_seconds > 0 and previous is not None and not msg.get('attachments') and not previous.get('attachments'):
+            sent, previous_sent = _message_time(msg), _message_time(previous)
+            if sent and previous_sent and 0 <= (sent - previous_sent).total_seconds() <= window_seconds:
+                batches[-1].append(msg)
+                continue
+        batches.append([msg])
+    return batches
+
+# --- Contadores do envio em lote das mensagens de pós-venda ---
+_batch_stats = {"messages": 0, "posts": 0, "coalesced": 0, "lookups_saved": 0}
+_batch_stats_lock = threading.Lock()
+
+def get_batch_stats():
+    """Retorna quantas mensagens foram encaminhadas, em quantos envios, e as chamadas economizadas."""
+    with _batch_stats_lock:
+        return dict(_batch_stats, calls_saved=_batch_stats["coalesced"] + _batch_stats["lookups_saved"])
+
+def open_pack_conversation(order, seller, message_text, attachments):
+    """Cria a conversa de um pack com a primeira mensagem (e os seus anexos). Retorna a conversa."""
+    pack_id = order.get('pack_id')
+    buyer = order.get('buyer', {})
+    print(f"Nenhuma conversa encontrada para o pack {pack_id}. Criando nova conversa.")
+    contact_info = chatwoot_api.find_or_create_contact(
+        identifier=buyer.get('id'),
+        name=buyer.get('nickname') or f"Cliente MELI (ID: {buyer.get('id')})"
+    )
+    # create_conversation* registram o mapeamento pack -> conversa a partir do meli_pack_id.
+    meli_attributes = {"meli_pack_id": str(pack_id), "meli_seller_id": seller.seller_id}
+    if not attachments:
+        return chatwoot_api.create_conversation(
+            inbox_id=seller.messages_inbox_id,
+            contact_id=contact_info['id'],
+            message_body=message_text,
+            custom_attributes=meli_attributes
+        )
+    # O primeiro anexo abre a conversa; os demais são adicionados a ela.
+    conversation = relay_meli_attachment(
+        attachments[0],
+        send=lambda fileobj, filename, content_type: chatwoot_api.create_conversation_with_attachment(
+            seller.messages_inbox_id, contact_info['id'], message_text,
+            meli_attributes, fileobj, filename, content_type
+        ),
+        send_note=lambda note: chatwoot_api.create_conversation(
+            inbox_id=seller.messages_inbox_id,
+            contact_id=contact_info['id'],
+            message_body=f"{message_text}\n\n{note}".strip(),
+            custom_attributes=meli_attributes
+        )
+    )
+    forward_attachments(conversation['id'], '', attachments[1:])
+    return conversation
+
+def post_pack_batches(order, seller, batches):
+    """Envia ao Chatwoot, em ordem, os lotes de mensagens de um pack. Retorna quantas mensagens foram enviadas.
+
+    A conversa é resolvida uma única vez para o pack inteiro. Se um envio falhar, os lotes
+    seguintes ficam para o próximo ciclo, para que as mensagens não cheguem fora de ordem.
+    """
+    pack_id = order.get('pack_id')
+    conversation = chatwoot_api.search_conversation(pack_id)
+    conversation_id = conversation['id'] if conversation else None
+    if conversation_id:
+        print(f"Conversa existente encontrada (ID: {conversation_id}). Adicionando {sum(map(len, batches))} mensagem(ns).")
+
+    posted = 0
+    for batch in batches:
+        message_text = "\n".join(msg['text'].strip() for msg in batch if (msg.get('text') or '').strip())
+        attachments = batch[0].get('attachments') or []  # um lote com anexo tem uma só mensagem
+        try:
+            if conversation_id is None:
+                conversation_id = open_pack_conversation(order, seller, message_text, attachments)['id']
+            elif attachments:
+                forward_attachments(conversation_id, message_text, attachments)
+            else:
+                chatwoot_api.add_message_to_conversation(conversation_id, message_text)
+            # --- LÓGICA ATUALIZADA: Marca as mensagens do lote como processadas no DB ---
+            db_manager.mark_processed_many(msg['id'] for msg in batch)
+        except Exception as e:
+            print(f"Falha ao processar mensagem(ns) {', '.join(str(msg['id']) for msg in batch)}: {e}")
+            return posted
+        posted += len(batch)
+
+        # Antes, cada mensagem fazia o seu próprio envio e a sua própria busca da conversa.
+        coalesced = len(batch) - 1
+        lookups_saved = coalesced if batch is batches[0] else len(batch)
+        with _batch_stats_lock:
+            _batch_stats["messages"] += len(batch)
+            _batch_stats["posts"] += 1
+            _batch_stats["coalesced"] += coalesced
+            _batch_stats["lookups_saved"] += lookups_saved
+        metrics.inc("chatwoot_calls_saved_total", coalesced, reason="coalesced")
+        metrics.inc("chatwoot_calls_saved_total", lookups_saved, reason="conversation_lookup")
+    return posted
+
+def forward_pack_messages(order):
+    """Corpo de handle_pack, executado com o pack já reservado."""
+    pack_id = order.get('pack_id')
+    seller = sellers.current()
+    try:
+        # Só são baixadas as mensagens posteriores à última já vista neste pack.
+        last_seen = db_manager.get_pack_cursor(pack_id) if pack_id else None
+        messages = mercado_livre_api.get_messages_for_order(pack_id, since_message_id=last_seen)
     except Exception as e:
-        print(f"ERRO ao buscar pedidos no MELI: {e}")
-        return
+        print(f"ERRO ao buscar mensagens do pack {pack_id}: {e}")
+        return False, 0
 
-    for order in orders:
-        pack_id = order.get('pack_id')
+    # --- LÓGICA ATUALIZADA: Verifica no DB, em lote, quais mensagens já foram processadas ---
+    new_ids = set(db_manager.filter_unprocessed(msg['id'] for msg in messages))
+
+    # Mensagens novas do comprador, da mais antiga para a mais nova; as vazias são ignoradas.
+    new_messages = [
+        msg for msg in reversed(messages)
+        if msg['id'] in new_ids and str(msg['from']['user_id']) != seller.seller_id
+    ]
+    to_forward = [msg for msg in new_messages if msg.get('attachments') or (msg.get('text') or '').strip()]
+
+    # Todas as mensagens novas do ciclo vão juntas para a conversa, em ordem e com o mínimo de
+    # chamadas ao Chatwoot; textos seguidos podem virar uma só mensagem (CHATWOOT_COALESCE_WINDOW_SECONDS).
+    posted = 0
+    if to_forward:
+        print(f"{len(to_forward)} mensagem(ns) nova(s) no pedido com Pack ID {pack_id}")
+        batches = coalesce_messages(to_forward, config.CHATWOOT_COALESCE_WINDOW_SECONDS)
+        posted = post_pack_batches(order, seller, batches)
+
+    ok = posted == len(to_forward)
+    if messages and ok:
+        db_manager.set_pack_cursor(pack_id, messages[0]['id'])
+    return ok, posted
+
+def _parse_meli_date(value):
+    return datetime.fromisoformat(value) if value else None
+
+def fetch_changed_orders():
+    """Retorna (pedidos, novo_cursor) com todos os pedidos do vendedor atual alterados desde o último ciclo."""
+    cursor = db_manager.get_orders_sync_cursor(sellers.current().seller_id)
+    if not cursor:
+        since = datetime.now(timezone.utc) - timedelta(days=config.MELI_SYNC_INITIAL_LOOKBACK_DAYS)
+        cursor = since.strftime('%Y-%m-%dT%H:%M:%S.000-00:00')
+
+    orders, newest = [], cursor
+    for order in mercado_livre_api.iter_orders_updated_since(cursor, page_size=config.MELI_ORDERS_PAGE_SIZE):
+        orders.append(order)
+        updated = order.get('date_last_updated')
+        if updated and _parse_meli_date(updated) > _parse_meli_date(newest):
+            newest = updated
+    return orders, newest
+
+def forward_orders(orders_by_seller):
+    """Encaminha as mensagens novas dos packs dos pedidos de cada vendedor.
+
+    'orders_by_seller' é uma lista de (vendedor, pedidos). Retorna (ok_por_vendedor, enviadas):
+    ok_por_vendedor[seller_id] é True se nenhum pack do vendedor falhou; 'enviadas' soma as mensagens enviadas ao Chatwoot.
+    """
+    queues = []
+    for seller, orders in orders_by_seller:
+        # Vários pedidos podem pertencer ao mesmo pack. Cada pack vira uma única tarefa,
+        # senão duas threads poderiam encaminhar as mesmas mensagens ao mesmo tempo.
+        orders_by_pack = {}
+        for order in orders:
+            orders_by_pack.setdefault(order.get('pack_id'), order)
+        queues.append([(seller, order) for order in orders_by_pack.values()])
+    # Os packs dos vendedores são intercalados na fila do pool, então um vendedor com
+    # muitos pedidos não atrasa os demais.
+    tasks = list(concurrency.round_robin(*queues))
+    metrics.set_gauge("poller_backlog_items", len(tasks), kind="packs")
+
+    status, posted = {seller.seller_id: True for seller, _ in orders_by_seller}, 0
+    results = concurrency.run_concurrently(lambda task: sellers.run_as(task[0], handle_pack, task[1]), tasks)
+    for (seller, order), result, error in results:
+        ok, pack_posted = result if result else (False, 0)
+        if error:
+            print(f"Falha ao processar o pack {order.get('pack_id')}: {error}")
+        metrics.inc("poller_items_forwarded_total" if ok and not error else "poller_item_failures_total", kind="packs")
+        status[seller.seller_id] = status[seller.seller_id] and ok and not error
+        posted += pack_posted
+    return status, posted
+
+@metrics.timer("poller_cycle_seconds", job="messages")
+def process_messages():
+    """Busca mensagens não lidas e as adiciona a conversas existentes ou cria novas.
+
+    Retorna quantas mensagens foram enviadas ao Chatwoot (None se a busca falhou em todos os vendedores).
+    Mensagens que falham não contam, para que um pack com erro persistente não mantenha o
+    agendamento adaptativo no intervalo mínimo.
+    """
+    print(f"[{time.ctime()}] Iniciando verificação de mensagens pós-venda...")
+    incremental = config.MELI_ORDERS_SYNC_MODE == 'incremental'
+    seller_list = sellers.owned()
+    orders_by_seller, new_cursors = [], {}
+    for seller in seller_list:
         try:
-            messages = mercado_livre_api.get_messages_for_order(pack_id)
+            if incremental:
+                orders, new_cursors[seller.seller_id] = sellers.run_as(seller, fetch_changed_orders)
+                print(f"{len(orders)} pedidos do vendedor {seller.seller_id} alterados desde a última sincronização.")
+            else:
+                orders = sellers.run_as(seller, mercado_livre_api.get_recent_orders)
         except Exception as e:
-            print(f"ERRO ao buscar mensagens do pack {pack_id}: {e}")
+            print(f"ERRO ao buscar pedidos do vendedor {seller.seller_id} no MELI: {e}")
             continue
-        
-        for msg in reversed(messages):
-            msg_id = msg['id']
-            # --- LÓGICA ATUALIZADA: Verifica no DB se a mensagem já foi processada ---
-            if db_manager.is_item_processed(msg_id) or str(msg['from']['user_id']) == str(config.MELI_USER_ID):
-                continue
-            
-            print(f"Nova mensagem encontrada no pedido com Pack ID {pack_id}")
-            buyer = order.get('buyer', {})
-            try:
-                existing_conversation = chatwoot_api.search_conversation(pack_id)
-                message_text, attachments = msg.get('text', ''), msg.get('attachments', [])
-
-                if existing_conversation:
-                    conversation_id = existing_conversation['id']
-                    print(f"Conversa existente encontrada (ID: {conversation_id}). Adicionando nova mensagem.")
-                    if not attachments:
-                        if not message_text.strip(): continue
-                        chatwoot_api.add_message_to_conversation(conversation_id, message_text)
-                    else:
-                        # Lógica de anexo...
-                        pass # (código omitido para brevidade, mas permanece o mesmo)
-                else:
-                    # Lógica para criar nova conversa...
-                    pass # (código omitido para brevidade, mas permanece o mesmo)
-
-                # --- LÓGICA ATUALIZADA: Marca a mensagem como processada no DB ---
-                db_manager.mark_item_as_processed(msg_id)
-            except Exception as e:
-                print(f"Falha ao processar mensagem {msg_id}: {e}")
+        orders_by_seller.append((seller, orders))
+    if seller_list and not orders_by_seller:
+        return None
+
+    status, posted = forward_orders(orders_by_seller)
+
+    # O cursor só avança se todos os packs do vendedor foram sincronizados; senão o próximo
+    # ciclo repete a mesma janela e a deduplicação evita mensagens repetidas.
+    if incremental:
+        for seller_id, all_ok in status.items():
+            if all_ok:
+                db_manager.set_orders_sync_cursor(seller_id, new_cursors[seller_id])
+    http_client.log_stats()
+    print(f"[lote:pós-venda] {get_batch_stats()}")
     print(f"[{time.ctime()}] Verificação de mensagens concluída.")
+    return posted
+
+def _order_from_message(message, seller):
+    """Monta um pedido mínimo (pack_id + comprador) a partir de uma mensagem notificada."""
+    pack_id = None
+    for ref in message.get('message_resources', []):
+        if ref.get('name') in ('packs', 'orders'):
+            pack_id = ref.get('id')
+            break
+    if not pack_id:
+        return None
+    sender = message.get('from', {}).get('user_id')
+    # Mensagens do próprio vendedor não trazem o comprador; handle_pack só o usa para contatos novos.
+    buyer = {} if str(sender) == seller.seller_id else {"id": sender}
+    return {"pack_id": pack_id, "buyer": buyer}
+
+@metrics.timer("poller_cycle_seconds", job="notifications")
+def process_notifications():
+    """Processa os recursos notificados pelo MELI em /meli/notifications. Retorna quantos eram.
+
+    Só são retiradas da fila as notificações dos vendedores reservados por este poller.
+    """
+    seller_list = sellers.owned()
+    notifications = db_manager.pop_notifications([seller.seller_id for seller in seller_list])
+    if not notifications:
+        return 0
+    print(f"[{time.ctime()}] Processando {len(notifications)} notificações do MELI...")
+
+    by_id = {seller.seller_id: seller for seller in seller_list}
+    questions, orders, failed = {}, {}, []
+    for topic, resource, seller_id in notifications:
+        seller = by_id[seller_id]
+        try:
+            if topic == 'questions':
+                question = sellers.run_as(seller, mercado_livre_api.get_resource, resource)
+                if question.get('status') == 'UNANSWERED':
+                    questions.setdefault(seller_id, []).append(question)
+            elif topic == 'orders_v2':
+                orders.setdefault(seller_id, []).append(sellers.run_as(seller, mercado_livre_api.get_resource, resource))
+            elif topic == 'messages':
+                message_id = resource.rsplit('/', 1)[-1]
+                message = sellers.run_as(seller, mercado_livre_api.get_resource, f"/messages/{message_id}")
+                order = _order_from_message(message, seller)
+                if order:
+                    orders.setdefault(seller_id, []).append(order)
+        except Exception as e:
+            print(f"ERRO ao buscar o recurso notificado {resource} ({topic}): {e}")
+            failed.append((topic, resource, seller_id))
+
+    for seller_id, seller_questions in questions.items():
+        sellers.run_as(by_id[seller_id], forward_questions, seller_questions)
+    forward_orders([(by_id[seller_id], seller_orders) for seller_id, seller_orders in orders.items()])
+
+    # Recursos que não puderam ser lidos voltam para a fila; a varredura periódica cobre o restante.
+    for topic, resource, seller_id in failed:
+        db_manager.enqueue_notification(topic, resource, seller_id)
+    return len(notifications)
+
+@metrics.register_collector
+def collect_cache_stats():
+    """Exporta os contadores da deduplicação e do cache de anúncios."""
+    dedupe = db_manager.get_dedupe_stats()
+    for result in ('memory_hits', 'db_hits', 'misses'):
+        metrics.set_counter("dedupe_lookups_total", dedupe[result], result=result)
+    items = item_cache.get_stats()
+    for result in ('hits', 'db_hits', 'misses'):
+        metrics.set_counter("item_cache_lookups_total", items[result], result=result)
+
+def compact_state():
+    """Remove do banco os itens processados mais antigos que o TTL configurado."""
+    try:
+        deleted = db_manager.compact_processed_items(config.PROCESSED_ITEMS_TTL_DAYS)
+        print(f"[{time.ctime()}] Compactação concluída: {deleted} itens antigos removidos.")
+    except Exception as e:
+        print(f"ERRO ao compactar itens processados: {e}")
 
 if __name__ == "__main__":
+    config.startup()
+    metrics.set_process_name("poller")
     print(f"[{time.ctime()}] >>> Iniciando serviço de integração Meli-Chatwoot (Poller) V2.2 <<<")
+    print(f"{db_manager.warm_processed_cache()} itens processados carregados na memória.")
+    # Com vários pollers, cada um reserva a sua parte dos vendedores cadastrados (ver sellers.py).
+    owned = sellers.refresh_leases()
+    if not sellers.all_sellers():
+        print("AVISO: nenhum vendedor cadastrado; defina MELI_USER_ID ou use 'python sellers.py add'.")
+    else:
+        print(f"Vendedores atendidos por este poller: {', '.join(s.seller_id for s in owned) or 'nenhum (todos já reservados)'}.")
+
+    # Cada tarefa roda em sua própria thread, começando já no primeiro ciclo; um ciclo que
+    # ainda não terminou faz o seguinte ser pulado, em vez de empilhar execuções.
+    poller = scheduler.Scheduler()
+    if config.MELI_NOTIFICATIONS_ENABLED:
+        # As notificações trazem as novidades; a varredura apenas reconcilia o que se perdeu.
+        sweep = config.RECONCILIATION_SWEEP_MINUTES * 60
+        poller.every("notifications", process_notifications, config.MELI_NOTIFICATIONS_POLL_SECONDS)
+        poller.every("questions", process_questions, sweep)
+        poller.every("messages", process_messages, sweep)
+    else:
+        # Os intervalos encurtam enquanto chegam itens novos e se alongam quando está tudo parado
+        # ou quando o MELI/Chatwoot pediram para desacelerar no último minuto.
+        adaptive = dict(
+            min_interval=config.POLL_MIN_SECONDS, max_interval=config.POLL_MAX_SECONDS,
+            busy=lambda: http_client.throttled_recently(60)
+        )
+        poller.every("questions", process_questions, config.POLL_QUESTIONS_SECONDS, **adaptive)
+        poller.every("messages", process_messages, config.POLL_MESSAGES_SECONDS, **adaptive)
+    schedule.every().day.at("03:00").do(compact_state)
+
+    # As reservas são renovadas fora dos ciclos e liberadas ao encerrar (o supervisord envia
+    # SIGTERM), para que outro poller assuma os vendedores sem esperar a validade expirar.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    stop_heartbeat = sellers.start_heartbeat()
     try:
-        process_questions()
-        process_messages()
-    except Exception as e:
-        print(f"ERRO no ciclo inicial: {e}")
-
-    schedule.every(2).minutes.do(process_questions)
-    schedule.every(3).minutes.do(process_messages)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+        while True:
+            poller.run_pending()
+            schedule.run_pending()
+            metrics.push()
+            time.sleep(1)
+    finally:
+        stop_heartbeat()
+        print(f"[{time.ctime()}] Poller encerrado; reservas de vendedores liberadas.")
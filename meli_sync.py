@@ -0,0 +1,296 @@
+# meli_sync.py
+"""Reconciliação com o MELI: recupera o que ficou de fora do Chatwoot (ex.: após uma parada
+ou uma falha do token).
+
+    python -m meli_sync backfill --since 2026-09-01
+    python -m meli_sync backfill --since 2026-09-01 --until 2026-09-15 --seller 123456 --only orders
+
+Percorre as perguntas não respondidas e os pedidos do período, compara com os itens já
+processados e com as conversas do Chatwoot, e cria apenas o que falta. As perguntas e os
+pedidos de cada vendedor são lidos em paralelo, dentro dos limites de ritmo do http_client.
+O avanço é gravado no backend de estado, então rodar o mesmo comando de novo retoma de onde parou.
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+import config
+import chatwoot_api
+import mercado_livre_api
+import db_manager
+import concurrency
+import http_client
+import item_cache
+import sellers
+import main as poller
+
+KINDS = ("questions", "orders")
+CHECKPOINT_PREFIX = 'BACKFILL_CHECKPOINT:'
+
+def parse_date(value):
+    """Converte uma data ISO 8601 ('2026-09-01' ou com horário) em datetime; sem fuso, assume UTC."""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _meli_date(value):
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000-00:00')
+
+def _chunks(iterable, size):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# --- Pontos de retomada (guardados em 'settings', um por tipo, vendedor e período) ---
+def _checkpoint_key(kind, seller, since, until):
+    return f"{CHECKPOINT_PREFIX}{kind}:{seller.seller_id}:{since.isoformat()}:{until.isoformat() if until else ''}"
+
+def load_checkpoint(kind, seller, since, until):
+    """Retorna o avanço salvo do backfill ({} se ainda não começou)."""
+    value = db_manager.get_setting(_checkpoint_key(kind, seller, since, until))
+    return json.loads(value) if value else {}
+
+def save_checkpoint(kind, seller, since, until, **state):
+    db_manager.update_setting(_checkpoint_key(kind, seller, since, until), json.dumps(state))
+
+# --- Progresso ---
+class Progress:
+    """Contadores do backfill por tipo, impressos periodicamente enquanto ele roda."""
+
+    def __init__(self):
+        self.counts = {kind: Counter() for kind in KINDS}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, kind, **counts):
+        with self._lock:
+            self.counts[kind].update(counts)
+
+    def report(self):
+        with self._lock:
+            q, o = dict(self.counts["questions"]), dict(self.counts["orders"])
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        scanned = q.get("scanned", 0) + o.get("orders", 0)
+        created = q.get("created", 0) + o.get("messages", 0)
+        print(f"[backfill {time.strftime('%H:%M:%S', time.gmtime(elapsed))}] "
+              f"perguntas: {q.get('scanned', 0)} lidas, {q.get('processed', 0)} já processadas, "
+              f"{q.get('in_chatwoot', 0)} já no Chatwoot, {q.get('created', 0)} criadas, {q.get('failed', 0)} falhas | "
+              f"pedidos: {o.get('orders', 0)} lidos, {o.get('packs', 0)} packs, {o.get('messages', 0)} mensagens novas, "
+              f"{o.get('failed', 0)} falhas | {scanned / elapsed:.1f} itens lidos/s, {created / elapsed:.1f} criados/s")
+
+    def run_reporter(self, interval, stop):
+        """Imprime o relatório a cada 'interval' segundos até 'stop' ser sinalizado."""
+        while not stop.wait(interval):
+            self.report()
+
+# --- Perguntas ---
+def reconcile_questions(questions, progress, workers):
+    """Cria as conversas das perguntas que não estão nem nos itens processados nem no Chatwoot.
+
+    Retorna True se nenhuma pergunta falhou.
+    """
+    missing = poller.unprocessed_questions(questions)
+    progress.add("questions", processed=len(questions) - len(missing))
+    if not missing:
+        return True
+
+    # Sem registro local (ex.: estado perdido ou já compactado), a conversa pode existir no Chatwoot.
+    to_create, failed = [], 0
+    for q, conversation, error in concurrency.run_concurrently(
+            lambda q: chatwoot_api.find_question_conversation(q['id']), missing, max_workers=workers):
+        if error:
+            print(f"Falha ao buscar a conversa da pergunta {q['id']} no Chatwoot: {error}")
+            failed += 1
+        elif conversation:
+            db_manager.mark_item_as_processed(q['id'])
+            progress.add("questions", in_chatwoot=1)
+        else:
+            to_create.append(q)
+    if not to_create:
+        progress.add("questions", failed=failed)
+        return not failed
+
+    try:
+        items = item_cache.get_items(q['item_id'] for q in to_create)
+    except Exception as e:
+        print(f"ERRO ao buscar anúncios no MELI: {e}")
+        progress.add("questions", failed=failed + len(to_create))
+        return False
+    for q, created, error in concurrency.run_concurrently(
+            lambda q: poller.handle_question(q, items), to_create, max_workers=workers):
+        if error:
+            print(f"Falha ao processar pergunta {q['id']}: {error}")
+            failed += 1
+        elif created:
+            progress.add("questions", created=1)
+    progress.add("questions", failed=failed)
+    return not failed
+
+def backfill_questions(seller, since, until, progress, workers):
+    """Reconcilia as perguntas não respondidas do vendedor atual feitas no período. Retorna True se nada falhou.
+
+    As páginas vêm das mais recentes para as mais antigas, e perguntas respondidas saem da
+    lista; por isso o ponto de retomada é a data da pergunta mais antiga já reconciliada, e
+    não a posição na lista.
+    """
+    checkpoint = load_checkpoint("questions", seller, since, until)
+    done_until = parse_date(checkpoint['position']) if checkpoint.get('position') else None
+    if done_until:
+        print(f"Perguntas do vendedor {seller.seller_id}: retomando a partir de {checkpoint['position']}.")
+
+    ok, position = True, checkpoint.get('position')
+    pages = concurrency.prefetch(
+        mercado_livre_api.iter_unanswered_question_pages(page_size=config.MELI_QUESTIONS_PAGE_SIZE),
+        depth=config.QUESTIONS_PIPELINE_DEPTH
+    )
+    for page in pages:
+        dated = [(parse_date(q['date_created']), q) for q in page]
+        in_range = [q for created, q in dated
+                    if created >= since and (until is None or created < until)
+                    and (done_until is None or created <= done_until)]
+        progress.add("questions", scanned=len(in_range))
+        if in_range:
+            ok = reconcile_questions(in_range, progress, workers) and ok
+        oldest = min(created for created, _ in dated)
+        # O ponto de retomada só avança enquanto todas as páginas anteriores deram certo.
+        if ok and (done_until is None or oldest < done_until):
+            position = oldest.isoformat()
+            save_checkpoint("questions", seller, since, until, position=position)
+        if oldest < since:
+            break
+
+    if ok:
+        save_checkpoint("questions", seller, since, until, position=position, done=True)
+    return ok
+
+# --- Pedidos e packs ---
+def backfill_orders(seller, since, until, progress, workers):
+    """Encaminha as mensagens que faltam nos packs dos pedidos do vendedor atual alterados desde 'since' e criados antes de 'until'.
+
+    Retorna True se nada falhou. A busca filtra pela data de alteração, mas ordena pela de
+    criação: um pedido antigo alterado durante o backfill muda de posição na lista, então o
+    ponto de retomada não é um offset, e sim a maior data de criação já reconciliada (com os
+    packs daquele instante). A leitura recomeça do início e pula o que já foi feito.
+    """
+    checkpoint = load_checkpoint("orders", seller, since, until)
+    done_created = parse_date(checkpoint['created']) if checkpoint.get('created') else None
+    done_packs = set(checkpoint.get('packs', []))
+    if done_created:
+        print(f"Pedidos do vendedor {seller.seller_id}: retomando após os criados até {checkpoint['created']}.")
+
+    ok, seen_packs = True, set()
+    orders = mercado_livre_api.iter_orders_updated_since(_meli_date(since), page_size=config.MELI_ORDERS_PAGE_SIZE)
+    for batch in concurrency.prefetch(_chunks(orders, config.MELI_ORDERS_PAGE_SIZE), depth=config.QUESTIONS_PIPELINE_DEPTH):
+        dated = [(parse_date(o['date_created']) if o.get('date_created') else None, o) for o in batch]
+        # Um pedido do período que mudou depois de 'until' (envio, avaliação, nova mensagem)
+        # ainda pode ter mensagens do período faltando, então o corte é pela data de criação;
+        # handle_pack encaminha todas as mensagens não processadas, qualquer que seja a data.
+        in_range = [(created, o) for created, o in dated if until is None or created is None or created < until]
+        pending = [o for created, o in in_range
+                   if done_created is None or created is None or created > done_created
+                   or (created == done_created and o.get('pack_id') not in done_packs)]
+        # Como no poller, cada pack vira uma única tarefa.
+        packs = {}
+        for order in pending:
+            if order.get('pack_id') and order['pack_id'] not in seen_packs:
+                packs.setdefault(order['pack_id'], order)
+        seen_packs.update(packs)
+        progress.add("orders", orders=len(pending), packs=len(packs))
+
+        for order, result, error in concurrency.run_concurrently(poller.handle_pack, packs.values(), max_workers=workers):
+            pack_ok, posted = result if result else (False, 0)
+            if error:
+                print(f"Falha ao processar o pack {order.get('pack_id')}: {error}")
+            if error or not pack_ok:
+                ok = False
+                progress.add("orders", failed=1)
+            progress.add("orders", messages=posted)
+
+        # O ponto de retomada só avança enquanto todos os lotes anteriores deram certo.
+        newest = max((created for created, _ in in_range if created), default=None)
+        if ok and newest and (done_created is None or newest >= done_created):
+            if done_created is None or newest > done_created:
+                done_created, done_packs = newest, set()
+            done_packs.update(o['pack_id'] for created, o in in_range if created == newest and o.get('pack_id'))
+            save_checkpoint("orders", seller, since, until, created=done_created.isoformat(), packs=sorted(done_packs))
+
+    if ok:
+        save_checkpoint("orders", seller, since, until, created=done_created.isoformat() if done_created else None,
+                        packs=sorted(done_packs), done=True)
+    return ok
+
+BACKFILLS = {"questions": backfill_questions, "orders": backfill_orders}
+
+def backfill(since, until=None, seller_list=None, kinds=KINDS, workers=None, report_seconds=10, restart=False):
+    """Reconcilia perguntas e pedidos de cada vendedor no período [since, until). Retorna True se nada falhou."""
+    seller_list = seller_list if seller_list is not None else sellers.all_sellers()
+    workers = workers or config.POLLER_MAX_WORKERS
+    tasks = []
+    for seller in seller_list:
+        for kind in kinds:
+            if restart:
+                db_manager.update_setting(_checkpoint_key(kind, seller, since, until), json.dumps({}))
+            elif load_checkpoint(kind, seller, since, until).get('done'):
+                print(f"{kind} do vendedor {seller.seller_id}: período já reconciliado (use --restart para refazer).")
+                continue
+            tasks.append((seller, kind))
+    if not tasks:
+        return True
+
+    print(f"[{time.ctime()}] Backfill de {since.isoformat()} até {until.isoformat() if until else 'agora'}: "
+          f"{len(tasks)} tarefa(s) em {len(seller_list)} vendedor(es).")
+    progress, stop = Progress(), threading.Event()
+    threading.Thread(target=progress.run_reporter, args=(report_seconds, stop), name="backfill-report", daemon=True).start()
+
+    # Perguntas e pedidos de todos os vendedores em paralelo; os semáforos e limites de ritmo
+    # do http_client mantêm as requisições ao MELI e ao Chatwoot dentro das cotas.
+    results = concurrency.run_concurrently(
+        lambda task: sellers.run_as(task[0], BACKFILLS[task[1]], task[0], since, until, progress, workers),
+        tasks, max_workers=len(tasks)
+    )
+    stop.set()
+
+    ok = True
+    for (seller, kind), result, error in results:
+        if error:
+            print(f"ERRO no backfill de {kind} do vendedor {seller.seller_id}: {error}")
+        ok = ok and bool(result) and not error
+    progress.report()
+    http_client.log_stats()
+    print(f"[{time.ctime()}] Backfill {'concluído' if ok else 'interrompido com falhas; rode o mesmo comando para retomar'}.")
+    return ok
+
+# --- Linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meli_sync", description="Reconciliação entre o MELI e o Chatwoot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("backfill", help="cria no Chatwoot as perguntas e mensagens que faltam em um período")
+    run.add_argument("--since", required=True, type=parse_date, help="início do período (ex.: 2026-09-01)")
+    run.add_argument("--until", type=parse_date, help="fim do período, exclusivo (padrão: agora)")
+    run.add_argument("--seller", action="append", help="vendedor a reconciliar (pode repetir; padrão: todos os ativos)")
+    run.add_argument("--only", choices=KINDS, help="reconcilia apenas perguntas ou apenas pedidos")
+    run.add_argument("--workers", type=int, help="tarefas em paralelo por etapa (padrão: POLLER_MAX_WORKERS)")
+    run.add_argument("--report-seconds", type=float, default=10, help="intervalo do relatório de progresso")
+    run.add_argument("--restart", action="store_true", help="ignora o avanço salvo e refaz o período")
+    args = parser.parse_args(argv)
+    config.startup()
+
+    try:
+        seller_list = [sellers.resolve(seller_id) for seller_id in args.seller] if args.seller else None
+    except LookupError as e:
+        parser.error(str(e))
+    ok = backfill(
+        args.since, args.until, seller_list, kinds=(args.only,) if args.only else KINDS,
+        workers=args.workers, report_seconds=args.report_seconds, restart=args.restart
+    )
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
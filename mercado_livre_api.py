@@ -2,36 +2,32 @@
 import requests
 import functools
 import config
+import http_client
+import token_manager
+import sellers
+import attachment_relay
+import metrics
 
-BASE_URL = "https://api.mercadolibre.com"
-
-def refresh_access_token():
-    """Usa o refresh_token para obter um novo access_token."""
-    print("Token de acesso expirado. Tentando renovar...")
-    url = f"{BASE_URL}/oauth/token"
-    payload = {
-        'grant_type': 'refresh_token',
-        'client_id': config.MELI_APP_ID,
-        'client_secret': config.MELI_SECRET_KEY,
-        'refresh_token': config.MELI_REFRESH_TOKEN
-    }
-    headers = {'accept': 'application/json', 'content-type': 'application/x-www-form-urlencoded'}
-    response = requests.post(url, headers=headers, data=payload, timeout=15)
-    response.raise_for_status()
-    new_tokens = response.json()
-    config.update_meli_tokens(new_tokens['access_token'], new_tokens['refresh_token'])
+# Máximo de IDs aceitos pelo multi-get de /items
+ITEMS_MULTIGET_LIMIT = 20
+
+def refresh_access_token(stale_token=None):
+    """Renova o access_token do vendedor atual (uma única vez entre todos os processos)."""
+    token_manager.refresh(stale_token)
     return True
 
 def handle_token_refresh(func):
     """Decorador que intercepta erros de autenticação (401) e renova o token."""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        token_used = token_manager.get_access_token()
         try:
             return func(*args, **kwargs)
         except requests.exceptions.HTTPError as e:
             if e.response is not None and e.response.status_code == 401:
                 print(f"Erro 401 na função '{func.__name__}'.")
-                refresh_access_token()
+                metrics.inc("meli_unauthorized_total", function=func.__name__)
+                refresh_access_token(stale_token=token_used)
                 print("Tentando novamente a chamada à API...")
                 return func(*args, **kwargs)
             else:
@@ -40,62 +36,170 @@ def handle_token_refresh(func):
 
 def get_auth_header():
     """Retorna o cabeçalho de autorização atualizado."""
-    return {"Authorization": f"Bearer {config.MELI_ACCESS_TOKEN}"}
+    return {"Authorization": f"Bearer {token_manager.get_access_token()}"}
 
 @handle_token_refresh
-def get_unanswered_questions():
-    """Busca todas as perguntas não respondidas."""
-    url = f"{BASE_URL}/my/received_questions/search"
-    params = {"status": "UNANSWERED", "sort_fields": "date_created", "sort_order": "asc"}
-    response = requests.get(url, headers=get_auth_header(), params=params, timeout=10)
+def get_unanswered_questions_page(offset=0, limit=50):
+    """Busca uma página de perguntas não respondidas, das mais recentes para as mais antigas."""
+    url = f"{config.MELI_API_URL}/my/received_questions/search"
+    params = {
+        "status": "UNANSWERED", "sort_fields": "date_created", "sort_order": "desc",
+        "offset": offset, "limit": limit
+    }
+    response = http_client.meli.get(url, headers=get_auth_header(), params=params, timeout=10)
     response.raise_for_status()
-    return response.json().get('questions', [])
+    return response.json()
+
+def iter_unanswered_question_pages(page_size=50):
+    """Percorre, página a página, as perguntas não respondidas (mais recentes primeiro).
+
+    Cada página é entregue assim que chega, então quem consome pode parar a qualquer momento.
+    """
+    offset = 0
+    while True:
+        data = get_unanswered_questions_page(offset=offset, limit=page_size)
+        questions = data.get('questions', [])
+        if not questions:
+            break
+        yield questions
+        offset += len(questions)
+        if offset >= data.get('total', 0):
+            break
 
 @handle_token_refresh
 def get_recent_orders():
     """Busca pedidos recentes para verificar por novas mensagens."""
-    url = f"{BASE_URL}/orders/search"
-    params = {"seller": config.MELI_USER_ID, "sort": "date_desc", "limit": 10}
-    response = requests.get(url, headers=get_auth_header(), params=params, timeout=10)
+    url = f"{config.MELI_API_URL}/orders/search"
+    params = {"seller": sellers.current().seller_id, "sort": "date_desc", "limit": 10}
+    response = http_client.meli.get(url, headers=get_auth_header(), params=params, timeout=10)
     response.raise_for_status()
     return response.json().get('results', [])
 
 @handle_token_refresh
-def get_messages_for_order(pack_id):
-    """Busca as mensagens de um pacote de pedido específico."""
+def get_orders_page(date_from, offset=0, limit=50):
+    """Busca uma página de pedidos atualizados a partir de date_from (ISO 8601)."""
+    url = f"{config.MELI_API_URL}/orders/search"
+    params = {
+        "seller": sellers.current().seller_id, "order.date_last_updated.from": date_from,
+        "sort": "date_asc", "offset": offset, "limit": limit
+    }
+    response = http_client.meli.get(url, headers=get_auth_header(), params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+def iter_orders_updated_since(date_from, page_size=50):
+    """Percorre, página a página, todos os pedidos atualizados desde date_from."""
+    offset = 0
+    while True:
+        data = get_orders_page(date_from, offset=offset, limit=page_size)
+        results = data.get('results', [])
+        yield from results
+        offset += len(results)
+        if not results or offset >= data.get('paging', {}).get('total', 0):
+            break
+
+@handle_token_refresh
+def get_messages_for_order(pack_id, since_message_id=None):
+    """Busca as mensagens de um pacote de pedido específico (mais recentes primeiro).
+
+    Com since_message_id, pagina até encontrar essa mensagem e retorna apenas as mais novas.
+    """
     if not pack_id: return []
-    messages_url = f"{BASE_URL}/messaging/packs/{pack_id}/messages"
-    response = requests.get(messages_url, headers=get_auth_header(), params={"limit": 50, "sort": "date_desc"}, timeout=10)
+    messages_url = f"{config.MELI_API_URL}/messaging/packs/{pack_id}/messages"
+    if since_message_id is None:
+        response = http_client.meli.get(messages_url, headers=get_auth_header(), params={"limit": 50, "sort": "date_desc"}, timeout=10)
+        response.raise_for_status()
+        return response.json().get('messages', [])
+
+    messages, offset = [], 0
+    while True:
+        params = {"limit": 50, "offset": offset, "sort": "date_desc"}
+        response = http_client.meli.get(messages_url, headers=get_auth_header(), params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        page = data.get('messages', [])
+        for msg in page:
+            if str(msg['id']) == str(since_message_id):
+                return messages
+            messages.append(msg)
+        offset += len(page)
+        if not page or offset >= data.get('paging', {}).get('total', 0):
+            return messages
+
+@handle_token_refresh
+def get_resource(resource):
+    """Busca um recurso informado em uma notificação do MELI (ex.: '/questions/123')."""
+    url = f"{config.MELI_API_URL}/{resource.lstrip('/')}"
+    response = http_client.meli.get(url, headers=get_auth_header(), timeout=10)
     response.raise_for_status()
-    return response.json().get('messages', [])
+    return response.json()
+
+@handle_token_refresh
+def get_items(item_ids):
+    """Busca título e link de vários anúncios de uma vez (multi-get, até 20 IDs por chamada)."""
+    items = {}
+    item_ids = list(item_ids)
+    for i in range(0, len(item_ids), ITEMS_MULTIGET_LIMIT):
+        chunk = item_ids[i:i + ITEMS_MULTIGET_LIMIT]
+        params = {"ids": ",".join(str(item_id) for item_id in chunk), "attributes": "id,title,permalink"}
+        response = http_client.meli.get(f"{config.MELI_API_URL}/items", headers=get_auth_header(), params=params, timeout=10)
+        response.raise_for_status()
+        for entry in response.json():
+            body = entry.get('body') or {}
+            if entry.get('code') == 200 and body.get('id'):
+                items[str(body['id'])] = {"title": body.get('title'), "permalink": body.get('permalink')}
+    return items
 
 @handle_token_refresh
 def answer_question(question_id, text):
     """Envia uma resposta de texto para uma pergunta específica."""
-    url = f"{BASE_URL}/answers"
+    url = f"{config.MELI_API_URL}/answers"
     payload = {"question_id": question_id, "text": text}
-    response = requests.post(url, headers=get_auth_header(), json=payload, timeout=15)
+    response = http_client.meli.post(url, headers=get_auth_header(), json=payload, timeout=15)
     response.raise_for_status()
     print(f"Resposta para a pergunta {question_id} enviada com sucesso.")
     return response.json()
 
 @handle_token_refresh
-def send_post_sale_message(pack_id, text):
-    """Envia uma mensagem de TEXTO para uma conversa de pós-venda."""
-    url = f"{BASE_URL}/messages/packs/{pack_id}/sellers/{config.MELI_USER_ID}"
+def send_post_sale_message(pack_id, text, attachments=None):
+    """Envia uma mensagem para uma conversa de pós-venda.
+
+    'attachments' recebe os IDs devolvidos por send_post_sale_attachment.
+    """
+    url = f"{config.MELI_API_URL}/messages/packs/{pack_id}/sellers/{sellers.current().seller_id}"
     payload = {"text": text}
-    response = requests.post(url, headers=get_auth_header(), json=payload, timeout=15)
+    if attachments:
+        payload["attachments"] = list(attachments)
+    response = http_client.meli.post(url, headers=get_auth_header(), json=payload, timeout=15)
     response.raise_for_status()
-    print(f"Mensagem de texto para o pack {pack_id} enviada com sucesso.")
+    print(f"Mensagem {'com anexo ' if attachments else 'de texto '}para o pack {pack_id} enviada com sucesso.")
     return response.json()
 
 @handle_token_refresh
-def send_post_sale_attachment(pack_id, file_content, filename):
-    """Envia um ANEXO para uma conversa de pós-venda."""
-    url = f"{BASE_URL}/messages/attachments?packId={pack_id}"
-    files = {'file': (filename, file_content)}
-    auth_header_only = {"Authorization": f"Bearer {config.MELI_ACCESS_TOKEN}"}
-    response = requests.post(url, headers=auth_header_only, files=files, timeout=45)
+def send_post_sale_attachment(pack_id, file_content, filename, content_type=None):
+    """Envia um ANEXO para uma conversa de pós-venda.
+
+    'file_content' pode ser bytes ou um arquivo aberto; o corpo é enviado em streaming.
+    """
+    url = f"{config.MELI_API_URL}/messages/attachments?packId={pack_id}"
+    if hasattr(file_content, 'seek'):
+        # Uma nova tentativa após o 401 precisa reenviar o arquivo desde o início.
+        file_content.seek(0)
+    body = attachment_relay.multipart_body(get_auth_header(), {}, 'file', filename, file_content, content_type)
+    response = http_client.meli.post(url, timeout=45, **body)
     response.raise_for_status()
     print(f"Anexo {filename} para o pack {pack_id} enviado com sucesso.")
     return response.json()
+
+@handle_token_refresh
+def _fetch_attachment(attachment_filename):
+    url = f"{config.MELI_API_URL}/messages/attachments/{attachment_filename}"
+    return attachment_relay.fetch(http_client.meli, url, headers=get_auth_header(), params={"site_id": config.MELI_SITE_ID})
+
+def download_attachment(attachment_filename):
+    """Baixa em streaming um anexo recebido no pós-venda (context manager, ver attachment_relay.download).
+
+    O download acontece já na chamada, para que um 401 renove o token e seja repetido antes
+    de o context manager ser entregue.
+    """
+    return attachment_relay.opened(_fetch_attachment(attachment_filename))
@@ -0,0 +1,185 @@
+# metrics.py
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import config
+import db_manager
+
+# Limites (segundos) dos buckets dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "upstream_request_seconds": "Latência das requisições às APIs externas.",
+    "upstream_retries_total": "Novas tentativas feitas pelo http_client.",
+    "upstream_throttled_seconds_total": "Tempo de espera imposto pelo limite de ritmo de cada API.",
+    "upstream_connect_seconds": "Tempo para abrir uma conexão (TCP + TLS) com a API externa.",
+    "poller_cycle_seconds": "Duração de cada ciclo do poller.",
+    "scheduler_interval_seconds": "Intervalo atual de cada tarefa periódica do poller.",
+    "scheduler_skipped_runs_total": "Execuções puladas porque a anterior ainda não tinha terminado.",
+    "poller_backlog_items": "Itens pendentes encontrados no último ciclo.",
+    "poller_items_forwarded_total": "Itens encaminhados ao Chatwoot.",
+    "poller_item_failures_total": "Falhas ao encaminhar itens ao Chatwoot.",
+    "dedupe_lookups_total": "Consultas ao índice de itens processados, por resultado.",
+    "item_cache_lookups_total": "Consultas ao cache de anúncios, por resultado.",
+    "meli_token_refresh_total": "Renovações do token do MELI.",
+    "meli_unauthorized_total": "Respostas 401 recebidas do MELI.",
+    "webhook_request_seconds": "Latência das requisições recebidas pelo servidor de webhooks.",
+    "jobs_processed_total": "Tarefas executadas pelo worker, por resultado.",
+    "job_queue_items": "Tarefas na fila e na dead letter.",
+    "sellers_owned": "Vendedores reservados por este poller.",
+    "chatwoot_calls_saved_total": "Chamadas ao Chatwoot evitadas pelo envio em lote das mensagens de pós-venda.",
+}
+
+class Registry:
+    """Contadores, gauges e histogramas do processo, indexados por nome e labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_counter(self, name, value, **labels):
+        """Define o total de um contador mantido por outro módulo (ex.: estatísticas do cache)."""
+        with self._lock:
+            self.counters[self._key(name, labels)] = value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(hist["buckets"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def snapshot(self):
+        """Serializa o registro em um dict compatível com JSON."""
+        with self._lock:
+            return {
+                "counters": [[name, list(map(list, labels)), value] for (name, labels), value in self.counters.items()],
+                "gauges": [[name, list(map(list, labels)), value] for (name, labels), value in self.gauges.items()],
+                "histograms": [[name, list(map(list, labels)), dict(hist, counts=list(hist["counts"]))] for (name, labels), hist in self.histograms.items()],
+            }
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+set_counter = REGISTRY.set_counter
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+
+# --- Identificação do processo e coletores ---
+_process = {"name": None, "per_pid": True}
+_collectors = []
+_last_push = {"at": 0.0}
+
+def set_process_name(name, per_pid=False):
+    """Define o nome usado no label 'process'. Com per_pid, o PID é anexado (ex.: workers do gunicorn)."""
+    _process["name"], _process["per_pid"] = name, per_pid
+
+def process_name():
+    base = _process["name"] or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    return f"{base}-{os.getpid()}" if _process["per_pid"] else base
+
+def register_collector(func):
+    """Registra uma função chamada antes de cada snapshot (útil para gauges lidos de outros módulos)."""
+    _collectors.append(func)
+    return func
+
+class timer(contextlib.ContextDecorator):
+    """Registra a duração do bloco (ou da função decorada) em um histograma."""
+
+    def __init__(self, name, **labels):
+        self.name, self.labels = name, labels
+
+    def _recreate_cm(self):
+        # Cada chamada da função decorada mede o próprio tempo, mesmo em threads diferentes.
+        return timer(self.name, **self.labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+# --- Armazenamento compartilhado entre processos ---
+def last_push():
+    """Momento (time.time()) da última gravação do snapshot deste processo."""
+    return _last_push["at"]
+
+def push(force=False):
+    """Grava o snapshot deste processo no SQLite (no máximo a cada METRICS_PUSH_SECONDS)."""
+    now = time.time()
+    if not force and now - _last_push["at"] < config.METRICS_PUSH_SECONDS:
+        return False
+    _last_push["at"] = now
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"ERRO no coletor de métricas {collector.__name__}: {e}")
+    db_manager.save_metrics_snapshot(process_name(), json.dumps(REGISTRY.snapshot()))
+    return True
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """Gera o texto no formato de exposição do Prometheus com as métricas de todos os processos."""
+    push(force=True)
+    snapshots = db_manager.get_metrics_snapshots(max_age_seconds=config.METRICS_SNAPSHOT_MAX_AGE_SECONDS)
+
+    series = {}
+    for process, payload in snapshots:
+        data = json.loads(payload)
+        for kind in ("counters", "gauges", "histograms"):
+            for name, labels, value in data.get(kind, []):
+                labels = [("process", process)] + [tuple(label) for label in labels]
+                series.setdefault((name, kind), []).append((labels, value))
+
+    types = {"counters": "counter", "gauges": "gauge", "histograms": "histogram"}
+    lines = []
+    for (name, kind), samples in sorted(series.items()):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {types[kind]}")
+        for labels, value in samples:
+            if kind != "histograms":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            for bound, count in zip(value["buckets"], value["counts"]):
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', repr(float(bound)))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,110 @@
+# rate_limiter.py
+import time
+import threading
+import config
+import metrics
+
+# Acima disso, X-RateLimit-Reset é um timestamp Unix e não uma quantidade de segundos.
+_EPOCH_THRESHOLD = 10 ** 9
+
+def _header_float(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value not in (None, ''):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+class TokenBucket:
+    """Limita o ritmo das requisições a uma API externa (token bucket).
+
+    'rate' fichas por segundo, acumulando até 'burst'. Quando a API sinaliza limite
+    (429 com Retry-After ou X-RateLimit-Remaining zerado), o balde é pausado e todas
+    as threads do processo esperam juntas, em vez de cada uma descobrir o limite sozinha.
+    Com rate <= 0 o balde não limita nada.
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._throttled_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Consome uma ficha ou retorna quantos segundos faltam para haver uma."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Bloqueia até a requisição poder ser enviada. Retorna o tempo esperado (segundos)."""
+        if self.rate <= 0 and self._paused_until <= time.monotonic():
+            return 0.0
+        waited = 0.0
+        while True:
+            delay = self._reserve() if self.rate > 0 else max(0.0, self._paused_until - time.monotonic())
+            if delay <= 0:
+                break
+            time.sleep(delay)
+            waited += delay
+        if waited:
+            metrics.inc("upstream_throttled_seconds_total", waited, upstream=self.name)
+        return waited
+
+    def pause(self, seconds):
+        """Suspende o envio de requisições por 'seconds' segundos."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+            self._throttled_at = now
+
+    def observe(self, response):
+        """Ajusta o ritmo a partir dos cabeçalhos de limite devolvidos pela API."""
+        headers = response.headers
+        if response.status_code == 429:
+            retry_after = _header_float(headers, "Retry-After")
+            self.pause(min(retry_after if retry_after is not None else config.HTTP_BACKOFF_SECONDS, 60))
+            return
+        remaining = _header_float(headers, "X-RateLimit-Remaining", "RateLimit-Remaining")
+        if remaining is None or remaining > 0:
+            return
+        reset = _header_float(headers, "X-RateLimit-Reset", "RateLimit-Reset")
+        if reset is not None and reset > _EPOCH_THRESHOLD:
+            reset -= time.time()
+        self.pause(min(max(reset or 1.0, 0.0), 60))
+
+    def throttled_recently(self, window):
+        """Indica se a API pediu para desacelerar nos últimos 'window' segundos."""
+        return bool(self._throttled_at) and time.monotonic() - self._throttled_at < window
+
+# --- Limites de ritmo por API externa (por processo) ---
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(api):
+    """Retorna o balde da API ('meli' ou 'chatwoot'), criado no primeiro uso com <API>_RATE_LIMIT_*."""
+    bucket = _buckets.get(api)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(api)
+            if bucket is None:
+                prefix = api.upper()
+                bucket = TokenBucket(api, getattr(config, f"{prefix}_RATE_LIMIT_PER_SECOND"),
+                                     getattr(config, f"{prefix}_RATE_LIMIT_BURST"))
+                _buckets[api] = bucket
+    return bucket
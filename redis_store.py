@@ -0,0 +1,406 @@
+# redis_store.py
+"""Backend Redis do estado da integração (STATE_BACKEND=redis), usado pelo db_manager.
+
+Com o estado em um servidor compartilhado, o webhook, o poller e o worker podem rodar em
+várias réplicas e máquinas. As operações que precisam ser atômicas usam SET NX, HSETNX,
+ZADD NX, ZPOPMIN ou transações WATCH/MULTI (sem scripts Lua), então o backend também
+funciona com o servidor de teste benchmarks/fake_redis.py.
+"""
+import json
+import time
+import threading
+import redis
+import config
+import db_manager
+
+# Tamanho máximo de cada lote em comandos com muitos argumentos (ZMSCORE, HMGET).
+BATCH_SIZE = 500
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Retorna o cliente Redis do processo (o redis-py recria as conexões após um fork)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # RESP2 funciona com qualquer versão do Redis (e com benchmarks/fake_redis.py).
+            _client = redis.Redis.from_url(config.STATE_REDIS_URL, decode_responses=True, protocol=2)
+        return _client
+
+def _key(*parts):
+    # Prefixo de todas as chaves, para que várias instalações possam dividir o mesmo Redis.
+    return config.STATE_KEY_PREFIX + ":".join(str(part) for part in parts)
+
+def _chunks(values, size=BATCH_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _escape_glob(value):
+    """Escapa os curingas do padrão de SCAN ('*', '?', '[', ']' e '\\')."""
+    return "".join("\\" + c if c in "*?[]\\" else c for c in value)
+
+def initialize_db(initial_access_token=None, initial_refresh_token=None, default_seller=None):
+    """Popula os tokens iniciais e o vendedor padrão, se ainda não existirem.
+
+    Não há esquema a criar; as mesmas migrações do backend SQLite (tokens gravados antes do
+    suporte a vários vendedores) são aplicadas ao vendedor padrão.
+    """
+    client = get_client()
+    settings = _key('settings')
+    if initial_access_token and client.hsetnx(settings, 'MELI_ACCESS_TOKEN', initial_access_token):
+        print("Populando o Redis com o Access Token inicial.")
+    if initial_refresh_token and client.hsetnx(settings, 'MELI_REFRESH_TOKEN', initial_refresh_token):
+        print("Populando o Redis com o Refresh Token inicial.")
+
+    if default_seller and default_seller.get('seller_id'):
+        seller_id = str(default_seller['seller_id'])
+        client.hsetnx(_key('sellers'), seller_id, json.dumps({
+            "nickname": None, "questions_inbox_id": default_seller.get('questions_inbox_id'),
+            "messages_inbox_id": default_seller.get('messages_inbox_id'), "enabled": 1, "created_at": int(time.time()),
+        }))
+        legacy = client.hmget(settings, db_manager.SELLER_SCOPED_SETTINGS)
+        pipe = client.pipeline(transaction=False)
+        for key, value in zip(db_manager.SELLER_SCOPED_SETTINGS, legacy):
+            if value is not None:
+                pipe.hsetnx(settings, f"{key}:{seller_id}", value)
+        pipe.execute()
+
+# --- CONFIGURAÇÕES E TOKENS ---
+def get_setting(key):
+    """Busca um valor de configuração."""
+    return get_client().hget(_key('settings'), key)
+
+def update_setting(key, value):
+    """Atualiza ou insere um valor de configuração."""
+    get_client().hset(_key('settings'), key, str(value))
+
+def get_settings(keys):
+    """Busca vários valores de configuração de uma vez. Retorna {chave: valor}."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    values = get_client().hmget(_key('settings'), keys)
+    return {key: value for key, value in zip(keys, values) if value is not None}
+
+def update_settings(values):
+    """Grava vários valores de configuração em um único comando."""
+    if values:
+        get_client().hset(_key('settings'), mapping={key: str(value) for key, value in values.items()})
+
+# --- LOCKS ENTRE PROCESSOS ---
+def acquire_lock(name, owner, ttl_seconds):
+    """Tenta obter o lock 'name' (SET NX com validade); o dono atual apenas renova a validade.
+
+    Retorna True se 'owner' passou a ser (ou já era) o dono do lock.
+    """
+    client, key = get_client(), _key('lock', name)
+    ttl_ms = max(1, int(ttl_seconds * 1000))
+    if client.set(key, owner, nx=True, px=ttl_ms):
+        return True
+
+    def renew(pipe):
+        if pipe.get(key) != owner:
+            return False
+        pipe.multi()
+        pipe.set(key, owner, px=ttl_ms)
+        return True
+    return client.transaction(renew, key, value_from_callable=True)
+
+def release_lock(name, owner):
+    """Libera o lock 'name' se ele ainda pertencer a 'owner'."""
+    key = _key('lock', name)
+
+    def delete(pipe):
+        if pipe.get(key) == owner:
+            pipe.multi()
+            pipe.delete(key)
+    get_client().transaction(delete, key)
+
+def get_live_locks(prefix):
+    """Retorna {nome: dono} dos locks ainda válidos cujo nome começa com 'prefix'."""
+    client, base = get_client(), _key('lock', '')
+    keys = list(client.scan_iter(match=base + _escape_glob(prefix) + '*', count=BATCH_SIZE))
+    locks = {}
+    for chunk in _chunks(keys):
+        for key, owner in zip(chunk, client.mget(chunk)):
+            if owner is not None:
+                locks[key[len(base):]] = owner
+    return locks
+
+# --- VENDEDORES ---
+def get_sellers(include_disabled=False):
+    """Retorna os vendedores cadastrados (dicts), ordenados por seller_id."""
+    sellers = []
+    for seller_id, raw in get_client().hgetall(_key('sellers')).items():
+        seller = json.loads(raw)
+        if include_disabled or seller.get('enabled'):
+            sellers.append({
+                "seller_id": seller_id, "nickname": seller.get('nickname'),
+                "questions_inbox_id": seller.get('questions_inbox_id'),
+                "messages_inbox_id": seller.get('messages_inbox_id'), "enabled": seller.get('enabled', 1),
+            })
+    return sorted(sellers, key=lambda s: s['seller_id'])
+
+def save_seller(seller_id, nickname=None, questions_inbox_id=None, messages_inbox_id=None, enabled=True):
+    """Cadastra ou atualiza um vendedor. Campos None mantêm o valor atual."""
+    key, seller_id = _key('sellers'), str(seller_id)
+    changes = {"nickname": nickname, "questions_inbox_id": questions_inbox_id, "messages_inbox_id": messages_inbox_id}
+
+    def update(pipe):
+        seller = json.loads(pipe.hget(key, seller_id) or '{}')
+        seller.update({field: value for field, value in changes.items() if value is not None})
+        seller.setdefault('created_at', int(time.time()))
+        seller['enabled'] = int(bool(enabled))
+        pipe.multi()
+        pipe.hset(key, seller_id, json.dumps(seller))
+    get_client().transaction(update, key)
+
+# --- ITENS JÁ PROCESSADOS (sorted set: ID -> momento do processamento) ---
+def all_processed_ids():
+    """Retorna todos os IDs processados (usado para aquecer o índice em memória do db_manager)."""
+    return get_client().zrange(_key('processed'), 0, -1)
+
+def find_processed(item_ids):
+    """Retorna o conjunto dos IDs da lista que já foram processados, consultando em lotes."""
+    client, found = get_client(), set()
+    for chunk in _chunks(list(item_ids)):
+        scores = client.zmscore(_key('processed'), chunk)
+        found.update(item_id for item_id, score in zip(chunk, scores) if score is not None)
+    return found
+
+def add_processed(item_ids, processed_at):
+    """Marca vários IDs como processados (ZADD NX mantém a data do primeiro registro)."""
+    client = get_client()
+    for chunk in _chunks(list(item_ids)):
+        client.zadd(_key('processed'), {item_id: processed_at for item_id in chunk}, nx=True)
+
+def delete_processed_before(cutoff):
+    """Remove os itens processados antes de 'cutoff' (timestamp). Retorna quantos foram removidos."""
+    return get_client().zremrangebyscore(_key('processed'), '-inf', f"({cutoff}")
+
+# --- CACHE DE ANÚNCIOS ---
+def get_cached_items(item_ids, min_fetched_at):
+    """Retorna {item_id: {'title', 'permalink', 'fetched_at'}} dos anúncios salvos após min_fetched_at."""
+    client, items = get_client(), {}
+    for chunk in _chunks(list(dict.fromkeys(str(i) for i in item_ids))):
+        for item_id, raw in zip(chunk, client.hmget(_key('item_cache'), chunk)):
+            if raw is not None:
+                info = json.loads(raw)
+                if info['fetched_at'] >= min_fetched_at:
+                    items[item_id] = info
+    return items
+
+def save_cached_items(items, fetched_at):
+    """Grava (ou atualiza) vários anúncios no cache em um único comando."""
+    if not items:
+        return
+    get_client().hset(_key('item_cache'), mapping={
+        str(item_id): json.dumps({"title": info.get('title'), "permalink": info.get('permalink'), "fetched_at": fetched_at})
+        for item_id, info in items.items()
+    })
+
+# --- FILA DE NOTIFICAÇÕES DO MELI (um sorted set por vendedor: [topic, resource] -> recebimento) ---
+def enqueue_notification(topic, resource, seller_id):
+    """Enfileira um recurso notificado pelo MELI. Notificações repetidas são agrupadas."""
+    get_client().zadd(_key('notifications', seller_id), {json.dumps([topic, resource]): time.time()}, nx=True)
+
+def pop_notifications(seller_ids, limit=100):
+    """Retira da fila (e retorna) até 'limit' notificações dos vendedores informados.
+
+    Retorna tuplas (topic, resource, seller_id), das mais antigas para as mais novas.
+    ZPOPMIN é atômico, então duas réplicas nunca recebem a mesma notificação.
+    """
+    client, popped = get_client(), []
+    for seller_id in (str(s) for s in seller_ids):
+        if len(popped) >= limit:
+            break
+        for member, received_at in client.zpopmin(_key('notifications', seller_id), limit - len(popped)):
+            topic, resource = json.loads(member)
+            popped.append((received_at, topic, resource, seller_id))
+    popped.sort(key=lambda n: n[0])
+    return [(topic, resource, seller_id) for _, topic, resource, seller_id in popped]
+
+# --- FILA DE TAREFAS ---
+# jobs: hash id -> tarefa (JSON); jobs:ready: sorted set id -> momento em que fica disponível
+# (next_run_at, ou o fim da reserva enquanto um worker a executa); jobs:keys: idempotency_key -> id.
+def enqueue_job(kind, payload, idempotency_key=None):
+    """Grava uma tarefa na fila. Retorna False se já existir uma com a mesma idempotency_key."""
+    client, keys = get_client(), _key('jobs', 'keys')
+    job_id = client.incr(_key('jobs', 'seq'))
+    now = time.time()
+    job = json.dumps({"kind": kind, "payload": payload, "idempotency_key": idempotency_key,
+                      "attempts": 0, "last_error": None, "created_at": int(now)})
+
+    def insert(pipe):
+        if idempotency_key and pipe.hexists(keys, idempotency_key):
+            return False
+        pipe.multi()
+        if idempotency_key:
+            pipe.hset(keys, idempotency_key, job_id)
+        pipe.hset(_key('jobs'), job_id, job)
+        pipe.zadd(_key('jobs', 'ready'), {job_id: now})
+        if payload.get('pack_id') is not None:
+            # Tarefas pendentes de cada pack, em ordem de criação (ver claim_jobs).
+            pipe.zadd(_key('jobs', 'pack', payload['pack_id']), {job_id: job_id})
+        return True
+    return client.transaction(insert, keys, value_from_callable=True)
+
+def claim_jobs(limit, lease_seconds):
+    """Reserva até 'limit' tarefas prontas para execução e as retorna em ordem de criação.
+
+    A reserva (mover a tarefa para o fim da validade em jobs:ready) roda em uma transação
+    WATCH/MULTI, então dois workers nunca recebem a mesma tarefa. Tarefas cuja reserva
+    expirou (worker interrompido) voltam a ficar disponíveis. Uma tarefa de um pack espera
+    enquanto houver uma tarefa mais antiga do mesmo pack reservada ou aguardando nova
+    tentativa, para que as mensagens cheguem ao comprador na ordem.
+    """
+    client, ready = get_client(), _key('jobs', 'ready')
+    now = time.time()
+
+    def claim(pipe):
+        job_ids, packs, offset = [], set(), 0
+        while len(job_ids) < limit:
+            candidates = pipe.zrangebyscore(ready, '-inf', now, start=offset, num=limit)
+            if not candidates:
+                break
+            offset += len(candidates)
+            for job_id, raw in zip(candidates, pipe.hmget(_key('jobs'), candidates)):
+                if raw is None or len(job_ids) >= limit:
+                    continue
+                pack_id = json.loads(raw)['payload'].get('pack_id')
+                pending = pipe.zrange(_key('jobs', 'pack', pack_id), 0, -1) if pack_id is not None else []
+                if not pending:
+                    job_ids.append(job_id)
+                    continue
+                if pack_id in packs:
+                    continue
+                packs.add(pack_id)
+                # Do pack, só as tarefas mais antigas que já estão prontas, em sequência.
+                for pending_id, score in zip(pending, pipe.zmscore(ready, pending)):
+                    if score is None or score > now or len(job_ids) >= limit:
+                        break
+                    job_ids.append(pending_id)
+        if job_ids:
+            pipe.multi()
+            pipe.zadd(ready, {job_id: now + lease_seconds for job_id in job_ids}, xx=True)
+        return job_ids
+    job_ids = client.transaction(claim, ready, value_from_callable=True)
+    if not job_ids:
+        return []
+
+    jobs = []
+    for job_id, raw in sorted(zip(job_ids, client.hmget(_key('jobs'), job_ids)), key=lambda j: int(j[0])):
+        if raw is None:
+            continue  # concluída por outro worker entre a reserva e a leitura
+        job = json.loads(raw)
+        jobs.append({"id": int(job_id), "kind": job['kind'], "payload": job['payload'],
+                     "idempotency_key": job['idempotency_key'], "attempts": job['attempts']})
+    return jobs
+
+def _remove_job(pipe, job_id, job):
+    pipe.hdel(_key('jobs'), job_id)
+    pipe.zrem(_key('jobs', 'ready'), job_id)
+    if job and job['idempotency_key']:
+        pipe.hdel(_key('jobs', 'keys'), job['idempotency_key'])
+    if job and job['payload'].get('pack_id') is not None:
+        pipe.zrem(_key('jobs', 'pack', job['payload']['pack_id']), job_id)
+
+def complete_job(job_id):
+    """Remove da fila uma tarefa concluída."""
+    client = get_client()
+    raw = client.hget(_key('jobs'), job_id)
+    pipe = client.pipeline()
+    _remove_job(pipe, job_id, json.loads(raw) if raw else None)
+    pipe.execute()
+
+def release_job(job_id):
+    """Devolve à fila uma tarefa reservada que não foi executada, sem contar uma tentativa."""
+    get_client().zadd(_key('jobs', 'ready'), {job_id: time.time()}, xx=True)
+
+def fail_job(job_id, error, max_attempts, backoff_seconds):
+    """Registra uma falha: reagenda com backoff exponencial ou move para a dead letter.
+
+    Retorna True se a tarefa foi para a dead letter.
+    """
+    client, now = get_client(), time.time()
+    raw = client.hget(_key('jobs'), job_id)
+    if raw is None:
+        return False
+    job = json.loads(raw)
+    job.update(attempts=job['attempts'] + 1, last_error=str(error))
+    # Só o worker que reservou a tarefa mexe nela, então basta um MULTI sem WATCH.
+    pipe = client.pipeline()
+    if job['attempts'] >= max_attempts:
+        pipe.hset(_key('jobs', 'dead'), job_id, json.dumps(dict(job, failed_at=int(now))))
+        _remove_job(pipe, job_id, job)
+        pipe.execute()
+        return True
+    pipe.hset(_key('jobs'), job_id, json.dumps(job))
+    pipe.zadd(_key('jobs', 'ready'), {job_id: now + backoff_seconds * (2 ** (job['attempts'] - 1))})
+    pipe.execute()
+    return False
+
+def count_jobs():
+    """Retorna o tamanho da fila e da dead letter."""
+    pipe = get_client().pipeline(transaction=False)
+    pipe.hlen(_key('jobs'))
+    pipe.hlen(_key('jobs', 'dead'))
+    pending, dead = pipe.execute()
+    return {"pending": pending, "dead_letter": dead}
+
+# --- MÉTRICAS ---
+def save_metrics_snapshot(process, payload):
+    """Grava (substituindo) o snapshot de métricas de um processo."""
+    get_client().hset(_key('metrics'), process, json.dumps({"payload": payload, "updated_at": int(time.time())}))
+
+def get_metrics_snapshots(max_age_seconds):
+    """Retorna [(processo, payload)] dos snapshots atualizados nos últimos max_age_seconds.
+
+    Snapshots mais antigos (ex.: workers do gunicorn que já foram reciclados) são removidos.
+    """
+    client, cutoff = get_client(), int(time.time() - max_age_seconds)
+    snapshots, stale = [], []
+    for process, raw in client.hgetall(_key('metrics')).items():
+        snapshot = json.loads(raw)
+        if snapshot['updated_at'] < cutoff:
+            stale.append(process)
+        else:
+            snapshots.append((process, snapshot['payload']))
+    if stale:
+        client.hdel(_key('metrics'), *stale)
+    return sorted(snapshots)
+
+# --- MAPEAMENTOS MELI -> CHATWOOT ---
+def _forget_value(key, value):
+    """Remove do hash 'key' os campos que apontam para 'value' (operação rara: só após um 404)."""
+    client = get_client()
+    fields = [field for field, current in client.hscan_iter(key, count=BATCH_SIZE) if current == str(value)]
+    if fields:
+        client.hdel(key, *fields)
+
+def get_contact_id(meli_user_id):
+    """Retorna o contact_id do Chatwoot já associado a um usuário do MELI, ou None."""
+    value = get_client().hget(_key('contacts'), str(meli_user_id))
+    return int(value) if value is not None else None
+
+def save_contact_id(meli_user_id, contact_id):
+    """Associa um usuário do MELI a um contato do Chatwoot."""
+    get_client().hset(_key('contacts'), str(meli_user_id), contact_id)
+
+def forget_contact(contact_id):
+    """Remove os mapeamentos que apontam para um contato que não existe mais no Chatwoot."""
+    _forget_value(_key('contacts'), contact_id)
+
+def get_conversation_id(pack_id):
+    """Retorna o conversation_id do Chatwoot já associado a um pack, ou None."""
+    value = get_client().hget(_key('conversations'), str(pack_id))
+    return int(value) if value is not None else None
+
+def save_conversation_id(pack_id, conversation_id):
+    """Associa um pack do MELI a uma conversa do Chatwoot."""
+    get_client().hset(_key('conversations'), str(pack_id), conversation_id)
+
+def forget_conversation(conversation_id):
+    """Remove os mapeamentos que apontam para uma conversa que não existe mais no Chatwoot."""
+    _forget_value(_key('conversations'), conversation_id)
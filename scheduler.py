@@ -0,0 +1,77 @@
+# scheduler.py
+import time
+import threading
+import metrics
+
+class AdaptiveJob:
+    """Tarefa periódica cujo intervalo se ajusta ao volume de itens novos.
+
+    'func' deve retornar quantos itens novos encontrou (None em caso de falha).
+    Com itens novos o intervalo é multiplicado por 'shrink'; sem novidades, com falha
+    ou quando 'busy()' indica que as APIs pediram para desacelerar, por 'grow'.
+    O intervalo fica sempre entre min_interval e max_interval.
+    """
+
+    def __init__(self, name, func, interval, min_interval=None, max_interval=None, shrink=0.5, grow=1.5, busy=None):
+        self.name = name
+        self.func = func
+        self.min_interval = min_interval or interval
+        self.max_interval = max_interval or interval
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        self.shrink, self.grow = shrink, grow
+        self.busy = busy
+        self.next_run = time.monotonic()
+        self._running = threading.Lock()
+        metrics.set_gauge("scheduler_interval_seconds", self.interval, job=self.name)
+
+    def adjust(self, found):
+        if found and not (self.busy and self.busy()):
+            self.interval = max(self.min_interval, self.interval * self.shrink)
+        else:
+            self.interval = min(self.max_interval, self.interval * self.grow)
+        metrics.set_gauge("scheduler_interval_seconds", self.interval, job=self.name)
+
+    def _run(self):
+        found = None
+        try:
+            found = self.func()
+        except Exception as e:
+            print(f"ERRO na tarefa periódica '{self.name}': {e}")
+        finally:
+            self.adjust(found)
+            # O próximo horário conta a partir do início da execução; se ela demorar mais que o
+            # intervalo, o próximo ciclo sai logo em seguida (e não empilhado com este).
+            self.next_run = self._started + self.interval
+            self._running.release()
+
+    def start_if_due(self, now):
+        """Dispara a tarefa em uma thread se já passou do horário. Retorna True se disparou."""
+        if now < self.next_run:
+            return False
+        if not self._running.acquire(blocking=False):
+            print(f"[{time.ctime()}] '{self.name}' ainda em execução. Ciclo pulado.")
+            metrics.inc("scheduler_skipped_runs_total", job=self.name)
+            self.next_run = now + self.interval
+            return False
+        self._started = now
+        # Enquanto a execução dura menos que o intervalo, os ticks seguintes nem tentam disparar;
+        # só uma execução que ultrapassa o intervalo conta como ciclo pulado.
+        self.next_run = now + self.interval
+        threading.Thread(target=self._run, name=f"job-{self.name}", daemon=True).start()
+        return True
+
+class Scheduler:
+    """Executa tarefas periódicas adaptativas, cada uma em sua própria thread."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def every(self, name, func, interval, **kwargs):
+        job = AdaptiveJob(name, func, interval, **kwargs)
+        self.jobs.append(job)
+        return job
+
+    def run_pending(self):
+        now = time.monotonic()
+        for job in self.jobs:
+            job.start_if_due(now)
@@ -0,0 +1,207 @@
+# sellers.py
+import os
+import sys
+import math
+import time
+import socket
+import argparse
+import threading
+import contextlib
+import contextvars
+import config
+import db_manager
+import metrics
+
+class Seller:
+    """Conta de vendedor do MELI atendida pela integração, com as suas caixas de entrada no Chatwoot."""
+
+    def __init__(self, seller_id, nickname=None, questions_inbox_id=None, messages_inbox_id=None, enabled=True):
+        self.seller_id = str(seller_id)
+        self.nickname = nickname
+        self.questions_inbox_id = questions_inbox_id or config.CHATWOOT_QUESTIONS_INBOX_ID
+        self.messages_inbox_id = messages_inbox_id or config.CHATWOOT_MESSAGES_INBOX_ID
+        self.enabled = bool(enabled)
+
+    def setting_key(self, key):
+        """Nome, na tabela 'settings', de uma chave própria deste vendedor."""
+        return f"{key}:{self.seller_id}"
+
+    def __repr__(self):
+        return f"Seller({self.seller_id})"
+
+# --- Cadastro (relido do DB a cada CACHE_SECONDS) ---
+CACHE_SECONDS = 30
+_cache = {"sellers": {}, "loaded_at": 0.0}
+_cache_lock = threading.Lock()
+
+def _load(force=False):
+    with _cache_lock:
+        if force or time.time() - _cache["loaded_at"] > CACHE_SECONDS:
+            _cache["sellers"] = {row['seller_id']: Seller(**row) for row in db_manager.get_sellers()}
+            _cache["loaded_at"] = time.time()
+        return _cache["sellers"]
+
+def all_sellers():
+    """Retorna os vendedores ativos, ordenados por seller_id."""
+    return list(_load().values())
+
+def get(seller_id):
+    """Retorna o vendedor ativo com esse ID, ou None."""
+    seller_id = str(seller_id)
+    sellers = _load()
+    if seller_id not in sellers:
+        # Pode ter sido cadastrado há pouco por outro processo.
+        sellers = _load(force=True)
+    return sellers.get(seller_id)
+
+def default():
+    """Vendedor usado quando nenhum foi indicado: o do MELI_USER_ID ou o único cadastrado."""
+    if config.MELI_USER_ID:
+        seller = get(config.MELI_USER_ID)
+        if seller:
+            return seller
+    sellers = all_sellers()
+    if len(sellers) == 1:
+        return sellers[0]
+    raise LookupError("Nenhum vendedor padrão: defina MELI_USER_ID ou informe o vendedor.")
+
+def resolve(seller_id=None):
+    """Retorna o vendedor 'seller_id' (ou o padrão, se None). LookupError se não existir."""
+    if not seller_id:
+        return default()
+    seller = get(seller_id)
+    if seller is None:
+        raise LookupError(f"vendedor {seller_id} não cadastrado ou desativado")
+    return seller
+
+# --- Vendedor da tarefa atual ---
+# Cada thread/tarefa enxerga o seu próprio valor; concurrency.run_concurrently e prefetch o propagam.
+_current = contextvars.ContextVar("meli_seller", default=None)
+
+def current():
+    """Vendedor em nome do qual as chamadas ao MELI estão sendo feitas."""
+    return _current.get() or default()
+
+@contextlib.contextmanager
+def use(seller):
+    """Define o vendedor atual dentro do bloco."""
+    token = _current.set(seller)
+    try:
+        yield seller
+    finally:
+        _current.reset(token)
+
+def run_as(seller, func, *args, **kwargs):
+    """Executa func em nome de 'seller'."""
+    with use(seller):
+        return func(*args, **kwargs)
+
+# --- Divisão dos vendedores entre pollers ---
+# Cada poller mantém um lock 'poller-alive:' renovado e reserva (lease) a sua parte dos vendedores
+# com locks 'seller-lease:'. Um vendedor cujo poller parou fica livre quando a reserva expira.
+POLLER_PREFIX = 'poller-alive:'
+LEASE_PREFIX = 'seller-lease:'
+_owner = f"{socket.gethostname()}-{os.getpid()}"
+_leases = {"sellers": [], "refreshed_at": 0.0}
+_leases_lock = threading.Lock()
+
+def refresh_leases():
+    """Renova as reservas deste poller e ajusta a sua parte (vendedores / pollers ativos)."""
+    ttl = config.SELLER_LEASE_SECONDS
+    db_manager.acquire_lock(POLLER_PREFIX + _owner, _owner, ttl)
+    pollers = len(db_manager.get_live_locks(POLLER_PREFIX)) or 1
+    leases = db_manager.get_live_locks(LEASE_PREFIX)
+    sellers = list(_load(force=True).values())
+    share = math.ceil(len(sellers) / pollers)
+
+    mine = [s for s in sellers if leases.get(LEASE_PREFIX + s.seller_id) == _owner]
+    # Com mais pollers ativos a parte diminui: os excedentes são liberados para os outros.
+    for seller in mine[share:]:
+        db_manager.release_lock(LEASE_PREFIX + seller.seller_id, _owner)
+    mine = mine[:share]
+    for seller in mine:
+        db_manager.acquire_lock(LEASE_PREFIX + seller.seller_id, _owner, ttl)
+    for seller in sellers:
+        if len(mine) >= share:
+            break
+        name = LEASE_PREFIX + seller.seller_id
+        if name not in leases and db_manager.acquire_lock(name, _owner, ttl):
+            mine.append(seller)
+
+    with _leases_lock:
+        _leases["sellers"], _leases["refreshed_at"] = mine, time.time()
+    metrics.set_gauge("sellers_owned", len(mine))
+    return mine
+
+def owned():
+    """Vendedores reservados por este poller, renovando as reservas quando necessário."""
+    if time.time() - _leases["refreshed_at"] > config.SELLER_LEASE_SECONDS / 3:
+        return refresh_leases()
+    return list(_leases["sellers"])
+
+def release_leases():
+    """Libera as reservas deste poller (ex.: ao encerrar), para que outro assuma logo."""
+    with _leases_lock:
+        mine, _leases["sellers"] = _leases["sellers"], []
+    for seller in mine:
+        db_manager.release_lock(LEASE_PREFIX + seller.seller_id, _owner)
+    db_manager.release_lock(POLLER_PREFIX + _owner, _owner)
+
+def _renew_leases(stop):
+    while not stop.wait(config.SELLER_LEASE_SECONDS / 3):
+        try:
+            refresh_leases()
+        except Exception as e:
+            print(f"ERRO ao renovar as reservas de vendedores: {e}")
+
+def start_heartbeat():
+    """Renova as reservas em segundo plano a cada SELLER_LEASE_SECONDS / 3.
+
+    Os ciclos do poller podem ser bem mais espaçados (ou mais longos) que a validade da reserva;
+    sem a renovação contínua, o primeiro poller a acordar tomaria todos os vendedores.
+    Retorna uma função que para a renovação e libera as reservas.
+    """
+    stop = threading.Event()
+    thread = threading.Thread(target=_renew_leases, args=(stop,), name="seller-leases", daemon=True)
+    thread.start()
+
+    def shutdown():
+        stop.set()
+        thread.join()
+        release_leases()
+    return shutdown
+
+# --- Cadastro pela linha de comando ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cadastro de vendedores do MELI atendidos pela integração.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="cadastra ou atualiza um vendedor")
+    add.add_argument("seller_id")
+    add.add_argument("--nickname")
+    add.add_argument("--questions-inbox-id", help="caixa de entrada do Chatwoot para as perguntas")
+    add.add_argument("--messages-inbox-id", help="caixa de entrada do Chatwoot para o pós-venda")
+    add.add_argument("--access-token")
+    add.add_argument("--refresh-token")
+    disable = commands.add_parser("disable", help="desativa um vendedor")
+    disable.add_argument("seller_id")
+    commands.add_parser("list", help="lista os vendedores")
+    args = parser.parse_args(argv)
+    config.startup()
+
+    if args.command == "add":
+        db_manager.save_seller(args.seller_id, args.nickname, args.questions_inbox_id, args.messages_inbox_id)
+        if args.access_token and args.refresh_token:
+            import token_manager
+            token_manager.store_tokens(args.access_token, args.refresh_token, seller=Seller(args.seller_id))
+        print(f"Vendedor {args.seller_id} cadastrado.")
+    elif args.command == "disable":
+        db_manager.save_seller(args.seller_id, enabled=False)
+        print(f"Vendedor {args.seller_id} desativado.")
+    else:
+        for row in db_manager.get_sellers(include_disabled=True):
+            status = "ativo" if row['enabled'] else "desativado"
+            print(f"{row['seller_id']}\t{row['nickname'] or '-'}\tperguntas={row['questions_inbox_id']}\t"
+                  f"pós-venda={row['messages_inbox_id']}\t{status}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,594 @@
+# sqlite_store.py
+"""Backend SQLite do estado da integração (padrão), usado pelo db_manager.
+
+Todo o estado fica em um arquivo local (MELI_DB_FILE), então o webhook, o poller e o
+worker precisam compartilhar o mesmo sistema de arquivos.
+"""
+import sqlite3
+import os
+import json
+import time
+import uuid
+import threading
+import config
+import db_manager
+
+# Tamanho máximo de cada lote em consultas com IN (...), abaixo do limite de variáveis do SQLite.
+BATCH_SIZE = 500
+
+# --- Conexão compartilhada de longa duração ---
+_shared_conn = None
+_shared_pid = None
+_shared_lock = threading.RLock()
+
+def get_db_connection():
+    """Cria e retorna uma conexão com o banco de dados."""
+    conn = sqlite3.connect(config.MELI_DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _chunks(values, size=BATCH_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def get_shared_connection():
+    """Retorna a conexão de longa duração do processo (modo WAL), criando-a se necessário.
+
+    A conexão é reaberta após um fork (ex.: workers do gunicorn), já que conexões
+    SQLite não podem ser compartilhadas entre processos. O uso deve ocorrer sob _shared_lock.
+    """
+    global _shared_conn, _shared_pid
+    with _shared_lock:
+        if _shared_conn is None or _shared_pid != os.getpid():
+            conn = sqlite3.connect(config.MELI_DB_FILE, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _shared_conn, _shared_pid = conn, os.getpid()
+        return _shared_conn
+
+# Versão do esquema, gravada em PRAGMA user_version. Aumente-a ao mudar tabelas ou índices:
+# o esquema só é criado/migrado quando o banco tem uma versão anterior (uma vez por implantação).
+SCHEMA_VERSION = 1
+
+def _create_schema(conn):
+    """Cria as tabelas e aplica as migrações pendentes, gravando SCHEMA_VERSION ao final."""
+    # WAL permite que o poller e os workers do webhook leiam enquanto outro processo escreve.
+    conn.execute("PRAGMA journal_mode=WAL").fetchone()
+    # Se vários processos iniciarem juntos, só o primeiro aplica as migrações.
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        conn.rollback()
+        return
+    cursor = conn.cursor()
+
+    # Tabela para tokens e configurações
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    
+    # --- NOVA TABELA PARA GERENCIAR ESTADO ---
+    # Guarda IDs de perguntas, mensagens e respostas já processadas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processed_items (
+            item_id TEXT PRIMARY KEY,
+            processed_at INTEGER
+        )
+    ''')
+    # Bancos criados antes da compactação não têm a coluna processed_at.
+    columns = [row['name'] for row in cursor.execute("PRAGMA table_info(processed_items)").fetchall()]
+    if 'processed_at' not in columns:
+        cursor.execute("ALTER TABLE processed_items ADD COLUMN processed_at INTEGER")
+        cursor.execute("UPDATE processed_items SET processed_at = ? WHERE processed_at IS NULL", (int(time.time()),))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processed_items_processed_at ON processed_items (processed_at)")
+
+    # Cache persistente de título/link dos anúncios usados nas perguntas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_cache (
+            item_id TEXT PRIMARY KEY,
+            title TEXT,
+            permalink TEXT,
+            fetched_at INTEGER NOT NULL
+        )
+    ''')
+
+    # Mapeamentos locais para evitar buscas no Chatwoot
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contact_map (
+            meli_user_id TEXT PRIMARY KEY,
+            contact_id INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_contact_map_contact_id ON contact_map (contact_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_map (
+            pack_id TEXT PRIMARY KEY,
+            conversation_id INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_map_conversation_id ON conversation_map (conversation_id)")
+
+    # Notificações do MELI aguardando processamento pelo poller.
+    # A chave (topic, resource) agrupa notificações repetidas do mesmo recurso.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS meli_notifications (
+            topic TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            received_at INTEGER NOT NULL,
+            seller_id TEXT,
+            PRIMARY KEY (topic, resource)
+        )
+    ''')
+    columns = [row['name'] for row in cursor.execute("PRAGMA table_info(meli_notifications)").fetchall()]
+    if 'seller_id' not in columns:
+        cursor.execute("ALTER TABLE meli_notifications ADD COLUMN seller_id TEXT")
+
+    # Contas de vendedor do MELI atendidas, cada uma com as suas caixas de entrada no Chatwoot.
+    # Os tokens e cursores de cada vendedor ficam em 'settings' ("CHAVE:seller_id").
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sellers (
+            seller_id TEXT PRIMARY KEY,
+            nickname TEXT,
+            questions_inbox_id TEXT,
+            messages_inbox_id TEXT,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+
+    # Fila de tarefas de saída (webhook -> worker) e tarefas que esgotaram as tentativas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_run_at REAL NOT NULL,
+            locked_until REAL,
+            claim_token TEXT,
+            last_error TEXT,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_next_run_at ON jobs (next_run_at)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dead_letter_jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at INTEGER NOT NULL,
+            failed_at INTEGER NOT NULL
+        )
+    ''')
+
+    # Locks entre processos (ex.: renovação do token do MELI)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS locks (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+    # Último snapshot de métricas de cada processo (poller, workers do webhook, worker da fila)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_snapshots (
+            process TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+def initialize_db(initial_access_token=None, initial_refresh_token=None, default_seller=None):
+    """Cria ou migra as tabelas, se necessário, e popula os tokens iniciais e o vendedor padrão.
+
+    'default_seller' ({'seller_id', 'questions_inbox_id', 'messages_inbox_id'}) é o vendedor
+    configurado no .env; ele é cadastrado na tabela 'sellers' e herda os tokens e o cursor
+    de sincronização gravados antes do suporte a vários vendedores.
+    """
+    conn = get_db_connection()
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        _create_schema(conn)
+    cursor = conn.cursor()
+
+    # Popula os tokens iniciais se a tabela estiver vazia
+    cursor.execute("SELECT key FROM settings WHERE key IN ('MELI_ACCESS_TOKEN', 'MELI_REFRESH_TOKEN')")
+    existing_keys = [row['key'] for row in cursor.fetchall()]
+    
+    if 'MELI_ACCESS_TOKEN' not in existing_keys and initial_access_token:
+        print("Populando o banco de dados com o Access Token inicial.")
+        cursor.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ('MELI_ACCESS_TOKEN', initial_access_token))
+
+    if 'MELI_REFRESH_TOKEN' not in existing_keys and initial_refresh_token:
+        print("Populando o banco de dados com o Refresh Token inicial.")
+        cursor.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ('MELI_REFRESH_TOKEN', initial_refresh_token))
+
+    if default_seller and default_seller.get('seller_id'):
+        seller_id = str(default_seller['seller_id'])
+        cursor.execute('''
+            INSERT OR IGNORE INTO sellers (seller_id, questions_inbox_id, messages_inbox_id, created_at) VALUES (?, ?, ?, ?)
+        ''', (seller_id, default_seller.get('questions_inbox_id'), default_seller.get('messages_inbox_id'), int(time.time())))
+        # Tokens e cursor gravados sem vendedor (versões anteriores) passam a ser deste vendedor.
+        placeholders = ",".join("?" * len(db_manager.SELLER_SCOPED_SETTINGS))
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO settings (key, value)
+            SELECT key || ':' || ?, value FROM settings WHERE key IN ({placeholders})
+        ''', (seller_id, *db_manager.SELLER_SCOPED_SETTINGS))
+        cursor.execute("UPDATE meli_notifications SET seller_id = ? WHERE seller_id IS NULL", (seller_id,))
+
+    conn.commit()
+    conn.close()
+
+def get_setting(key):
+    """Busca um valor de configuração na tabela 'settings'."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT value FROM settings WHERE key = ?", (key,))
+    row = cursor.fetchone()
+    conn.close()
+    return row['value'] if row else None
+
+def update_setting(key, value):
+    """Atualiza ou insere um valor de configuração na tabela 'settings'."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO settings (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (key, value))
+    conn.commit()
+    conn.close()
+
+def get_settings(keys):
+    """Busca vários valores da tabela 'settings' de uma vez. Retorna {chave: valor}."""
+    keys = list(keys)
+    with _shared_lock:
+        placeholders = ",".join("?" * len(keys))
+        rows = get_shared_connection().execute(f"SELECT key, value FROM settings WHERE key IN ({placeholders})", keys).fetchall()
+    return {row['key']: row['value'] for row in rows}
+
+def update_settings(values):
+    """Grava vários valores na tabela 'settings' em uma única transação."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO settings (key, value) VALUES (?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value
+            ''', [(key, str(value)) for key, value in values.items()])
+
+# --- LOCKS ENTRE PROCESSOS ---
+def acquire_lock(name, owner, ttl_seconds):
+    """Tenta obter o lock 'name'. Um lock expirado pode ser tomado por outro dono.
+
+    Retorna True se 'owner' passou a ser (ou já era) o dono do lock.
+    """
+    now = time.time()
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            # RETURNING só devolve a linha se ela foi inserida ou tomada/renovada por 'owner'.
+            row = conn.execute('''
+                INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE locks.expires_at < ? OR locks.owner = excluded.owner
+                RETURNING owner
+            ''', (name, owner, now + ttl_seconds, now)).fetchone()
+    return row is not None
+
+def release_lock(name, owner):
+    """Libera o lock 'name' se ele ainda pertencer a 'owner'."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+def get_live_locks(prefix):
+    """Retorna {nome: dono} dos locks ainda válidos cujo nome começa com 'prefix'."""
+    with _shared_lock:
+        rows = get_shared_connection().execute(
+            "SELECT name, owner FROM locks WHERE substr(name, 1, ?) = ? AND expires_at >= ?",
+            (len(prefix), prefix, time.time())
+        ).fetchall()
+    return {row['name']: row['owner'] for row in rows}
+
+# --- VENDEDORES ---
+def get_sellers(include_disabled=False):
+    """Retorna os vendedores cadastrados (dicts), ordenados por seller_id."""
+    query = "SELECT seller_id, nickname, questions_inbox_id, messages_inbox_id, enabled FROM sellers"
+    if not include_disabled:
+        query += " WHERE enabled = 1"
+    with _shared_lock:
+        rows = get_shared_connection().execute(query + " ORDER BY seller_id").fetchall()
+    return [dict(row) for row in rows]
+
+def save_seller(seller_id, nickname=None, questions_inbox_id=None, messages_inbox_id=None, enabled=True):
+    """Cadastra ou atualiza um vendedor. Campos None mantêm o valor atual."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO sellers (seller_id, nickname, questions_inbox_id, messages_inbox_id, enabled, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(seller_id) DO UPDATE SET
+                    nickname = COALESCE(excluded.nickname, sellers.nickname),
+                    questions_inbox_id = COALESCE(excluded.questions_inbox_id, sellers.questions_inbox_id),
+                    messages_inbox_id = COALESCE(excluded.messages_inbox_id, sellers.messages_inbox_id),
+                    enabled = excluded.enabled
+            ''', (str(seller_id), nickname, questions_inbox_id, messages_inbox_id, int(bool(enabled)), int(time.time())))
+
+# --- ITENS JÁ PROCESSADOS ---
+def all_processed_ids():
+    """Retorna todos os IDs processados (usado para aquecer o índice em memória do db_manager)."""
+    with _shared_lock:
+        rows = get_shared_connection().execute("SELECT item_id FROM processed_items").fetchall()
+    return [row['item_id'] for row in rows]
+
+def find_processed(item_ids):
+    """Retorna o conjunto dos IDs da lista que já foram processados, consultando em lotes."""
+    found = set()
+    with _shared_lock:
+        conn = get_shared_connection()
+        for chunk in _chunks(list(item_ids)):
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT item_id FROM processed_items WHERE item_id IN ({placeholders})", chunk).fetchall()
+            found.update(row['item_id'] for row in rows)
+    return found
+
+def add_processed(item_ids, processed_at):
+    """Marca vários IDs como processados em uma única transação."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            # ON CONFLICT IGNORE faz com que, se o ID já existir, nada aconteça.
+            conn.executemany("INSERT OR IGNORE INTO processed_items (item_id, processed_at) VALUES (?, ?)",
+                             [(v, processed_at) for v in item_ids])
+
+def delete_processed_before(cutoff):
+    """Remove os itens processados antes de 'cutoff' (timestamp). Retorna quantos foram removidos."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            return conn.execute("DELETE FROM processed_items WHERE processed_at < ?", (cutoff,)).rowcount
+
+# --- CACHE DE ANÚNCIOS ---
+def get_cached_items(item_ids, min_fetched_at):
+    """Retorna {item_id: {'title', 'permalink', 'fetched_at'}} dos anúncios salvos após min_fetched_at."""
+    item_ids = list(dict.fromkeys(str(i) for i in item_ids))
+    items = {}
+    with _shared_lock:
+        conn = get_shared_connection()
+        for chunk in _chunks(item_ids):
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT item_id, title, permalink, fetched_at FROM item_cache WHERE item_id IN ({placeholders}) AND fetched_at >= ?",
+                chunk + [min_fetched_at]
+            ).fetchall()
+            for row in rows:
+                items[row['item_id']] = {"title": row['title'], "permalink": row['permalink'], "fetched_at": row['fetched_at']}
+    return items
+
+def save_cached_items(items, fetched_at):
+    """Grava (ou atualiza) vários anúncios no cache em uma única transação."""
+    if not items:
+        return
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.executemany('''
+                INSERT INTO item_cache (item_id, title, permalink, fetched_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(item_id) DO UPDATE SET title = excluded.title, permalink = excluded.permalink, fetched_at = excluded.fetched_at
+            ''', [(str(item_id), info.get('title'), info.get('permalink'), fetched_at) for item_id, info in items.items()])
+
+# --- FILA DE NOTIFICAÇÕES DO MELI ---
+def enqueue_notification(topic, resource, seller_id):
+    """Enfileira um recurso notificado pelo MELI. Notificações repetidas são agrupadas."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO meli_notifications (topic, resource, received_at, seller_id) VALUES (?, ?, ?, ?)",
+                (topic, resource, int(time.time()), str(seller_id))
+            )
+
+def pop_notifications(seller_ids, limit=100):
+    """Retira da fila (e retorna) até 'limit' notificações dos vendedores informados.
+
+    Retorna tuplas (topic, resource, seller_id), das mais antigas para as mais novas.
+    """
+    seller_ids = [str(s) for s in seller_ids]
+    if not seller_ids:
+        return []
+    placeholders = ",".join("?" * len(seller_ids))
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            rows = conn.execute(
+                f"SELECT topic, resource, seller_id FROM meli_notifications WHERE seller_id IN ({placeholders}) ORDER BY received_at LIMIT ?",
+                (*seller_ids, limit)
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM meli_notifications WHERE topic = ? AND resource = ?",
+                [(row['topic'], row['resource']) for row in rows]
+            )
+    return [(row['topic'], row['resource'], row['seller_id']) for row in rows]
+
+# --- FILA DE TAREFAS ---
+def enqueue_job(kind, payload, idempotency_key=None):
+    """Grava uma tarefa na fila. Retorna False se já existir uma com a mesma idempotency_key."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO jobs (kind, payload, idempotency_key, next_run_at, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (kind, json.dumps(payload), idempotency_key, time.time(), int(time.time())))
+        return cursor.rowcount > 0
+
+def claim_jobs(limit, lease_seconds):
+    """Reserva até 'limit' tarefas prontas para execução e as retorna em ordem de criação.
+
+    A reserva é feita em um único UPDATE, então dois workers nunca recebem a mesma tarefa.
+    Tarefas cuja reserva expirou (worker interrompido) voltam a ficar disponíveis. Uma tarefa
+    de um pack espera enquanto houver uma tarefa mais antiga do mesmo pack reservada ou
+    aguardando nova tentativa, para que as mensagens cheguem ao comprador na ordem.
+    """
+    now = time.time()
+    token = uuid.uuid4().hex
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute('''
+                UPDATE jobs SET locked_until = ?, claim_token = ?
+                WHERE id IN (
+                    SELECT id FROM jobs AS job
+                    WHERE next_run_at <= ? AND (locked_until IS NULL OR locked_until < ?)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM jobs AS older
+                        WHERE older.id < job.id
+                        AND json_extract(older.payload, '$.pack_id') = json_extract(job.payload, '$.pack_id')
+                        AND (older.next_run_at > ? OR older.locked_until >= ?)
+                    )
+                    ORDER BY id LIMIT ?
+                )
+            ''', (now + lease_seconds, token, now, now, now, now, limit))
+            rows = conn.execute(
+                "SELECT id, kind, payload, idempotency_key, attempts FROM jobs WHERE claim_token = ? ORDER BY id", (token,)
+            ).fetchall()
+    return [
+        {"id": row['id'], "kind": row['kind'], "payload": json.loads(row['payload']),
+         "idempotency_key": row['idempotency_key'], "attempts": row['attempts']}
+        for row in rows
+    ]
+
+def complete_job(job_id):
+    """Remove da fila uma tarefa concluída."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+def release_job(job_id):
+    """Devolve à fila uma tarefa reservada que não foi executada, sem contar uma tentativa."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("UPDATE jobs SET locked_until = NULL, claim_token = NULL WHERE id = ?", (job_id,))
+
+def fail_job(job_id, error, max_attempts, backoff_seconds):
+    """Registra uma falha: reagenda com backoff exponencial ou move para a dead letter.
+
+    Retorna True se a tarefa foi para a dead letter.
+    """
+    now = time.time()
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            attempts = row['attempts'] + 1
+            if attempts >= max_attempts:
+                conn.execute('''
+                    INSERT OR REPLACE INTO dead_letter_jobs
+                    (id, kind, payload, idempotency_key, attempts, last_error, created_at, failed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (row['id'], row['kind'], row['payload'], row['idempotency_key'], attempts, str(error), row['created_at'], int(now)))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                return True
+            conn.execute('''
+                UPDATE jobs SET attempts = ?, last_error = ?, next_run_at = ?, locked_until = NULL, claim_token = NULL
+                WHERE id = ?
+            ''', (attempts, str(error), now + backoff_seconds * (2 ** (attempts - 1)), job_id))
+            return False
+
+def count_jobs():
+    """Retorna o tamanho da fila e da dead letter."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        pending = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        dead = conn.execute("SELECT COUNT(*) FROM dead_letter_jobs").fetchone()[0]
+    return {"pending": pending, "dead_letter": dead}
+
+# --- MÉTRICAS ---
+def save_metrics_snapshot(process, payload):
+    """Grava (substituindo) o snapshot de métricas de um processo."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO metrics_snapshots (process, payload, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(process) DO UPDATE SET payload = excluded.payload, updated_at = excluded.updated_at
+            ''', (process, payload, int(time.time())))
+
+def get_metrics_snapshots(max_age_seconds):
+    """Retorna [(processo, payload)] dos snapshots atualizados nos últimos max_age_seconds.
+
+    Snapshots mais antigos (ex.: workers do gunicorn que já foram reciclados) são removidos.
+    """
+    cutoff = int(time.time() - max_age_seconds)
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("DELETE FROM metrics_snapshots WHERE updated_at < ?", (cutoff,))
+        rows = conn.execute("SELECT process, payload FROM metrics_snapshots ORDER BY process").fetchall()
+    return [(row['process'], row['payload']) for row in rows]
+
+# --- MAPEAMENTOS MELI -> CHATWOOT ---
+def get_contact_id(meli_user_id):
+    """Retorna o contact_id do Chatwoot já associado a um usuário do MELI, ou None."""
+    with _shared_lock:
+        row = get_shared_connection().execute("SELECT contact_id FROM contact_map WHERE meli_user_id = ?", (str(meli_user_id),)).fetchone()
+    return row['contact_id'] if row else None
+
+def save_contact_id(meli_user_id, contact_id):
+    """Associa um usuário do MELI a um contato do Chatwoot."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO contact_map (meli_user_id, contact_id, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(meli_user_id) DO UPDATE SET contact_id = excluded.contact_id, updated_at = excluded.updated_at
+            ''', (str(meli_user_id), contact_id, int(time.time())))
+
+def forget_contact(contact_id):
+    """Remove os mapeamentos que apontam para um contato que não existe mais no Chatwoot."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("DELETE FROM contact_map WHERE contact_id = ?", (contact_id,))
+
+def get_conversation_id(pack_id):
+    """Retorna o conversation_id do Chatwoot já associado a um pack, ou None."""
+    with _shared_lock:
+        row = get_shared_connection().execute("SELECT conversation_id FROM conversation_map WHERE pack_id = ?", (str(pack_id),)).fetchone()
+    return row['conversation_id'] if row else None
+
+def save_conversation_id(pack_id, conversation_id):
+    """Associa um pack do MELI a uma conversa do Chatwoot."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute('''
+                INSERT INTO conversation_map (pack_id, conversation_id, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(pack_id) DO UPDATE SET conversation_id = excluded.conversation_id, updated_at = excluded.updated_at
+            ''', (str(pack_id), conversation_id, int(time.time())))
+
+def forget_conversation(conversation_id):
+    """Remove os mapeamentos que apontam para uma conversa que não existe mais no Chatwoot."""
+    with _shared_lock:
+        conn = get_shared_connection()
+        with conn:
+            conn.execute("DELETE FROM conversation_map WHERE conversation_id = ?", (conversation_id,))
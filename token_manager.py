@@ -0,0 +1,142 @@
+# token_manager.py
+import os
+import time
+import threading
+import config
+import db_manager
+import http_client
+import metrics
+import sellers
+
+# --- Chaves na tabela 'settings' (uma por vendedor: "CHAVE:seller_id") ---
+ACCESS_TOKEN_KEY = 'MELI_ACCESS_TOKEN'
+REFRESH_TOKEN_KEY = 'MELI_REFRESH_TOKEN'
+EXPIRES_AT_KEY = 'MELI_TOKEN_EXPIRES_AT'
+VERSION_KEY = 'MELI_TOKEN_VERSION'
+REFRESH_LOCK = 'meli_token_refresh'
+# Tempo máximo de uma renovação; depois disso o lock pode ser tomado por outro processo.
+REFRESH_LOCK_TTL_SECONDS = 30
+
+# --- Cópia local do token de cada vendedor (por processo) ---
+_states = {}
+_refresh_locks = {}
+_state_lock = threading.Lock()
+
+def _owner():
+    return f"{os.getpid()}-{threading.get_ident()}"
+
+def _state(seller):
+    with _state_lock:
+        if seller.seller_id not in _states:
+            _states[seller.seller_id] = {"access_token": None, "refresh_token": None, "expires_at": None, "version": None, "checked_at": 0.0}
+            _refresh_locks[seller.seller_id] = threading.Lock()
+        return _states[seller.seller_id]
+
+def _load(seller):
+    """Relê do DB o token atual do vendedor e a sua versão."""
+    keys = {key: seller.setting_key(key) for key in (ACCESS_TOKEN_KEY, REFRESH_TOKEN_KEY, EXPIRES_AT_KEY, VERSION_KEY)}
+    values = db_manager.get_settings(keys.values())
+    state = _state(seller)
+    with _state_lock:
+        state["access_token"] = values.get(keys[ACCESS_TOKEN_KEY])
+        state["refresh_token"] = values.get(keys[REFRESH_TOKEN_KEY])
+        state["expires_at"] = float(values[keys[EXPIRES_AT_KEY]]) if values.get(keys[EXPIRES_AT_KEY]) else None
+        state["version"] = int(values.get(keys[VERSION_KEY]) or 0)
+        state["checked_at"] = time.time()
+    return state
+
+def _needs_refresh(state):
+    expires_at = state["expires_at"]
+    # Tokens vindos do .env não têm validade conhecida; esses só são renovados após um 401.
+    return expires_at is not None and expires_at - time.time() < config.MELI_TOKEN_REFRESH_MARGIN_SECONDS
+
+def get_access_token(seller=None):
+    """Retorna o access token atual do vendedor (padrão: o atual), renovando-o pouco antes de expirar.
+
+    A versão salva no DB é conferida a cada MELI_TOKEN_CHECK_SECONDS, então um token
+    renovado por outro processo é adotado sem esperar por um 401.
+    """
+    seller = seller or sellers.current()
+    state = _state(seller)
+    if state["access_token"] is None or time.time() - state["checked_at"] > config.MELI_TOKEN_CHECK_SECONDS:
+        state = _load(seller)
+    if _needs_refresh(state):
+        refresh(seller=seller)
+    return state["access_token"]
+
+def _request_new_tokens(refresh_token):
+    """Usa o refresh_token para obter um novo par de tokens no MELI."""
+    payload = {
+        'grant_type': 'refresh_token',
+        'client_id': config.MELI_APP_ID,
+        'client_secret': config.MELI_SECRET_KEY,
+        'refresh_token': refresh_token
+    }
+    headers = {'accept': 'application/json', 'content-type': 'application/x-www-form-urlencoded'}
+    response = http_client.meli.post(f"{config.MELI_API_URL}/oauth/token", headers=headers, data=payload, timeout=15)
+    response.raise_for_status()
+    return response.json()
+
+def _is_current(state, stale_token):
+    """Indica se ainda não há um token mais novo que stale_token (ou que o vencido)."""
+    if stale_token is not None:
+        return state["access_token"] == stale_token
+    return _needs_refresh(state)
+
+def refresh(stale_token=None, seller=None):
+    """Renova o token uma única vez, mesmo com várias threads e processos pedindo ao mesmo tempo.
+
+    'stale_token' é o token recusado pelo MELI (401). Se outro processo já o substituiu,
+    nada é feito além de adotar o novo token. Cada vendedor tem o seu próprio lock.
+    """
+    seller = seller or sellers.current()
+    reason = 'unauthorized' if stale_token is not None else 'expiring'
+    _state(seller)
+    lock_name = f"{REFRESH_LOCK}:{seller.seller_id}"
+    with _refresh_locks[seller.seller_id]:
+        state = _load(seller)
+        if not _is_current(state, stale_token):
+            return state["access_token"]
+
+        owner = _owner()
+        deadline = time.time() + REFRESH_LOCK_TTL_SECONDS
+        while not db_manager.acquire_lock(lock_name, owner, REFRESH_LOCK_TTL_SECONDS):
+            # Outro processo está renovando: espera a nova versão aparecer no DB.
+            time.sleep(0.5)
+            state = _load(seller)
+            if not _is_current(state, stale_token):
+                return state["access_token"]
+            if time.time() > deadline:
+                raise TimeoutError("Tempo esgotado aguardando a renovação do token por outro processo.")
+
+        try:
+            # Confere de novo: a renovação pode ter terminado entre a leitura e o lock.
+            state = _load(seller)
+            if not _is_current(state, stale_token):
+                return state["access_token"]
+            print(f"Token de acesso do vendedor {seller.seller_id} expirado. Tentando renovar...")
+            try:
+                new_tokens = _request_new_tokens(state["refresh_token"])
+            except Exception:
+                metrics.inc("meli_token_refresh_total", reason=reason, result="error")
+                raise
+            state = store_tokens(new_tokens['access_token'], new_tokens['refresh_token'], new_tokens.get('expires_in'), seller=seller)
+            print("Tokens atualizados com sucesso.")
+            metrics.inc("meli_token_refresh_total", reason=reason, result="refreshed")
+            return state["access_token"]
+        finally:
+            db_manager.release_lock(lock_name, owner)
+
+def store_tokens(access_token, refresh_token, expires_in=None, seller=None):
+    """Grava um novo par de tokens do vendedor e incrementa a versão, em uma única transação."""
+    seller = seller or sellers.current()
+    version = db_manager.get_settings([seller.setting_key(VERSION_KEY)]).get(seller.setting_key(VERSION_KEY))
+    values = {
+        seller.setting_key(ACCESS_TOKEN_KEY): access_token,
+        seller.setting_key(REFRESH_TOKEN_KEY): refresh_token,
+        seller.setting_key(VERSION_KEY): int(version or 0) + 1,
+    }
+    # Sem expires_in a validade fica desconhecida e apenas um 401 dispara a renovação.
+    values[seller.setting_key(EXPIRES_AT_KEY)] = time.time() + int(expires_in) if expires_in else ''
+    db_manager.update_settings(values)
+    return _load(seller)
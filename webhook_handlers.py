@@ -0,0 +1,175 @@
+# webhook_handlers.py
+"""Regras dos webhooks, compartilhadas pelo servidor Flask (webhook_server) e pelo ASGI (asgi_server).
+
+Cada função recebe o corpo bruto e os cabeçalhos já extraídos e retorna (resposta, status),
+então nenhuma depende do framework que recebeu a requisição.
+"""
+import json
+import hmac
+import time
+import hashlib
+import config
+import db_manager # Importa o gerenciador de banco de dados
+import sellers
+
+SIGNATURE_HEADER = 'X-Chatwoot-Signature'
+TIMESTAMP_HEADER = 'X-Chatwoot-Timestamp'
+# Assinaturas com timestamp mais antigo que isso são recusadas (evita reenvio de requisições capturadas).
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+# Tópicos do MELI que o poller sabe processar
+MELI_NOTIFICATION_TOPICS = {'questions', 'messages', 'orders_v2'}
+
+def verify_signature(payload_body, signature_header, timestamp=None):
+    """Verifica a assinatura HMAC para garantir que a requisição veio do Chatwoot.
+
+    Com timestamp (cabeçalho X-Chatwoot-Timestamp), a assinatura cobre "{timestamp}.{corpo}".
+    """
+    if not signature_header or not payload_body:
+        return False
+    secret = config.CHATWOOT_WEBHOOK_SECRET.encode('utf-8')
+    signature = signature_header.replace('sha256=', '')
+    message = f"{timestamp}.".encode('utf-8') + payload_body if timestamp else payload_body
+    digest = hmac.new(secret, msg=message, digestmod=hashlib.sha256).hexdigest()
+    return hmac.compare_digest(digest, signature)
+
+class WebhookSecretMissing(RuntimeError):
+    """CHATWOOT_WEBHOOK_SECRET não configurado e WEBHOOK_ALLOW_UNSIGNED desligado."""
+
+def signature_required():
+    """A assinatura só deixa de ser exigida sem segredo e com WEBHOOK_ALLOW_UNSIGNED=true."""
+    return bool(config.CHATWOOT_WEBHOOK_SECRET) or not config.WEBHOOK_ALLOW_UNSIGNED
+
+def startup():
+    """Prepara o processo do webhook (gunicorn, ASGI ou execução direta) antes de aceitar requisições.
+
+    Sem CHATWOOT_WEBHOOK_SECRET qualquer um que alcance /webhook enviaria mensagens aos
+    compradores em nome do vendedor, então o servidor não inicia (exceto com WEBHOOK_ALLOW_UNSIGNED=true).
+    """
+    if not config.CHATWOOT_WEBHOOK_SECRET:
+        if not config.WEBHOOK_ALLOW_UNSIGNED:
+            raise WebhookSecretMissing(
+                "CHATWOOT_WEBHOOK_SECRET não configurado. Configure o segredo do webhook do Chatwoot "
+                "ou, apenas em desenvolvimento local, defina WEBHOOK_ALLOW_UNSIGNED=true."
+            )
+        print("AVISO: WEBHOOK_ALLOW_UNSIGNED=true; a assinatura dos webhooks não será verificada.")
+    config.startup()
+
+def check_signature(payload_body, signature_header, timestamp=None):
+    """Aplica a verificação HMAC; sem segredo, só aceita a requisição com WEBHOOK_ALLOW_UNSIGNED=true."""
+    if not signature_required():
+        return True
+    if not config.CHATWOOT_WEBHOOK_SECRET:
+        return False
+    if timestamp:
+        try:
+            if abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE_SECONDS:
+                return False
+        except ValueError:
+            return False
+    return verify_signature(payload_body, signature_header, timestamp)
+
+def is_relevant_chatwoot_event(payload_body):
+    """Descarta, sem decodificar o JSON, eventos que nunca geram envio ao MELI.
+
+    Só 'message_created' de mensagens 'outgoing' interessa; como o Chatwoot envia esses
+    valores literalmente no corpo, basta procurar os bytes antes de fazer o parse completo.
+    """
+    return b'"message_created"' in payload_body and b'"outgoing"' in payload_body
+
+def parse_json(payload_body):
+    try:
+        payload = json.loads(payload_body)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def handle_chatwoot_event(payload):
+    """Enfileira as respostas dos agentes para o job_worker enviar ao MELI."""
+    # Notas privadas também chegam como 'outgoing', mas não devem ir para o cliente.
+    if payload.get('event') == 'message_created' and payload.get('message_type') == 'outgoing' and not payload.get('private'):
+        print("Recebida resposta de um agente no Chatwoot...")
+        content = payload.get('content')
+        custom_attributes = payload.get('conversation', {}).get('custom_attributes', {})
+        # Conversas criadas antes do suporte a vários vendedores não têm o atributo: vale o vendedor padrão.
+        seller_id = custom_attributes.get('meli_seller_id')
+
+        # --- Lógica para Respostas de Perguntas de Anúncio ---
+        if 'meli_question_id' in custom_attributes and content and content.strip():
+            question_id = custom_attributes['meli_question_id']
+
+            # --- LÓGICA ATUALIZADA: Verifica no DB se a pergunta já foi respondida ---
+            # Usamos um prefixo 'answered-' para diferenciar dos IDs de perguntas recebidas
+            if db_manager.is_item_processed(f"answered-{question_id}"):
+                print(f"AVISO: A pergunta {question_id} já foi respondida. Ignorando nova mensagem.")
+                return {'status': 'already_answered'}, 200
+
+            # O envio ao MELI é feito pelo job_worker; a mesma chave 'answered-' evita respostas duplicadas.
+            queued = db_manager.enqueue_job(
+                'answer_question', {'question_id': question_id, 'text': content, 'seller_id': seller_id},
+                idempotency_key=f"answered-{question_id}"
+            )
+            if not queued:
+                print(f"AVISO: A resposta da pergunta {question_id} já está na fila. Ignorando nova mensagem.")
+                return {'status': 'already_queued'}, 200
+            print(f"Resposta para a pergunta do MELI ID {question_id} enfileirada.")
+            return {'status': 'queued'}, 200
+
+        # --- Lógica para Respostas do Chat Pós-Venda ---
+        elif 'meli_pack_id' in custom_attributes:
+            pack_id = custom_attributes['meli_pack_id']
+            message_id = payload.get('id')
+            attachments = [a for a in payload.get('attachments') or [] if a.get('data_url')]
+            if attachments and message_id:
+                # Cada anexo vira uma tarefa; o texto do agente acompanha o primeiro.
+                for index, attachment in enumerate(attachments):
+                    filename = attachment.get('file_name') or attachment['data_url'].rsplit('/', 1)[-1].split('?')[0]
+                    db_manager.enqueue_job(
+                        'post_sale_attachment',
+                        {'pack_id': pack_id, 'data_url': attachment['data_url'], 'filename': filename,
+                         'text': content if index == 0 else None, 'seller_id': seller_id},
+                        idempotency_key=f"sent-{message_id}-{index}"
+                    )
+                print(f"{len(attachments)} anexo(s) para o pack {pack_id} enfileirado(s).")
+                return {'status': 'queued'}, 200
+            if content and content.strip() and message_id:
+                db_manager.enqueue_job(
+                    'post_sale_message', {'pack_id': pack_id, 'text': content, 'seller_id': seller_id},
+                    idempotency_key=f"sent-{message_id}"
+                )
+                print(f"Mensagem para o pack {pack_id} enfileirada.")
+                return {'status': 'queued'}, 200
+
+    return {'status': 'success'}, 200
+
+def chatwoot_webhook(payload_body, signature_header=None, timestamp=None):
+    """Fluxo completo de /webhook: filtro rápido, assinatura, parse e enfileiramento."""
+    if not is_relevant_chatwoot_event(payload_body):
+        return {'status': 'ignored'}, 200
+    if not check_signature(payload_body, signature_header, timestamp):
+        return {'status': 'invalid_signature'}, 401
+    payload = parse_json(payload_body)
+    if payload is None:
+        return {'status': 'invalid_payload'}, 400
+    return handle_chatwoot_event(payload)
+
+def meli_notification(payload_body):
+    """Enfileira uma notificação do MELI para o poller.
+
+    O MELI exige resposta rápida (HTTP 200) e reenvia notificações não confirmadas,
+    por isso aqui nada é buscado na API: o recurso só é registrado na fila.
+    """
+    payload = parse_json(payload_body) or {}
+    topic, resource = payload.get('topic'), payload.get('resource')
+
+    if topic not in MELI_NOTIFICATION_TOPICS or not resource:
+        return {'status': 'ignored'}, 200
+    # Notificações de contas não cadastradas ou de outra aplicação são confirmadas, mas descartadas.
+    seller = sellers.get(payload.get('user_id')) if payload.get('user_id') else None
+    if seller is None:
+        return {'status': 'ignored'}, 200
+    if config.MELI_APP_ID and payload.get('application_id') and str(payload.get('application_id')) != str(config.MELI_APP_ID):
+        return {'status': 'ignored'}, 200
+
+    db_manager.enqueue_notification(topic, str(resource), seller.seller_id)
+    return {'status': 'queued'}, 200
@@ -1,61 +1,44 @@
 # webhook_server.py
-import json
-import hmac
-import hashlib
-import requests
 import time
-from flask import Flask, request, abort
-import config
-import mercado_livre_api
-import db_manager # Importa o gerenciador de banco de dados
+from flask import Flask, request, g
+import metrics
+import webhook_handlers
 
 app = Flask(__name__)
+# Cada worker do gunicorn mantém as próprias métricas; o PID diferencia os snapshots.
+metrics.set_process_name("webhook", per_pid=True)
 
-def verify_signature(payload_body, signature_header):
-    """Verifica a assinatura HMAC para garantir que a requisição veio do Chatwoot."""
-    if not signature_header or not payload_body:
-        return False
-    secret = config.CHATWOOT_WEBHOOK_SECRET.encode('utf-8')
-    signature = signature_header.replace('sha256=', '')
-    digest = hmac.new(secret, msg=payload_body, digestmod=hashlib.sha256).hexdigest()
-    return hmac.compare_digest(digest, signature)
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe("webhook_request_seconds", time.perf_counter() - g.request_started,
+                    route=route, status=response.status_code)
+    metrics.push()
+    return response
 
 @app.route('/webhook', methods=['POST'])
 def chatwoot_webhook():
-    # --- Bloco de verificação de segurança (desabilitado temporariamente) ---
-    # ...
-
-    payload = request.json
-    
-    if payload.get('event') == 'message_created' and payload.get('message_type') == 'outgoing':
-        print("Recebida resposta de um agente no Chatwoot...")
-        content = payload.get('content')
-        custom_attributes = payload.get('conversation', {}).get('custom_attributes', {})
-        
-        # --- Lógica para Respostas de Perguntas de Anúncio ---
-        if 'meli_question_id' in custom_attributes and content and content.strip():
-            question_id = custom_attributes['meli_question_id']
-            
-            # --- LÓGICA ATUALIZADA: Verifica no DB se a pergunta já foi respondida ---
-            # Usamos um prefixo 'answered-' para diferenciar dos IDs de perguntas recebidas
-            if db_manager.is_item_processed(f"answered-{question_id}"):
-                print(f"AVISO: A pergunta {question_id} já foi respondida. Ignorando nova mensagem.")
-                return {'status': 'already_answered'}, 200
+    return webhook_handlers.chatwoot_webhook(
+        request.get_data(),
+        request.headers.get(webhook_handlers.SIGNATURE_HEADER),
+        request.headers.get(webhook_handlers.TIMESTAMP_HEADER)
+    )
 
-            print(f"Enviando resposta para a pergunta do MELI ID: {question_id}")
-            try:
-                mercado_livre_api.answer_question(question_id, content)
-                # --- LÓGICA ATUALIZADA: Marca a pergunta como respondida no DB ---
-                db_manager.mark_item_as_processed(f"answered-{question_id}")
-            except Exception as e:
-                print(f"ERRO ao responder pergunta {question_id}: {e}")
-        
-        # --- Lógica para Respostas do Chat Pós-Venda (permanece a mesma) ---
-        elif 'meli_pack_id' in custom_attributes:
-            # ... (código omitido para brevidade, mas permanece o mesmo)
-            pass
+@app.route('/meli/notifications', methods=['POST'])
+def meli_notifications():
+    """Recebe notificações do MELI e as enfileira para o poller."""
+    return webhook_handlers.meli_notification(request.get_data())
 
-    return {'status': 'success'}, 200
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Exporta no formato do Prometheus as métricas do webhook, do poller e do worker."""
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 if __name__ == '__main__':
+    # Com o gunicorn, o backend de estado é preparado pelo processo mestre (gunicorn.conf.py).
+    webhook_handlers.startup()
     app.run(port=5000, debug=False)